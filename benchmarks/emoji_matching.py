@@ -0,0 +1,121 @@
+"""Compare ``EmojiMatcher`` with ``demoji``: exact parity first, then speed.
+
+Usage: python -m benchmarks.emoji_matching [messages]
+"""
+
+from __future__ import annotations
+
+import random
+import sys
+import timeit
+
+from typing import Callable
+
+import demoji
+
+from src.emoji_matcher import EmojiMatcher
+
+__all__ = (
+    "make_corpus",
+    "check_parity",
+    "main",
+)
+
+PLAIN_MESSAGES = [
+    "ok",
+    "see you tomorrow at 8",
+    "did anyone push the fix? the build is still red",
+    "haha no way",
+    "kto idzie na obiad? o 13 w tym samym miejscu",
+    "zażółć gęślą jaźń",
+    "привет, как дела?",
+    "https://example.com/some/long/path?with=query&and=more",
+    "I'll be 5 min late, sorry",
+    "#general is the right channel for that * not here",
+    "© 2023, all rights reserved ® ™",
+]
+WORDS = ["lol", "nice", "xD", "+1", "wow", "thanks", "ok", "nope", "gg"]
+MODIFIERS = ["\U0001f3fb", "\U0001f3fc", "\U0001f3fd", "\U0001f3fe", "\U0001f3ff"]
+JOINERS = ["‍", "️", "⃣"]
+
+
+def make_corpus(codes: list[str], size: int, seed: int = 0) -> dict[str, list[str]]:
+    """Chat-like messages: mostly plain text, then reactions and odd sequences."""
+    rng = random.Random(seed)
+    common = codes[:200]  # demoji lists the codes roughly by popularity
+
+    def reaction() -> str:
+        return "".join(rng.choice(common) for _ in range(rng.randint(1, 3)))
+
+    def mixed() -> str:
+        parts = [rng.choice(PLAIN_MESSAGES), rng.choice(WORDS), reaction()]
+        rng.shuffle(parts)
+        return " ".join(parts)
+
+    def broken() -> str:
+        # prefixes of codes, stray modifiers and joiners between emojis
+        code = rng.choice(codes)
+        pieces = [
+            code[: rng.randint(1, len(code))],
+            rng.choice(MODIFIERS + JOINERS),
+            rng.choice(codes),
+            rng.choice(JOINERS),
+        ]
+        rng.shuffle(pieces)
+        return "".join(pieces)
+
+    return {
+        "plain": [rng.choice(PLAIN_MESSAGES) for _ in range(size)],
+        "reactions": [reaction() for _ in range(size)],
+        "mixed": [mixed() for _ in range(size)],
+        "broken": [broken() for _ in range(size)],
+        # every code alone and glued to its neighbours
+        "all codes": codes + ["".join(codes[i : i + 3]) for i in range(len(codes))],
+    }
+
+
+def check_parity(matcher: EmojiMatcher, texts: list[str]) -> list[str]:
+    """The texts for which the matcher and demoji disagree."""
+    return [
+        text
+        for text in texts
+        if matcher.findall(text) != demoji.findall_list(text, desc=False)
+        or matcher.replace(text) != demoji.replace(text)
+    ]
+
+
+def _time_per_message(fn: Callable[[str], object], texts: list[str]) -> float:
+    runs = timeit.repeat(lambda: [fn(t) for t in texts], number=1, repeat=3)
+    return min(runs) / len(texts) * 10**6
+
+
+def main() -> int:
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    matcher = EmojiMatcher.from_demoji()
+    demoji.set_emoji_pattern()
+    codes = list(demoji._CODE_TO_DESC)
+    corpus = make_corpus(codes, size)
+
+    failed = False
+    for name, texts in corpus.items():
+        mismatches = check_parity(matcher, texts)
+        if mismatches:
+            failed = True
+            print(f"{name}: {len(mismatches)} mismatches, e.g. {mismatches[:3]!r}")
+    if failed:
+        return 1
+
+    print(f"{'corpus':<10} {'demoji us':>10} {'split us':>10} {'speedup':>8}")
+    for name, texts in corpus.items():
+        # the handlers need both the emojis and the residual text
+        baseline = _time_per_message(
+            lambda t: (demoji.findall_list(t, desc=False), demoji.replace(t)), texts
+        )
+        ours = _time_per_message(matcher.split, texts)
+        print(f"{name:<10} {baseline:>10.2f} {ours:>10.2f} {baseline / ours:>7.1f}x")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""Measure the startup of the bot, up to the reply to its first reaction.
+
+Every run is a fresh interpreter. The first one starts without the database
+and the cached emoji table, the following ones reuse them.
+
+Usage: python -m benchmarks.startup [runs]
+"""
+
+from __future__ import annotations
+
+import asyncio
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+from typing import Any
+
+__all__ = ("main",)
+
+CHILD_FLAG = "--child"
+CACHE_FILENAME = "emoji_trie.cache"
+
+
+class RecordingBot:
+    """Stands in for ``telegram.Bot``, returns the sent messages right away."""
+
+    sent: list[Any]
+
+    def __init__(self) -> None:
+        self.sent = []
+
+    async def send_message(
+        self, chat_id: int, text: str, reply_to_message_id: int, **kwargs: Any
+    ) -> Any:
+        from telegram import Chat, Message, User
+
+        msg = Message(
+            1000 + len(self.sent),
+            datetime.datetime.now(),
+            Chat(chat_id, "group"),
+            from_user=User(2, "bot", True),
+            text=text,
+            reply_to_message=Message(
+                reply_to_message_id, datetime.datetime.now(), Chat(chat_id, "group")
+            ),
+        )
+        self.sent.append(msg)
+        return msg
+
+    async def edit_message_text(self, *args: Any, **kwargs: Any) -> None:
+        pass
+
+    async def edit_message_reply_markup(self, *args: Any, **kwargs: Any) -> None:
+        pass
+
+
+async def _first_update() -> None:
+    from telegram import Chat, Message, Update, User
+
+    from src.handlers.messages_and_reactions import handler_receive_message
+    from src.reaction_state import get_reaction_states
+    from src.render_scheduler import get_render_scheduler
+    from src.storage import get_store
+
+    bot = RecordingBot()
+    context = types.SimpleNamespace(bot=bot)
+    # the database is reused between the runs, a new chat starts with no reactions
+    chat = Chat(-os.getpid(), "group")
+    user = User(1, "user", False, username="user")
+    parent = Message(1, datetime.datetime.now(), chat, from_user=user, text="hello")
+    # two emojis, a single character would skip the emoji matcher
+    reaction = Message(
+        2,
+        datetime.datetime.now(),
+        chat,
+        from_user=user,
+        text="👍❤️",
+        reply_to_message=parent,
+    )
+
+    await handler_receive_message(Update(1, message=parent), context)  # type: ignore
+    await handler_receive_message(Update(2, message=reaction), context)  # type: ignore
+    await get_render_scheduler().close()
+    assert len(bot.sent) == 1
+
+    await get_reaction_states().close()
+    await get_store().close()
+
+
+def _child(workdir: str) -> None:
+    start = time.perf_counter()
+    timings = {}
+
+    import main  # noqa: F401
+
+    timings["import"] = time.perf_counter() - start
+
+    from src import constants
+    from src.settings import configure_settings
+
+    constants.DB_FILENAME = os.path.join(workdir, "bench.db")
+    constants.EMOJI_CACHE_FILENAME = os.path.join(workdir, CACHE_FILENAME)
+
+    phase = time.perf_counter()
+    configure_settings(os.path.join(workdir, "conf.json"))
+    timings["settings"] = time.perf_counter() - phase
+
+    phase = time.perf_counter()
+    asyncio.run(_first_update())
+    timings["first update"] = time.perf_counter() - phase
+
+    print(json.dumps(timings))
+
+
+def _run_child(workdir: str) -> dict[str, float]:
+    start = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup", CHILD_FLAG, workdir],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    timings: dict[str, float] = json.loads(out.splitlines()[-1])
+    timings["total"] = time.perf_counter() - start
+    return timings
+
+
+def main() -> int:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    interpreter = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, "conf.json"), "w") as f:
+            json.dump(
+                {
+                    "token": "0:startup-benchmark",
+                    "log_file": os.path.join(workdir, "bot.log"),
+                    "reaction_edit_delay": 0,
+                },
+                f,
+            )
+        cache = os.path.join(workdir, CACHE_FILENAME)
+        results = []
+        for i in range(runs):
+            # only the first run builds the emoji table, the others load it
+            if os.path.exists(cache) != (i > 0):
+                raise RuntimeError(f"Unexpected emoji cache state before run {i}")
+            results.append(_run_child(workdir))
+
+    print(f"interpreter alone: {interpreter * 1000:.1f} ms")
+    print(f"{'run':<6} " + " ".join(f"{phase:>13}" for phase in results[0]))
+    for i, timings in enumerate(results):
+        name = "cold" if i == 0 else f"warm{i}"
+        print(
+            f"{name:<6} " + " ".join(f"{t * 1000:>10.1f} ms" for t in timings.values())
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == CHILD_FLAG:
+        _child(sys.argv[2])
+    else:
+        sys.exit(main())
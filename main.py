@@ -1,40 +1,172 @@
 from telegram.ext import (
-    AIORateLimiter,
     Application,
+    CallbackContext,
     CallbackQueryHandler,
     CommandHandler,
     MessageHandler,
     filters,
 )
 
-from src import constants
-from src.handlers.commands import COMMANDS
+from src import constants, db
+from src.deletion_queue import deletion_job, get_deletion_queue
+from src.handlers.commands import COMMANDS, PUBLIC_COMMANDS
 from src.handlers.messages_and_reactions import (
     handler_button_callback,
     handler_receive_message,
     handler_save_msg_to_db,
 )
+from src.logger import get_logger, stop_logging
+from src.metrics import (
+    CallbackMetric,
+    MeasuredRateLimiter,
+    start_metrics_server,
+    stop_metrics_server,
+)
+from src.reaction_state import get_reaction_states
+from src.render_scheduler import get_render_scheduler
+from src.result_cache import get_result_cache
+from src.retention import retention_job
 from src.settings import configure_settings, get_settings
+from src.storage import get_store
+from src.storage.sqlite import SQLiteStore
+from src.timings import get_step_timings
 
 
 async def post_init_set_bot_commands(application: Application) -> None:
     await application.bot.set_my_commands(
-        [(command.name(), command.description) for command in COMMANDS]
+        [(command.name(), command.description) for command in PUBLIC_COMMANDS]
+    )
+
+
+def register_metrics() -> None:
+    """The queue depths and the handler steps, read when the metrics are scraped."""
+    CallbackMetric(
+        "bot_deletion_queue_depth",
+        "gauge",
+        "Messages waiting to be deleted.",
+        lambda: {(): get_deletion_queue().stats().depth},
+    )
+    CallbackMetric(
+        "bot_deletions_total",
+        "counter",
+        "Deletion attempts by result, since the start of the bot.",
+        lambda: {
+            (result,): getattr(get_deletion_queue().stats(), result)
+            for result in ("deleted", "retried", "failed")
+        },
+        ("result",),
+    )
+    CallbackMetric(
+        "bot_render_queue_depth",
+        "gauge",
+        "Reaction messages waiting to be updated.",
+        lambda: {(): len(get_render_scheduler())},
+    )
+    CallbackMetric(
+        "bot_reaction_persist_queue_depth",
+        "gauge",
+        "Reaction state changes waiting to be saved.",
+        lambda: {(): get_reaction_states().queue_depth},
+    )
+    CallbackMetric(
+        "bot_db_pending_jobs",
+        "gauge",
+        "Database jobs waiting for or running on the executors.",
+        lambda: {(executor,): n for executor, n in db.pending_jobs().items()},
+        ("executor",),
+    )
+    store = get_store()
+    if isinstance(store, SQLiteStore):
+        buffer = store.buffer
+        CallbackMetric(
+            "bot_message_buffer_depth",
+            "gauge",
+            "Messages waiting in the write buffer.",
+            lambda: {(): len(buffer)},
+        )
+    CallbackMetric(
+        "bot_result_cache_entries",
+        "gauge",
+        "Command results in the result cache.",
+        lambda: {(): len(get_result_cache())},
+    )
+
+    CallbackMetric(
+        "bot_step_duration_seconds_total",
+        "counter",
+        "Total duration of the handler steps.",
+        lambda: {(step,): t.total for step, t in get_step_timings().items()},
+        ("step",),
+    )
+    CallbackMetric(
+        "bot_steps_total",
+        "counter",
+        "Handler steps run.",
+        lambda: {(step,): t.count for step, t in get_step_timings().items()},
+        ("step",),
     )
+    CallbackMetric(
+        "bot_step_duration_max_seconds",
+        "gauge",
+        "Longest duration of the handler steps.",
+        lambda: {(step,): t.max for step, t in get_step_timings().items()},
+        ("step",),
+    )
+
+
+async def post_init(application: Application) -> None:
+    await post_init_set_bot_commands(application)
+    # deletions which failed before the restart
+    await get_deletion_queue().load()
+    await start_metrics_server()
+
+
+async def flush_store_job(context: CallbackContext) -> None:
+    await get_store().flush()
+
+
+async def post_stop_flush_renders(application: Application) -> None:
+    # the bot can still send the final updates of the reaction messages
+    await get_render_scheduler().close()
+
+
+async def post_shutdown_close_store(application: Application) -> None:
+    await stop_metrics_server()
+    await get_reaction_states().close()
+    await get_deletion_queue().close()
+    await get_store().close()
 
 
 def main() -> None:
     configure_settings(constants.CONFIG_FILENAME)
     settings = get_settings()
+    # before the application starts logging
+    get_logger(settings)
+    register_metrics()
 
     application = (
         Application.builder()
         .token(settings.token)
-        .post_init(post_init_set_bot_commands)
-        .rate_limiter(AIORateLimiter())
+        .post_init(post_init)
+        .post_stop(post_stop_flush_renders)
+        .post_shutdown(post_shutdown_close_store)
+        .rate_limiter(MeasuredRateLimiter())
+        .concurrent_updates(settings.concurrent_updates)
         .build()
     )
 
+    assert application.job_queue is not None
+    application.job_queue.run_repeating(
+        flush_store_job, interval=settings.message_buffer_max_delay
+    )
+    application.job_queue.run_repeating(
+        deletion_job, interval=settings.deletion_interval
+    )
+    if settings.storage_backend == "sqlite" and settings.retention_enabled:
+        application.job_queue.run_repeating(
+            retention_job, interval=settings.retention_interval
+        )
+
     # -- reactions & messages handlers --
     for filter_, handler in [
         (filters.TEXT & ~filters.COMMAND, handler_receive_message),
@@ -52,6 +184,7 @@ def main() -> None:
         application.add_handler(CommandHandler(command.name(), command.handler))
 
     application.run_polling()
+    stop_logging()
 
 
 if __name__ == "__main__":
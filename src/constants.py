@@ -1,6 +1,11 @@
+import os
+
 CONFIG_FILENAME = "conf.json"
 DB_FILENAME = "test.db"
-SCHEMA_FILENAME = "src/schema.sql"
+# next to the sources, not in whatever directory the bot is started from
+_SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+MIGRATIONS_DIR = os.path.join(_SOURCE_DIR, "schema")
+EMOJI_CACHE_FILENAME = os.path.join(_SOURCE_DIR, "emoji_trie.cache")
 
 EMPTY_MSG = "\xad\xad"
 INFORMATION_EMOJI = "ℹ️"
@@ -31,3 +36,8 @@ TEXTUAL_REACTIONS = (
 )
 
 REACTIONS_IN_SINGLE_MSG_LIMIT = 3
+# starts the callback data of the /ranking page buttons, so no reaction may
+# start with it, or its button would show a ranking page instead of toggling
+RANKING_PAGE_PREFIX = "__ranking"
+
+NS_IN_ONE_DAY = 24 * 60 * 60 * 10**9
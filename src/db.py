@@ -1,38 +1,321 @@
 from __future__ import annotations
 
+import asyncio
 import sqlite3
+import threading
+import time
 
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from typing import Iterator
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, TypeVar, cast
 
-from src import constants
+from src import constants, queries
+from src.logger import get_default_logger
+from src.metrics import QUERY_DURATION
+from src.migrations import apply_migrations
+from src.settings import Settings, get_settings
+from src.timings import StepTiming
 
+__all__ = (
+    "Row",
+    "get_conn",
+    "close_conn",
+    "run_in_transaction",
+    "run_read",
+    "fetch_all",
+    "fetch_one",
+    "execute",
+    "shutdown",
+    "pending_jobs",
+    "statement_timings",
+    "DatabaseStats",
+    "database_stats",
+    "QUERY_NAMES",
+)
+
+T = TypeVar("T")
+Row = tuple[Any, ...]
+
+# A single writer connection, only ever used from the writer thread.
 CONNECTION: sqlite3.Connection | None = None
+# Read-only connections, one per reader thread. In WAL mode readers never
+# block the writer (and vice versa), so analytical queries such as /ranking
+# can run while reactions are being saved.
+READ_CONNECTIONS: list[sqlite3.Connection] = []
+
+WRITE_EXECUTOR: ThreadPoolExecutor | None = None
+READ_EXECUTOR: ThreadPoolExecutor | None = None
+
+_init_lock = threading.Lock()
+_thread_local = threading.local()
+
+# statements waiting for or running on the executors, by executor
+PENDING_JOBS = {"write": 0, "read": 0}
+
+# statement text -> name of its constant in src/queries.py, the metrics label
+QUERY_NAMES = {
+    sql: name
+    for name, sql in vars(queries).items()
+    if name.isupper() and isinstance(sql, str)
+}
+
+# per statement text, recorded only with the db_trace setting
+STATEMENT_TIMINGS: dict[str, StepTiming] = {}
+_trace_lock = threading.Lock()
+
+
+class DatabaseStats(NamedTuple):
+    page_size: int
+    page_count: int
+    freelist_count: int
+    # as PRAGMA cache_size: pages if positive, KiB if negative
+    cache_size: int
+    mmap_size: int
+    # (name, type, table, size in bytes) of the tables and indexes, largest first,
+    # None without the dbstat table (sqlite built without SQLITE_ENABLE_DBSTAT_VTAB)
+    objects: list[tuple[str, str, str, int]] | None
+
+
+class MeasuredConnection(sqlite3.Connection):
+    """Records the duration of every statement and commit.
+
+    The statements are timed up to their first row, the following rows of
+    a query are read when they are fetched.
+    """
+
+    # set from the settings when the connection is opened
+    trace: bool = False
+    slow_query_seconds: float | None = None
+
+    def execute(self, sql: str, parameters: Any = (), /) -> sqlite3.Cursor:
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._record(sql, time.perf_counter() - start, parameters)
+
+    def executemany(self, sql: str, parameters: Any, /) -> sqlite3.Cursor:
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            self._record(sql, time.perf_counter() - start)
+
+    def commit(self) -> None:
+        start = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            self._record("COMMIT", time.perf_counter() - start)
+
+    def _record(self, sql: str, duration: float, parameters: Any = None) -> None:
+        name = "COMMIT" if sql == "COMMIT" else QUERY_NAMES.get(sql, "other")
+        QUERY_DURATION.observe(duration, name)
+        if self.trace:
+            with _trace_lock:
+                STATEMENT_TIMINGS.setdefault(sql, StepTiming()).add(duration)
+        if self.slow_query_seconds is not None and duration >= self.slow_query_seconds:
+            self._log_slow_statement(name, sql, duration, parameters)
+
+    def _log_slow_statement(
+        self, name: str, sql: str, duration: float, parameters: Any
+    ) -> None:
+        if parameters is None:
+            # the plan doesn't depend on the values, only on their positions
+            parameters = [None] * sql.count("?")
+        try:
+            plan = [
+                row[3]
+                for row in super().execute(f"EXPLAIN QUERY PLAN {sql}", parameters)
+            ]
+        except sqlite3.Error:
+            plan = []
+
+        get_default_logger().warning(
+            "Slow statement %s took %.1f ms: %s%s",
+            name,
+            duration * 1000,
+            sql,
+            "".join(f"\n    {step}" for step in plan),
+        )
+
+
+def _apply_pragmas(conn: MeasuredConnection, settings: Settings) -> None:
+    conn.execute(f"PRAGMA cache_size={settings.db_cache_size};")
+    conn.execute(f"PRAGMA mmap_size={settings.db_mmap_size};")
+    conn.execute(f"PRAGMA temp_store={settings.db_temp_store};")
+    conn.trace = settings.db_trace
+    if settings.db_slow_query_ms is not None:
+        conn.slow_query_seconds = settings.db_slow_query_ms / 1000
+
+
+def _open_writer() -> sqlite3.Connection:
+    global CONNECTION
+    with _init_lock:
+        if CONNECTION is None:
+            settings = get_settings()
+            conn = MeasuredConnection(constants.DB_FILENAME, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute(f"PRAGMA synchronous={settings.db_synchronous};")
+            _apply_pragmas(conn, settings)
+            apply_migrations(conn)
+            CONNECTION = conn
+
+        return CONNECTION
+
+
+def _open_reader() -> sqlite3.Connection:
+    conn: sqlite3.Connection | None = getattr(_thread_local, "conn", None)
+    if conn is None:
+        # the writer creates the database file and the schema
+        _open_writer()
+        conn = MeasuredConnection(
+            f"file:{constants.DB_FILENAME}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+        )
+        conn.execute("PRAGMA query_only=1;")
+        _apply_pragmas(conn, get_settings())
+        with _init_lock:
+            READ_CONNECTIONS.append(conn)
+        _thread_local.conn = conn
+
+    return conn
 
 
 @contextmanager
 def get_conn() -> Iterator[sqlite3.Connection]:
-    global CONNECTION
-    if CONNECTION is None:
-        CONNECTION = sqlite3.connect(constants.DB_FILENAME, check_same_thread=False)
+    conn = _open_writer()
 
     try:
-        yield CONNECTION
+        yield conn
     except:
-        # TODO handle errors, recreate connection?
-        # would the exception be raised here or in .commit?
+        conn.rollback()
         raise
 
-    CONNECTION.commit()
+    conn.commit()
 
 
 def close_conn() -> None:
     global CONNECTION
-    if CONNECTION is not None:
-        CONNECTION.close()
-        CONNECTION = None
+    with _init_lock:
+        if CONNECTION is not None:
+            CONNECTION.close()
+            CONNECTION = None
+        for conn in READ_CONNECTIONS:
+            conn.close()
+        READ_CONNECTIONS.clear()
+
+
+def _get_write_executor() -> ThreadPoolExecutor:
+    global WRITE_EXECUTOR
+    if WRITE_EXECUTOR is None:
+        WRITE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+    return WRITE_EXECUTOR
+
+
+def _get_read_executor() -> ThreadPoolExecutor:
+    global READ_EXECUTOR
+    if READ_EXECUTOR is None:
+        READ_EXECUTOR = ThreadPoolExecutor(
+            max_workers=get_settings().db_read_pool_size,
+            thread_name_prefix="db-read",
+        )
+    return READ_EXECUTOR
+
+
+async def run_in_transaction(fn: Callable[[sqlite3.Connection], T]) -> T:
+    """Run ``fn`` on the writer thread inside a single transaction."""
+
+    def job() -> T:
+        with get_conn() as conn:
+            return fn(conn)
+
+    loop = asyncio.get_running_loop()
+    PENDING_JOBS["write"] += 1
+    try:
+        return await loop.run_in_executor(_get_write_executor(), job)
+    finally:
+        PENDING_JOBS["write"] -= 1
+
+
+async def run_read(fn: Callable[[sqlite3.Connection], T]) -> T:
+    """Run ``fn`` on a pooled read-only connection, against a single snapshot."""
+
+    def job() -> T:
+        conn = _open_reader()
+        conn.execute("BEGIN;")
+        try:
+            return fn(conn)
+        finally:
+            conn.rollback()
+
+    loop = asyncio.get_running_loop()
+    PENDING_JOBS["read"] += 1
+    try:
+        return await loop.run_in_executor(_get_read_executor(), job)
+    finally:
+        PENDING_JOBS["read"] -= 1
+
+
+async def fetch_all(sql: str, params: Iterable[Any] = ()) -> list[Row]:
+    args = tuple(params)
+    return await run_read(lambda conn: list(conn.execute(sql, args).fetchall()))
+
+
+async def fetch_one(sql: str, params: Iterable[Any] = ()) -> Row | None:
+    args = tuple(params)
+    return cast(
+        "Row | None",
+        await run_read(lambda conn: conn.execute(sql, args).fetchone()),
+    )
+
+
+async def execute(sql: str, params: Iterable[Any] = ()) -> None:
+    args = tuple(params)
+    await run_in_transaction(lambda conn: conn.execute(sql, args))
+
+
+def pending_jobs() -> dict[str, int]:
+    return PENDING_JOBS
+
+
+def statement_timings() -> dict[str, StepTiming]:
+    with _trace_lock:
+        return dict(STATEMENT_TIMINGS)
+
+
+async def database_stats() -> DatabaseStats:
+    def collect(conn: sqlite3.Connection) -> DatabaseStats:
+        def pragma(name: str) -> int:
+            return int(conn.execute(f"PRAGMA {name};").fetchone()[0])
+
+        objects: list[tuple[str, str, str, int]] | None
+        try:
+            objects = conn.execute(queries.OBJECT_SIZES).fetchall()
+        except sqlite3.OperationalError as e:
+            if "no such table" not in str(e):
+                raise
+            objects = None
+
+        return DatabaseStats(
+            page_size=pragma("page_size"),
+            page_count=pragma("page_count"),
+            freelist_count=pragma("freelist_count"),
+            cache_size=pragma("cache_size"),
+            mmap_size=pragma("mmap_size"),
+            objects=objects,
+        )
+
+    return await run_read(collect)
 
 
-with open(constants.SCHEMA_FILENAME) as f:
-    with get_conn() as conn:
-        conn.executescript(f.read())
+async def shutdown() -> None:
+    """Wait for the queued database work to finish and close the connections."""
+    global WRITE_EXECUTOR, READ_EXECUTOR
+    loop = asyncio.get_running_loop()
+    for executor in (READ_EXECUTOR, WRITE_EXECUTOR):
+        if executor is not None:
+            await loop.run_in_executor(None, executor.shutdown)
+    READ_EXECUTOR = WRITE_EXECUTOR = None
+    close_conn()
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+
+from typing import NamedTuple
+
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, RetryAfter
+from telegram.ext import CallbackContext
+
+from src.logger import get_default_logger
+from src.settings import get_settings
+from src.storage import PendingDeletion, Store, get_store
+
+__all__ = (
+    "DeletionStats",
+    "DeletionQueue",
+    "get_deletion_queue",
+    "deletion_job",
+)
+
+MsgKey = tuple[int, int]  # (chat id, message id)
+
+MAX_RETRY_DELAY = 10 * 60
+# deletions attempted in a single chat by a single run
+MAX_DELETIONS_PER_CHAT = 100
+
+DELETION_QUEUE: DeletionQueue | None = None
+
+
+class DeletionStats(NamedTuple):
+    depth: int
+    deleted: int
+    retried: int
+    failed: int
+
+
+class DeletionQueue:
+    """Messages to delete, removed in the background by ``deletion_job``.
+
+    The handlers only enqueue the messages. Every run first saves the new
+    deletions in the store, so they are loaded back after a restart even if
+    the bot is killed, and removes them from it once they succeed. Failed
+    attempts are retried with an exponential backoff.
+    """
+
+    store: Store
+    retry_delay: float
+    max_attempts: int
+    deleted: int
+    retried: int
+    failed: int
+    _pending: dict[MsgKey, PendingDeletion]
+    # the pending deletions saved in the store
+    _saved: set[MsgKey]
+
+    def __init__(self, store: Store, retry_delay: float, max_attempts: int) -> None:
+        self.store = store
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self.deleted = self.retried = self.failed = 0
+        self._pending = {}
+        self._saved = set()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> DeletionStats:
+        return DeletionStats(len(self), self.deleted, self.retried, self.failed)
+
+    def enqueue(self, chat_id: int, message_id: int) -> None:
+        key = (chat_id, message_id)
+        if key not in self._pending:
+            self._pending[key] = PendingDeletion(chat_id, message_id, 0, time.time_ns())
+
+    async def load(self) -> None:
+        for deletion in await self.store.load_deletions():
+            key = (deletion.chat_id, deletion.message_id)
+            self._pending[key] = deletion
+            self._saved.add(key)
+
+    def _backoff(self, attempts: int, retry_after: float = 0) -> int:
+        # half of the delay is fixed, the other half random
+        delay = min(self.retry_delay * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        return int(max(delay, retry_after) * 10**9)
+
+    async def _delete(
+        self, bot: Bot, deletion: PendingDeletion
+    ) -> PendingDeletion | None:
+        """Try to delete the message, return the deletion to retry, if any."""
+        try:
+            await bot.delete_message(
+                chat_id=deletion.chat_id, message_id=deletion.message_id
+            )
+        except (BadRequest, Forbidden) as e:
+            # retrying won't help, unless the message is already gone
+            if "not found" not in e.message:
+                self.failed += 1
+                get_default_logger().error(
+                    "Failed to delete message(id=%d, chat_id=%d): %s",
+                    deletion.message_id,
+                    deletion.chat_id,
+                    e,
+                )
+            return None
+        except Exception as e:
+            attempts = deletion.attempts + 1
+            if attempts >= self.max_attempts:
+                self.failed += 1
+                get_default_logger().error(
+                    "Giving up deleting message(id=%d, chat_id=%d) "
+                    "after %d attempts: %s",
+                    deletion.message_id,
+                    deletion.chat_id,
+                    attempts,
+                    e,
+                )
+                return None
+
+            self.retried += 1
+            retry_after = e.retry_after if isinstance(e, RetryAfter) else 0
+            return deletion._replace(
+                attempts=attempts,
+                next_attempt=time.time_ns() + self._backoff(attempts, retry_after),
+            )
+
+        self.deleted += 1
+        return None
+
+    async def _delete_chat_batch(
+        self, bot: Bot, deletions: list[PendingDeletion]
+    ) -> list[PendingDeletion | None]:
+        # python-telegram-bot 20.2 has no bulk deleteMessages,
+        # the messages of a chat are deleted concurrently instead
+        return await asyncio.gather(*(self._delete(bot, d) for d in deletions))
+
+    async def _save_new(self) -> None:
+        unsaved = [d for key, d in self._pending.items() if key not in self._saved]
+        if unsaved:
+            await self.store.save_deletions(unsaved)
+            self._saved.update((d.chat_id, d.message_id) for d in unsaved)
+
+    async def run(self, bot: Bot) -> None:
+        """Attempt all the due deletions, batched per chat."""
+        await self._save_new()
+
+        now = time.time_ns()
+        batches: dict[int, list[PendingDeletion]] = {}
+        for key, deletion in self._pending.items():
+            # the deletions enqueued while saving wait for the next run
+            if deletion.next_attempt <= now and key in self._saved:
+                batch = batches.setdefault(deletion.chat_id, [])
+                if len(batch) < MAX_DELETIONS_PER_CHAT:
+                    batch.append(deletion)
+        if not batches:
+            return
+
+        results = await asyncio.gather(
+            *(self._delete_chat_batch(bot, batch) for batch in batches.values())
+        )
+
+        to_remove, to_save = [], []
+        for batch, batch_results in zip(batches.values(), results):
+            for deletion, retry in zip(batch, batch_results):
+                key = (deletion.chat_id, deletion.message_id)
+                if retry is None:
+                    del self._pending[key]
+                    if key in self._saved:
+                        self._saved.remove(key)
+                        to_remove.append(deletion)
+                else:
+                    self._pending[key] = retry
+                    self._saved.add(key)
+                    to_save.append(retry)
+
+        if to_remove:
+            await self.store.remove_deletions(to_remove)
+        if to_save:
+            await self.store.save_deletions(to_save)
+
+    async def close(self) -> None:
+        """Save the deletions not attempted yet, for the next run of the bot."""
+        await self._save_new()
+
+
+def get_deletion_queue() -> DeletionQueue:
+    global DELETION_QUEUE
+    if DELETION_QUEUE is None:
+        settings = get_settings()
+        DELETION_QUEUE = DeletionQueue(
+            get_store(), settings.deletion_retry_delay, settings.deletion_max_attempts
+        )
+    return DELETION_QUEUE
+
+
+async def deletion_job(context: CallbackContext) -> None:
+    queue = get_deletion_queue()
+    failed = queue.failed
+    await queue.run(context.bot)
+    if queue.failed > failed:
+        get_default_logger().warning("Deletion queue: %s", queue.stats())
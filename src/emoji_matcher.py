@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import importlib.util
+import json
+import os
+import pickle
+import re
+
+from typing import Any, Iterable
+
+from src import constants
+
+__all__ = (
+    "EmojiMatcher",
+    "get_emoji_matcher",
+)
+
+# marks the end of an emoji code in the trie, no character is an empty string
+_END = ""
+
+# bumped whenever the cached trie changes its shape
+CACHE_VERSION = 1
+
+EMOJI_MATCHER: EmojiMatcher | None = None
+
+
+class EmojiMatcher:
+    """Finds emojis the same way ``demoji`` does, without its regex.
+
+    demoji matches the alternation of all the codes sorted from the longest,
+    which is the longest code starting at the leftmost position. The same
+    match is found by walking a trie of the codes, started only at the
+    characters which begin some code.
+    """
+
+    _trie: dict[str, Any]
+    # any character beginning an emoji code
+    _start_pattern: re.Pattern[str]
+
+    def __init__(self, codes: Iterable[str]) -> None:
+        self._trie = {}
+        starts = set()
+        for code in codes:
+            # every code has a non-ascii character, which the prefilter relies on
+            assert code and not code.isascii()
+            node = self._trie
+            for char in code:
+                node = node.setdefault(char, {})
+            node[_END] = True
+            starts.add(code[0])
+
+        self._start_pattern = re.compile(
+            "[" + "".join(re.escape(c) for c in sorted(starts)) + "]"
+        )
+
+    @classmethod
+    def _from_trie(cls, trie: dict[str, Any], start_pattern: str) -> EmojiMatcher:
+        matcher = cls.__new__(cls)
+        matcher._trie = trie
+        matcher._start_pattern = re.compile(start_pattern)
+        return matcher
+
+    @classmethod
+    def from_demoji(cls) -> EmojiMatcher:
+        with open(_demoji_codes_path(), encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @classmethod
+    def from_cache(cls, cache_path: str) -> EmojiMatcher:
+        """The matcher of demoji's codes, the trie is cached in ``cache_path``.
+
+        The cache is rebuilt when demoji's code table changes, a missing
+        or unreadable cache is not an error.
+        """
+        source = _cache_source()
+        try:
+            with open(cache_path, "rb") as f:
+                cached = _CacheUnpickler(f).load()
+            if (
+                isinstance(cached, dict)
+                and cached.get("source") == source
+                and isinstance(cached.get("trie"), dict)
+                and isinstance(cached.get("start_pattern"), str)
+            ):
+                return cls._from_trie(cached["trie"], cached["start_pattern"])
+        except Exception:
+            # corrupt or written by another version, rebuilt below
+            pass
+
+        matcher = cls.from_demoji()
+        cached = {
+            "source": source,
+            "trie": matcher._trie,
+            "start_pattern": matcher._start_pattern.pattern,
+        }
+        try:
+            # written aside and renamed, the other processes never see a partial file
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass
+        return matcher
+
+    def split(self, text: str) -> tuple[list[str], str]:
+        """The emojis in ``text`` and the text without them, in a single scan."""
+        if text.isascii():
+            return [], text
+
+        found = []
+        residual = []
+        last = 0
+        n = len(text)
+        start = self._start_pattern.search(text)
+        while start is not None:
+            i = start.start()
+            node = self._trie[text[i]]
+            end = i + 1 if _END in node else -1
+            j = i + 1
+            while j < n:
+                node = node.get(text[j])
+                if node is None:
+                    break
+                j += 1
+                if _END in node:
+                    end = j
+
+            if end < 0:
+                start = self._start_pattern.search(text, i + 1)
+            else:
+                residual.append(text[last:i])
+                found.append(text[i:end])
+                last = end
+                start = self._start_pattern.search(text, end)
+
+        if not found:
+            return [], text
+        residual.append(text[last:])
+        return found, "".join(residual)
+
+    def findall(self, text: str) -> list[str]:
+        return self.split(text)[0]
+
+    def replace(self, text: str) -> str:
+        return self.split(text)[1]
+
+
+class _CacheUnpickler(pickle.Unpickler):
+    """Loads only the builtin containers the cache is made of, never code."""
+
+    def find_class(self, module: str, name: str) -> Any:
+        raise pickle.UnpicklingError(f"{module}.{name} is not allowed in the cache")
+
+
+def _demoji_codes_path() -> str:
+    # found without importing demoji, which loads and compiles its own tables
+    spec = importlib.util.find_spec("demoji")
+    assert spec is not None and spec.origin is not None
+    return os.path.join(os.path.dirname(spec.origin), "codes.json")
+
+
+def _cache_source() -> tuple[int, str, int, int]:
+    path = _demoji_codes_path()
+    stat = os.stat(path)
+    return CACHE_VERSION, path, stat.st_size, stat.st_mtime_ns
+
+
+def get_emoji_matcher() -> EmojiMatcher:
+    global EMOJI_MATCHER
+    if EMOJI_MATCHER is None:
+        EMOJI_MATCHER = EmojiMatcher.from_cache(constants.EMOJI_CACHE_FILENAME)
+    return EMOJI_MATCHER
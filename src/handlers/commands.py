@@ -1,27 +1,35 @@
 from __future__ import annotations
 
+import asyncio
+import html
 import time
 
 from abc import ABC
-from typing import Awaitable, Callable, Type
+from typing import Awaitable, Callable, NamedTuple, Type
 
 import telegram.error
 
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import CallbackContext
 
-from src import constants
-from src.db import get_conn
+from src import constants, db
 from src.handlers.common import send_message, send_reply
+from src.keyed_lock import CHAT_LOCKS
+from src.logger import get_default_logger
 from src.message_wrapper import MsgWrapper
+from src.metrics import measure_handler
+from src.result_cache import get_result_cache
 from src.settings import get_settings
+from src.storage import RankingCursor, RankingEntry, get_store
 from src.utils import _escape_markdown_v2
 
 DEFAULT_RANKING_DAYS = 7
 DEFAULT_MOST_REACTED_MSGS_TO_SHOW = 10
 MAX_TIMESPAN_DAYS = 10 * 365
 MAX_TOP_MESSAGES_COUNT = 30
-NS_IN_ONE_DAY = 24 * 60 * 60 * 10**9
+DBSTATS_TOP_STATEMENTS = 10
+RANKING_PAGE_SIZE = 20
+MAX_CALLBACK_DATA_SIZE = 64  # bytes, the Bot API limit
 
 
 class UsageError(Exception):
@@ -31,6 +39,8 @@ class UsageError(Exception):
 class CommandHandler(ABC):
     description: str
     usage: str
+    # only for the users in settings.admin_ids, not listed in the help
+    admin_only: bool = False
     _handler: Callable[[Update, CallbackContext], Awaitable[None]]
 
     @classmethod
@@ -39,15 +49,33 @@ class CommandHandler(ABC):
 
     @classmethod
     async def handler(cls, update: Update, context: CallbackContext) -> None:
-        try:
-            await cls._handler(update, context)
-        except UsageError as e:
-            if e.args:
-                error_message = f"Usage error: {', '.join(e.args)}"
-            else:
-                error_message = "Usage: " + cls.usage
+        assert update.effective_chat is not None
+        with measure_handler(f"command_{cls.name()}"):
+            # commands in a chat run one at a time, other chats aren't blocked
+            async with CHAT_LOCKS.hold(update.effective_chat.id):
+                if cls.admin_only and not cls.is_admin(update):
+                    await send_reply(
+                        update,
+                        context,
+                        "Only the bot admins can use this command.",
+                        save_to_db=True,
+                    )
+                    return
+
+                try:
+                    await cls._handler(update, context)
+                except UsageError as e:
+                    if e.args:
+                        error_message = f"Usage error: {', '.join(e.args)}"
+                    else:
+                        error_message = "Usage: " + cls.usage
 
-            await send_reply(update, context, error_message, save_to_db=True)
+                    await send_reply(update, context, error_message, save_to_db=True)
+
+    @staticmethod
+    def is_admin(update: Update) -> bool:
+        user = update.effective_user
+        return user is not None and user.id in get_settings().admin_ids
 
 
 class RankingCommandHandler(CommandHandler):
@@ -72,74 +100,207 @@ class RankingCommandHandler(CommandHandler):
         except (IndexError, ValueError):
             raise UsageError()
 
-        min_timestamp = time.time_ns() - days * NS_IN_ONE_DAY
-        with get_conn() as conn:
-            reactions_received = list(
-                conn.execute(
-                    "SELECT author_id, sum(msg_reactions.cnt) "
-                    "from message "
-                    "inner join (select parent, count(*) as cnt from reaction where timestamp > ? group by parent) as msg_reactions "
-                    "on message.id=msg_reactions.parent "
-                    "where chat_id=? "
-                    "group by message.author_id "
-                    "order by sum(msg_reactions.cnt) desc",
-                    (
-                        min_timestamp,
-                        update.message.chat_id,
-                    ),
-                ).fetchall()
-            )
+        text, buttons = await render_ranking_page(
+            update.message.chat_id, RankingPage(False, days, 0)
+        )
 
-            reactions_given = list(
-                conn.execute(
-                    "SELECT author_id, count(*) "
-                    "from reaction "
-                    "inner join (select id, chat_id from message) as reaction_msg "
-                    "on reaction_msg.id=reaction.parent "
-                    "where timestamp > ? and reaction_msg.chat_id = ?"
-                    "group by reaction.author_id "
-                    "order by count(*) desc",
-                    (
-                        min_timestamp,
-                        update.message.chat_id,
-                    ),
-                ).fetchall()
+        if not get_settings().display_remove_ranking_button:
+            await send_reply(
+                update,
+                context,
+                text,
+                save_to_db=True,
+                is_ranking=True,
+                reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons),
             )
+            return
+
+        # the delete button needs the id of the ranking message
+        ranking_msg = await send_reply(
+            update, context, text, save_to_db=True, is_ranking=True
+        )
+        await context.bot.edit_message_reply_markup(
+            chat_id=ranking_msg.chat_id,
+            message_id=ranking_msg.msg_id,
+            reply_markup=_ranking_markup(buttons, ranking_msg.msg_id),
+        )
 
-        text = f"Reactions received in the last {days} days\n"
-        with get_conn() as conn:
-            for i, (user_id, cnt) in enumerate(reactions_received, start=1):
-                username = conn.execute(
-                    "SELECT author from message where author_id=? LIMIT 1",
-                    (user_id,),
-                ).fetchone()[0]
 
-                text += f"{i}. {username}: {cnt}\n"
+class RankingPage(NamedTuple):
+    """A page of /ranking, sent in the callback data of its button.
 
-        text += f"\nReactions given in the last {days} days\n"
-        with get_conn() as conn:
-            for i, (user_id, cnt) in enumerate(reactions_given, start=1):
-                username = conn.execute(
-                    "SELECT author from reaction where author_id=? LIMIT 1",
-                    (user_id,),
-                ).fetchone()[0]
+    The users of the page follow the ``after`` entry or precede the ``before``
+    one, without either it is the first page, which shows both lists.
+    """
 
-                text += f"{i}. {username}: {cnt}\n"
+    given: bool
+    days: int
+    # number of the users on the preceding pages
+    offset: int
+    after: RankingCursor | None = None
+    before: RankingCursor | None = None
+
+    def to_callback_data(self) -> str:
+        parts = [
+            constants.RANKING_PAGE_PREFIX,
+            "g" if self.given else "r",
+            str(self.days),
+            str(self.offset),
+        ]
+        if self.after is not None:
+            parts += ["a", str(self.after.cnt), str(self.after.user_id)]
+        elif self.before is not None:
+            parts += ["b", str(self.before.cnt), str(self.before.user_id)]
 
-        ranking_msg = await send_reply(
-            update, context, text, save_to_db=True, is_ranking=True
-        )
+        data = ":".join(parts)
+        assert len(data.encode()) <= MAX_CALLBACK_DATA_SIZE
+        return data
 
-        if get_settings().display_remove_ranking_button:
-            delete_button = InlineKeyboardButton(
-                "delete ranking", callback_data=f"{ranking_msg.msg_id}__delete"
+    @classmethod
+    def from_callback_data(cls, data: str) -> RankingPage:
+        prefix, kind, days, offset, *cursor = data.split(":")
+        if prefix != constants.RANKING_PAGE_PREFIX or kind not in ("g", "r"):
+            raise ValueError(f"Not a ranking page: {data}")
+
+        page = cls(kind == "g", int(days), int(offset))
+        if not cursor:
+            return page
+        side, cnt, user_id = cursor
+        if side == "a":
+            return page._replace(after=RankingCursor(int(cnt), int(user_id)))
+        if side == "b":
+            return page._replace(before=RankingCursor(int(cnt), int(user_id)))
+        raise ValueError(f"Not a ranking page: {data}")
+
+
+async def _ranking_entries(
+    chat_id: int, page: RankingPage
+) -> tuple[list[RankingEntry], bool]:
+    """The users of the page and whether any follow them."""
+    min_timestamp = time.time_ns() - page.days * constants.NS_IN_ONE_DAY
+    # one more user tells if there is a next page
+    limit = RANKING_PAGE_SIZE if page.before is not None else RANKING_PAGE_SIZE + 1
+    entries = await get_result_cache().get_or_compute(
+        chat_id,
+        "ranking",
+        (page.given, page.days, page.after, page.before),
+        lambda: get_store().ranking_page(
+            chat_id, min_timestamp, page.given, limit, page.after, page.before
+        ),
+    )
+    has_next = page.before is not None or len(entries) > RANKING_PAGE_SIZE
+    return entries[:RANKING_PAGE_SIZE], has_next
+
+
+def _ranking_list(page: RankingPage, entries: list[RankingEntry]) -> str:
+    kind = "given" if page.given else "received"
+    text = f"Reactions {kind} in the last {page.days} days\n"
+    for i, (_, username, cnt) in enumerate(entries, start=page.offset + 1):
+        text += f"{i}. {username}: {cnt}\n"
+    return text
+
+
+def _next_page(page: RankingPage, entries: list[RankingEntry]) -> RankingPage:
+    last = RankingCursor(entries[-1].cnt, entries[-1].user_id)
+    return RankingPage(page.given, page.days, page.offset + len(entries), after=last)
+
+
+async def render_ranking_page(
+    chat_id: int, page: RankingPage
+) -> tuple[str, list[list[InlineKeyboardButton]]]:
+    """The text of the page and its buttons, without the delete button.
+
+    The first page shows the top users of both lists, the following ones page
+    through one of them.
+    """
+    if page.offset == 0 and page.after is None and page.before is None:
+        return await _render_first_ranking_page(chat_id, page.days)
+
+    entries, has_next = await _ranking_entries(chat_id, page)
+    if not entries:
+        # the counts changed since the page was shown, start over
+        return await _render_first_ranking_page(chat_id, page.days)
+    if page.before is not None and len(entries) < RANKING_PAGE_SIZE:
+        # the counts changed since, no user precedes these anymore
+        page = page._replace(offset=0)
+
+    navigation = []
+    if page.offset > RANKING_PAGE_SIZE:
+        first = RankingCursor(entries[0].cnt, entries[0].user_id)
+        previous = RankingPage(
+            page.given, page.days, page.offset - RANKING_PAGE_SIZE, before=first
+        )
+    else:
+        # the top users, even if more of them precede this page by now
+        previous = RankingPage(page.given, page.days, 0)
+    navigation.append(
+        InlineKeyboardButton("« prev", callback_data=previous.to_callback_data())
+    )
+    if has_next:
+        navigation.append(
+            InlineKeyboardButton(
+                "next »", callback_data=_next_page(page, entries).to_callback_data()
             )
-            await context.bot.edit_message_reply_markup(
-                chat_id=ranking_msg.chat_id,
-                message_id=ranking_msg.msg_id,
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[[delete_button]]),
+        )
+
+    return _ranking_list(page, entries), [navigation]
+
+
+async def _render_first_ranking_page(
+    chat_id: int, days: int
+) -> tuple[str, list[list[InlineKeyboardButton]]]:
+    lists = []
+    more = []
+    for given in (False, True):
+        page = RankingPage(given, days, 0)
+        entries, has_next = await _ranking_entries(chat_id, page)
+        lists.append(_ranking_list(page, entries))
+        if has_next and entries:
+            more.append(
+                InlineKeyboardButton(
+                    "more given »" if given else "more received »",
+                    callback_data=_next_page(page, entries).to_callback_data(),
+                )
             )
 
+    return "\n".join(lists), [more] if more else []
+
+
+def _ranking_markup(
+    buttons: list[list[InlineKeyboardButton]], ranking_msg_id: int
+) -> InlineKeyboardMarkup:
+    if not get_settings().display_remove_ranking_button:
+        return InlineKeyboardMarkup(inline_keyboard=buttons)
+    delete_button = InlineKeyboardButton(
+        "delete ranking", callback_data=f"{ranking_msg_id}__delete"
+    )
+    return InlineKeyboardMarkup(inline_keyboard=[*buttons, [delete_button]])
+
+
+async def show_ranking_page(
+    bot: Bot, ranking_msg: MsgWrapper, callback_data: str
+) -> None:
+    """Replace the ranking message with the page of the pressed button."""
+    try:
+        page = RankingPage.from_callback_data(callback_data)
+    except ValueError as e:
+        get_default_logger().error("Invalid ranking page: %s", e)
+        return
+
+    text, buttons = await render_ranking_page(ranking_msg.chat_id, page)
+    try:
+        await bot.edit_message_text(
+            chat_id=ranking_msg.chat_id,
+            message_id=ranking_msg.msg_id,
+            text=text,
+            parse_mode="HTML",
+            reply_markup=_ranking_markup(buttons, ranking_msg.msg_id),
+        )
+    except telegram.error.BadRequest as e:
+        # the button was pressed again before the message changed
+        if "Message is not modified" not in str(e):
+            raise
+
 
 class TopCommandHandler(CommandHandler):
     description = "Show the most reacted messages."
@@ -174,56 +335,189 @@ class TopCommandHandler(CommandHandler):
             raise UsageError()
 
         chat_id = MsgWrapper(update.message).chat_id
-        min_timestamp = time.time_ns() - days * NS_IN_ONE_DAY
-
-        query_parts = [
-            "select message.original_id, count(*) as c from message "
-            "inner join reaction "
-            "on message.id = reaction.parent "
-            "where reaction.timestamp > ? "
-            "and message.chat_id = ? ",
-            "group by message.id order by c desc ",
-            "limit ?",
-        ]
-        query_arguments: list[int | str] = [
-            min_timestamp,
-            chat_id,
-            requested_messages_cnt * 3,  # fetch more messages, as some might be deleted
-        ]
+        min_timestamp = time.time_ns() - days * constants.NS_IN_ONE_DAY
 
+        author = None
         if len(context.args) > 2:
-            user = context.args[2]
-            if user.startswith("@"):
-                user = user[1:]
-            if not user:  # TODO better check for username validity
+            author = context.args[2]
+            if author.startswith("@"):
+                author = author[1:]
+            if not author:  # TODO better check for username validity
                 raise UsageError("Invalid username.")
-            query_parts.insert(1, "and message.author = ?")
-            query_arguments.insert(2, user)
-
-        with get_conn() as conn:
-            reactions_received = conn.execute(
-                "".join(query_parts), query_arguments
-            ).fetchall()
-
-        sent_cnt = 0
-        for message_id, cnt in reactions_received:
-            try:
-                await send_message(
-                    context.bot,
-                    chat_id,
-                    message_id,
-                    None,
-                    text=f"{sent_cnt + 1}. {cnt}",
-                    save_to_db=True,
+
+        # replies to the deleted messages fail, the next messages take their slots
+        replies: dict[int, tuple[MsgWrapper, str]] = {}  # message id -> reply, text
+        while True:
+            top = await get_result_cache().get_or_compute(
+                chat_id,
+                "top",
+                (days, requested_messages_cnt, author),
+                lambda: get_store().top_messages(
+                    chat_id, min_timestamp, requested_messages_cnt, author
+                ),
+            )
+            texts = {
+                message_id: f"{rank}. {cnt}"
+                for rank, (message_id, cnt) in enumerate(top, start=1)
+            }
+            await TopCommandHandler._renumber(context, chat_id, replies, texts)
+
+            pending = [message_id for message_id in texts if message_id not in replies]
+            if not pending:
+                return
+            deleted = await TopCommandHandler._send_replies(
+                context, chat_id, pending, texts, replies
+            )
+            if not deleted:
+                return
+
+    @staticmethod
+    async def _send_replies(
+        context: CallbackContext,
+        chat_id: int,
+        message_ids: list[int],
+        texts: dict[int, str],
+        replies: dict[int, tuple[MsgWrapper, str]],
+    ) -> list[int]:
+        """Reply to the messages one after another, returns the deleted ones.
+
+        Each reply is posted before the next one is sent, so they appear
+        in rank order. The deleted messages are marked in the store, so the
+        next runs don't try to reply to them again.
+        """
+        deleted = []
+        try:
+            for message_id in message_ids:
+                try:
+                    reply = await send_message(
+                        context.bot,
+                        chat_id,
+                        message_id,
+                        None,
+                        text=texts[message_id],
+                        save_to_db=True,
+                    )
+                except telegram.error.BadRequest as e:
+                    if "Replied message not found" not in str(e):
+                        raise
+                    deleted.append(message_id)
+                else:
+                    replies[message_id] = (reply, texts[message_id])
+        finally:
+            if deleted:
+                await get_store().mark_deleted(chat_id, deleted)
+                get_result_cache().invalidate(chat_id)
+        return deleted
+
+    @staticmethod
+    async def _renumber(
+        context: CallbackContext,
+        chat_id: int,
+        replies: dict[int, tuple[MsgWrapper, str]],
+        texts: dict[int, str],
+    ) -> None:
+        """Fix the ranks of the sent replies, moved up by the deleted messages."""
+        outdated = [
+            (message_id, reply)
+            for message_id, (reply, text) in replies.items()
+            if texts.get(message_id, text) != text
+        ]
+        await asyncio.gather(
+            *(
+                context.bot.edit_message_text(
+                    chat_id=chat_id,
+                    message_id=reply.msg_id,
+                    text=texts[message_id],
+                    parse_mode="HTML",
                 )
-                sent_cnt += 1
-            except telegram.error.BadRequest as e:
-                if "Replied message not found" in str(e):
-                    continue
-                raise
+                for message_id, reply in outdated
+            )
+        )
+        for message_id, reply in outdated:
+            replies[message_id] = (reply, texts[message_id])
+
+
+def _format_size(size: float) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
 
-            if sent_cnt >= requested_messages_cnt:
-                break
+
+class DbStatsCommandHandler(CommandHandler):
+    description = "Show the statistics of the database."
+    usage = "/dbstats"
+    admin_only = True
+
+    @staticmethod
+    def format_statements() -> list[str]:
+        if not get_settings().db_trace:
+            return ["Statement tracing is off, enable it with db_trace."]
+
+        timings = sorted(
+            db.statement_timings().items(), key=lambda item: item[1].total, reverse=True
+        )
+        lines = []
+        for i, (sql, t) in enumerate(timings[:DBSTATS_TOP_STATEMENTS], start=1):
+            name = db.QUERY_NAMES.get(sql, sql[:60])
+            lines.append(
+                f"{i}. {name}: {t.count}x, {t.total * 1000:.1f} ms total, "
+                f"{t.mean * 1000:.2f} ms mean, {t.max * 1000:.1f} ms max"
+            )
+        return lines
+
+    @staticmethod
+    def format_storage(stats: db.DatabaseStats) -> list[str]:
+        if stats.objects is None:
+            lines = [
+                "Not available, sqlite is built without SQLITE_ENABLE_DBSTAT_VTAB."
+            ]
+        else:
+            lines = [
+                f"{name}{'' if kind == 'table' else f' ({kind} on {table})'}: "
+                f"{_format_size(size)}"
+                for name, kind, table, size in stats.objects
+            ]
+
+        db_size = stats.page_count * stats.page_size
+        if stats.cache_size < 0:
+            cache_size = -stats.cache_size * 1024
+        else:
+            cache_size = stats.cache_size * stats.page_size
+        cached = min(1.0, cache_size / db_size) if db_size else 1.0
+        lines += [
+            "",
+            f"Database: {_format_size(db_size)}, "
+            f"{_format_size(stats.freelist_count * stats.page_size)} free",
+            f"Page cache: {_format_size(cache_size)} per connection, "
+            f"{cached:.0%} of the database fits",
+            # sqlite3_db_status() has no binding in the sqlite3 module
+            "Page cache hit rates: not available from the sqlite3 module",
+            f"Memory map: {_format_size(stats.mmap_size)}",
+        ]
+        return lines
+
+    @classmethod
+    async def _handler(cls, update: Update, context: CallbackContext) -> None:
+        if context.args:
+            raise UsageError()
+        if get_settings().storage_backend != "sqlite":
+            raise UsageError("Only the sqlite storage has statistics.")
+
+        stats = await db.database_stats()
+        text = "\n".join(
+            [
+                "Top statements by total time:",
+                *cls.format_statements(),
+                "",
+                "Tables and indexes:",
+                *cls.format_storage(stats),
+            ]
+        )
+        await send_reply(
+            update, context, f"<pre>{html.escape(text)}</pre>", save_to_db=True
+        )
 
 
 class HelpCommandHandler(CommandHandler):
@@ -277,7 +571,7 @@ class HelpCommandHandler(CommandHandler):
     def get_help_for_commands() -> str:
         return "\n".join(
             f"{i}. `{command.name()}` - {command.description}\nUsage: `{command.usage}`"
-            for i, command in enumerate(COMMANDS, start=1)
+            for i, command in enumerate(PUBLIC_COMMANDS, start=1)
         )
 
     @classmethod
@@ -316,3 +610,4 @@ class HelpCommandHandler(CommandHandler):
 
 
 COMMANDS: list[Type[CommandHandler]] = CommandHandler.__subclasses__()
+PUBLIC_COMMANDS = [command for command in COMMANDS if not command.admin_only]
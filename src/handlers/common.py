@@ -1,19 +1,16 @@
 from __future__ import annotations
 
+import time
+
 from typing import Any
 
 from telegram import Bot, InlineKeyboardMarkup, Update
 from telegram.ext import CallbackContext
 
 from src import constants
-from src.db import get_conn
 from src.logger import get_default_logger
-from src.message_wrapper import MsgWrapper
-from src.utils import hash_string
-
-
-def make_msg_id(msg_id: int, chat_id: int) -> int:
-    return hash_string(f"{abs(chat_id)}:{abs(msg_id)}")
+from src.message_wrapper import MsgWrapper, ParsedMessage
+from src.storage import MessageRecord, get_store
 
 
 async def send_message(
@@ -48,7 +45,7 @@ async def send_message(
     sent_msg = MsgWrapper(await bot.send_message(**base_args))
 
     if save_to_db:
-        save_message_to_db(
+        await save_message_to_db(
             sent_msg,
             is_ranking=is_ranking,
             is_bot_reaction=is_bot_reaction,
@@ -87,30 +84,39 @@ async def send_reply(
     return reply_msg
 
 
-def save_message_to_db(
-    msg: MsgWrapper,
+def make_message_record(
+    msg: MsgWrapper | ParsedMessage,
     *,
     is_bot_reaction: bool = False,
     is_ranking: bool = False,
     is_anon: bool = False,
-) -> None:
-    get_default_logger().info("Savin message to db")
-    sql = (
-        "INSERT INTO message (id, original_id, author_id, author, chat_id, parent, is_bot_reaction, is_ranking, is_anon) "
-        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);"
+) -> MessageRecord:
+    return MessageRecord(
+        chat_id=msg.chat_id,
+        message_id=msg.msg_id,
+        author_id=msg.author_id,
+        author=msg.author,
+        parent_id=msg.parent,
+        timestamp=time.time_ns(),
+        is_bot_reaction=is_bot_reaction,
+        is_ranking=is_ranking,
+        is_anon=is_anon,
     )
-    with get_conn() as conn:
-        conn.execute(
-            sql,
-            (
-                make_msg_id(msg.msg_id, msg.chat_id),
-                msg.msg_id,
-                msg.author_id,
-                msg.author,
-                msg.chat_id,
-                None if msg.parent is None else make_msg_id(msg.parent, msg.chat_id),
-                is_bot_reaction,
-                is_ranking,
-                is_anon,
-            ),
+
+
+async def save_message_to_db(
+    msg: MsgWrapper | ParsedMessage,
+    *,
+    is_bot_reaction: bool = False,
+    is_ranking: bool = False,
+    is_anon: bool = False,
+) -> None:
+    get_default_logger().info("Saving message to db", extra={"event": "message_saved"})
+    await get_store().save_message(
+        make_message_record(
+            msg,
+            is_bot_reaction=is_bot_reaction,
+            is_ranking=is_ranking,
+            is_anon=is_anon,
         )
+    )
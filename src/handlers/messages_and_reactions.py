@@ -1,69 +1,46 @@
 from __future__ import annotations
 
-import asyncio
+import json
 import time
 
-from collections import defaultdict
 from typing import Any
 
 from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.error import BadRequest
 from telegram.ext import CallbackContext
 
 from src import constants
-from src.db import get_conn
-from src.handlers.common import make_msg_id, save_message_to_db, send_message
+from src.deletion_queue import get_deletion_queue
+from src.handlers.commands import show_ranking_page
+from src.handlers.common import make_message_record, save_message_to_db, send_message
+from src.keyed_lock import MESSAGE_LOCKS
 from src.logger import get_default_logger
-from src.message_wrapper import MsgWrapper
+from src.message_wrapper import MessageKind, MsgWrapper, ParsedMessage, parse_message
+from src.metrics import measured_handler
+from src.reaction_state import ReactionState, get_reaction_states
+from src.render_scheduler import get_render_scheduler
 from src.settings import get_settings
+from src.storage import ReactionCount
+from src.timings import gather_steps, timed
 from src.utils import (
-    extract_anon_message_text,
     get_name_from_author_obj,
     get_reaction_representation,
+    hash_string,
     split_into_chunks,
 )
 
 MAX_REACTIONS_DISPLAYED_PER_LINE = 4
 
-TextCountTime = tuple[str, int, int]
-
-
-def get_show_reaction_stats_button(
-    chat_id: int, parent_id: int
-) -> InlineKeyboardButton:
-    with get_conn() as conn:
-        reactions_post_id_opt = list(
-            conn.execute(
-                "SELECT id from message where parent=? and is_bot_reaction",
-                (make_msg_id(parent_id, chat_id),),
-            ).fetchall()
-        )
-        if reactions_post_id_opt:
-            expanded = conn.execute(
-                "SELECT expanded from message where id=?;",
-                (reactions_post_id_opt[0][0],),
-            ).fetchone()[0]
-        else:
-            expanded = False
 
+def get_show_reaction_stats_button(expanded: bool) -> InlineKeyboardButton:
     show_hide = "hide" if expanded else "show"
     return InlineKeyboardButton(
         constants.INFORMATION_EMOJI, callback_data=show_hide + "_reactions"
     )
 
 
-def fetch_detailed_reactions_list_for_msg(msg_id: int) -> list[TextCountTime]:
-    with get_conn() as conn:
-        ret = conn.execute(
-            "select type, cnt, (select min(timestamp) from reaction where parent=? and type=subq.type) as time "
-            "from (SELECT type, count(*) as cnt from reaction where parent=? group by type) as subq "
-            "order by -cnt, time",
-            (msg_id, msg_id),
-        )
-        return list(ret.fetchall())
-
-
 def get_markup_displaying_reactions(
-    parent_id: int, chat_id: int, reactions: list[TextCountTime]
+    state: ReactionState, reactions: list[ReactionCount]
 ) -> InlineKeyboardMarkup:
     markup = [
         InlineKeyboardButton(
@@ -73,7 +50,7 @@ def get_markup_displaying_reactions(
     ]
 
     if get_settings().show_summary_button:
-        markup.append(get_show_reaction_stats_button(chat_id, parent_id))
+        markup.append(get_show_reaction_stats_button(state.expanded))
 
     return InlineKeyboardMarkup(
         inline_keyboard=split_into_chunks(markup, MAX_REACTIONS_DISPLAYED_PER_LINE),
@@ -90,106 +67,97 @@ async def update_message_markup(
     )
 
 
-def get_text_for_expanded(
-    parent: int, chat_id: int, reactions: list[TextCountTime]
-) -> str:
-    msg_id = make_msg_id(parent, chat_id)
-
-    ordered_reactions = [(r[0], r[1]) for r in reactions]
-
-    with get_conn() as conn:
-        ret = conn.execute(
-            "SELECT type, author from reaction where parent=?;",
-            (msg_id,),
-        )
-        reactions_with_autors = defaultdict(list)
-        for r in ret.fetchall():
-            reactions_with_autors[r[0]].append(r[1])
-
+def get_text_for_expanded(state: ReactionState, reactions: list[ReactionCount]) -> str:
     return "\n".join(
         get_reaction_representation(reaction, count)
         + ": "
-        + ", ".join(reactions_with_autors[reaction])
-        for reaction, count in ordered_reactions
+        + ", ".join(state.authors(reaction))
+        for reaction, count, _ in reactions
     )
 
 
-async def add_delete_or_update_reaction_msg(
-    bot: Bot, parent_id: int, chat_id: int
-) -> None:
-    parent_msg_id = make_msg_id(parent_id, chat_id)
-
-    with get_conn() as conn:
-        opt_reactions_msg_id = list(
-            conn.execute(
-                "SELECT original_id, expanded "
-                "from message "
-                "where parent=? and is_bot_reaction",
-                (parent_msg_id,),
-            ).fetchall()
-        )
+def render_reactions_msg(
+    state: ReactionState, reactions: list[ReactionCount]
+) -> tuple[str, InlineKeyboardMarkup]:
+    if state.expanded:
+        text = get_text_for_expanded(state, reactions)
+    else:
+        text = constants.EMPTY_MSG
+    return text, get_markup_displaying_reactions(state, reactions)
+
 
-    reactions = fetch_detailed_reactions_list_for_msg(parent_msg_id)
-    reactions_markups = get_markup_displaying_reactions(
-        parent_id, chat_id, reactions=reactions
+def get_render_hash(text: str, markup: InlineKeyboardMarkup) -> int:
+    return hash_string(
+        text + json.dumps(markup.to_dict(), ensure_ascii=False, sort_keys=True)
     )
 
-    NO_REACTIONS = 1 if get_settings().show_summary_button else 0
-    if len(reactions_markups.inline_keyboard[0]) == NO_REACTIONS:
-        # removed last reaction
-        with get_conn() as conn:
-            conn.execute(
-                "DELETE from message where parent=? and is_bot_reaction",
-                (parent_msg_id,),
-            )
-        await remove_message_with_retries(bot, chat_id, opt_reactions_msg_id[0][0])
-    elif not opt_reactions_msg_id:
-        # adding new reactions msg
-        await send_message(
-            bot,
-            chat_id,
-            parent_id=parent_id,
-            markup=reactions_markups,
-            save_to_db=True,
-            is_bot_reaction=True,
-        )
-    else:
-        # updating existing reactions post
-        # if expanded update text
-        if opt_reactions_msg_id[0][1]:
+
+async def edit_reactions_msg(
+    bot: Bot, state: ReactionState, reactions: list[ReactionCount], with_text: bool
+) -> None:
+    """Update the bot reaction message, unless it already shows the same.
+
+    The markup alone is sent unless ``with_text``, otherwise both go in one call.
+    """
+    assert state.bot_message_id is not None
+    text, markup = render_reactions_msg(state, reactions)
+    render_hash = get_render_hash(text, markup)
+    if render_hash == state.render_hash:
+        return
+
+    try:
+        if with_text:
             await bot.edit_message_text(
-                chat_id=chat_id,
-                message_id=opt_reactions_msg_id[0][0],
-                text=get_text_for_expanded(parent_id, chat_id, reactions=reactions),
+                chat_id=state.chat_id,
+                message_id=state.bot_message_id,
+                text=text,
                 parse_mode="HTML",
+                reply_markup=markup,
             )
+        else:
+            await update_message_markup(
+                bot, state.chat_id, state.bot_message_id, markup
+            )
+    except BadRequest as e:
+        # the hash wasn't saved yet, but the message already shows this rendering
+        if "not modified" not in e.message:
+            raise
 
-        await update_message_markup(
-            bot, chat_id, opt_reactions_msg_id[0][0], reactions_markups
-        )
+    get_reaction_states().set_render_hash(state, render_hash)
 
 
-def add_single_reaction_to_db(
-    parent: int, author: str, author_id: int, text: str, timestamp: int
-) -> None:
-    get_default_logger().info("Handling add/remove reaction")
-    with get_conn() as conn:
-        ret = conn.execute(
-            "SELECT id from reaction where parent=? and author_id=? and type=?;",
-            (parent, author_id, text),
+async def add_delete_or_update_reaction_msg(bot: Bot, state: ReactionState) -> None:
+    chat_id = state.chat_id
+    reactions = state.counts()
+
+    if not reactions:
+        # removed last reaction
+        if state.bot_message_id is not None:
+            get_deletion_queue().enqueue(chat_id, state.bot_message_id)
+            get_reaction_states().set_bot_message(state, None)
+    elif state.bot_message_id is None:
+        # adding new reactions msg
+        markup = get_markup_displaying_reactions(state, reactions)
+        sent_msg = await send_message(
+            bot, chat_id, parent_id=state.parent_id, markup=markup
+        )
+        get_reaction_states().set_bot_message(
+            state,
+            make_message_record(sent_msg, is_bot_reaction=True),
+            get_render_hash(constants.EMPTY_MSG, markup),
         )
-        reaction_exists = list(ret.fetchall())
+    else:
+        # updating existing reactions post
+        # the text changes only when expanded
+        await edit_reactions_msg(bot, state, reactions, with_text=state.expanded)
 
-        if reaction_exists:
-            get_default_logger().info("deleting")
-            conn.execute("DELETE from reaction where id=?;", (reaction_exists[0][0],))
-        else:
-            get_default_logger().info("adding")
-            sql = (
-                "INSERT INTO reaction (parent, author, type, author_id, timestamp) "
-                "VALUES (?, ?, ?, ?, ?);"
-            )
-            conn.execute(sql, (parent, author, text, author_id, timestamp))
+
+async def render_reaction_msg(bot: Bot, chat_id: int, parent_id: int) -> None:
+    async with MESSAGE_LOCKS.hold((chat_id, parent_id)):
+        with timed("render_reactions"):
+            # the state could have been evicted and reloaded since the reaction
+            state = await get_reaction_states().get(chat_id, parent_id)
+            await add_delete_or_update_reaction_msg(bot, state)
 
 
 async def toggle_reaction(
@@ -200,180 +168,159 @@ async def toggle_reaction(
     author_id: int,
     chat_id: int,
 ) -> None:
-    for r in reactions:
-        add_single_reaction_to_db(
-            make_msg_id(parent, chat_id), author, author_id, r, time.time_ns()
-        )
-
-    await add_delete_or_update_reaction_msg(bot, parent, chat_id)
-
-
-async def remove_message_with_retries(
-    bot: Bot, chat_id: int, message_id: int, tries: int = 3
-) -> None:
-    assert tries > 0
-
-    try:
-        await bot.delete_message(chat_id=chat_id, message_id=message_id)
-    except Exception as e:  # Not sure if all exceptions should be caught here
-        if tries > 1:
-            # TODO convert to jobqueue
-            time_to_wait_before_retry = 0.025
-            await asyncio.sleep(time_to_wait_before_retry)
-            await remove_message_with_retries(bot, chat_id, message_id, tries - 1)
+    get_default_logger().info(
+        "Handling add/remove reaction", extra={"event": "reaction_toggled"}
+    )
+    # The lock key is the resolved parent, so the relayed parent lookup of
+    # handler_receive_message happens before it is held and concurrent
+    # toggles may take the lock in another order than they arrived in.
+    # That's fine: toggles of the same author and type cancel out in any
+    # order, the others are independent.
+    with timed("toggle_reaction"):
+        async with MESSAGE_LOCKS.hold((chat_id, parent)):
+            await get_reaction_states().toggle(
+                chat_id, parent, author_id, author, reactions, time.time_ns()
+            )
 
-        raise Exception(
-            f"Failed to delete message(id={message_id}, chat_id={chat_id})"
-        ) from e
+    # bursts of reactions result in a single update of the reactions message
+    get_render_scheduler().schedule(
+        (chat_id, parent), lambda: render_reaction_msg(bot, chat_id, parent)
+    )
 
 
-async def repost_anon_message(context: CallbackContext, msg: MsgWrapper) -> None:
+async def repost_anon_message(context: CallbackContext, msg: ParsedMessage) -> None:
     # first remove the original message
-    await remove_message_with_retries(context.bot, msg.chat_id, msg.msg_id)
+    get_deletion_queue().enqueue(msg.chat_id, msg.msg_id)
     # then send a message with the same content
-    extracted_anon_text = extract_anon_message_text(msg.text)
-    assert extracted_anon_text is not None
-    anonimized_text = get_settings().anon_msg_prefix + extracted_anon_text
-    await send_message(
-        context.bot,
-        msg.chat_id,
-        parent_id=msg.parent,
-        text=anonimized_text,
-        is_anon=True,
-        save_to_db=True,
-    )
+    assert msg.anon_text is not None
+    anonimized_text = get_settings().anon_msg_prefix + msg.anon_text
+    with timed("repost_anon"):
+        await send_message(
+            context.bot,
+            msg.chat_id,
+            parent_id=msg.parent,
+            text=anonimized_text,
+            is_anon=True,
+            save_to_db=True,
+        )
 
 
+@measured_handler("receive_message")
 async def handler_receive_message(update: Update, context: CallbackContext) -> None:
-    get_default_logger().info("Message received")
+    get_default_logger().info("Message received", extra={"event": "message_received"})
     if update.edited_message:
         # skip edits
         return
 
     assert update.message is not None
-    msg = MsgWrapper(update.message)
+    msg = parse_message(update.message)
 
-    if msg.chat_id in get_settings().silenced_chats:
-        save_message_to_db(msg)
+    if msg.kind == MessageKind.SILENCED:
+        await save_message_to_db(msg)
         get_default_logger().info("ignoring message from silenced chat")
         return
 
-    if msg.is_anon_message:
+    if msg.kind == MessageKind.ANON:
         await repost_anon_message(context, msg)
         return
 
-    if msg.parent is None or not msg.is_reaction_msg:
-        save_message_to_db(msg)
+    if msg.kind != MessageKind.REACTION:
+        await save_message_to_db(msg)
     else:
         parent = msg.parent
         assert parent is not None
 
-        get_default_logger().info("removing the reaction message")
-        await remove_message_with_retries(context.bot, msg.chat_id, msg.msg_id)
+        get_default_logger().info(
+            "removing the reaction message", extra={"event": "reaction_received"}
+        )
+        get_deletion_queue().enqueue(msg.chat_id, msg.msg_id)
 
         # Replying to a bot reaction msg is relayed to its parent
-        with get_conn() as conn:
-            opt_parent = list(
-                conn.execute(
-                    "SELECT parent from message where id=? and is_bot_reaction",
-                    (make_msg_id(parent, msg.chat_id),),
-                ).fetchall()
+        with timed("relayed_parent"):
+            relayed_parent = await get_reaction_states().get_relayed_parent(
+                msg.chat_id, parent
             )
-            if opt_parent:
-                parent = conn.execute(
-                    "SELECT original_id from message where id=?",
-                    (opt_parent[0][0],),
-                ).fetchone()[0]
+        if relayed_parent is not None:
+            parent = relayed_parent
 
         await toggle_reaction(
             context.bot,
             parent,
             msg.author,
-            msg.get_reactions_list,
+            list(msg.reactions),
             msg.author_id,
             msg.chat_id,
         )
 
 
+@measured_handler("save_message")
 async def handler_save_msg_to_db(update: Update, context: CallbackContext) -> None:
-    get_default_logger().info("Picture or sticker received")
+    get_default_logger().info(
+        "Picture or sticker received", extra={"event": "message_received"}
+    )
     assert update.message is not None
-    save_message_to_db(MsgWrapper(update.message))
+    await save_message_to_db(MsgWrapper(update.message))
 
 
 async def toggle_expanded_reactions_description(
     bot: Bot, cmd: str, parent_id: int, reaction_post_id: int, chat_id: int
 ) -> None:
-    reaction_msg_id = make_msg_id(reaction_post_id, chat_id)
-
-    with get_conn() as conn:
-        is_expanded = conn.execute(
-            "select expanded from message where id=?;", (reaction_msg_id,)
-        ).fetchone()[0]
-
-        if (cmd == "show_reactions" and is_expanded) or (
-            cmd == "hide_reactions" and not is_expanded
-        ):
-            # cant show/hide already shown/hidden
-            # race condition may produce multiple show/hide commands in a row
-            return
-
-    reactions = fetch_detailed_reactions_list_for_msg(make_msg_id(parent_id, chat_id))
-
-    if cmd == "show_reactions":
-        new_text = get_text_for_expanded(parent_id, chat_id, reactions=reactions)
-        with get_conn() as conn:
-            conn.execute(
-                "UPDATE message SET expanded=TRUE where id=?;",
-                (reaction_msg_id,),
-            )
-    else:
-        new_text = constants.EMPTY_MSG
-        with get_conn() as conn:
-            conn.execute(
-                "UPDATE message SET expanded=FALSE where id=?;",
-                (reaction_msg_id,),
-            )
-
-    await bot.edit_message_text(
-        chat_id=chat_id, message_id=reaction_post_id, text=new_text, parse_mode="HTML"
-    )
-    reactions_markups = get_markup_displaying_reactions(
-        parent_id, chat_id, reactions=reactions
-    )
-    await update_message_markup(bot, chat_id, reaction_post_id, reactions_markups)
-
-
-async def handler_button_callback(update: Update, context: CallbackContext) -> None:
-    assert update.callback_query is not None
-    callback_query = update.callback_query
-    callback_data = callback_query.data
-    assert isinstance(callback_data, str)
-    assert callback_query.message is not None
-    parent_msg = MsgWrapper(callback_query.message)
-    callback_query_data: Any = update["callback_query"]
-    author = get_name_from_author_obj(callback_query_data["from_user"])
-    author_id = callback_query_data["from_user"]["id"]
+    states = get_reaction_states()
+    # rendering the reactions of the message holds the same lock,
+    # so the edits are sent in the order of the state changes
+    async with MESSAGE_LOCKS.hold((chat_id, parent_id)):
+        with timed("toggle_expanded"):
+            state = await states.get(chat_id, parent_id)
+            if state.bot_message_id != reaction_post_id:
+                # a button of a reactions message replaced in the meantime,
+                # the callback query is answered by the handler either way
+                get_default_logger().info(
+                    "Stale reactions message(id=%d, chat_id=%d)",
+                    reaction_post_id,
+                    chat_id,
+                    extra={"event": "button_pressed"},
+                )
+                return
+
+            if (cmd == "show_reactions" and state.expanded) or (
+                cmd == "hide_reactions" and not state.expanded
+            ):
+                # cant show/hide already shown/hidden
+                # the button may be pressed again before the message is updated
+                return
+
+            states.set_expanded(state, cmd == "show_reactions")
+            await edit_reactions_msg(bot, state, state.counts(), with_text=True)
+
+
+async def answer_callback_query(bot: Bot, callback_query_id: str) -> None:
+    with timed("answer_callback_query"):
+        await bot.answer_callback_query(callback_query_id)
+
+
+async def handle_button(
+    bot: Bot, callback_data: str, parent_msg: MsgWrapper, author: str, author_id: int
+) -> None:
     chat_id = parent_msg.chat_id
-
-    get_default_logger().info(f"button: {callback_data}, {author}\nUpdate: {update}")
-
-    if callback_data.endswith("reactions"):
+    if callback_data.startswith(constants.RANKING_PAGE_PREFIX):
+        await show_ranking_page(bot, parent_msg, callback_data)
+    elif callback_data.endswith("reactions"):
         assert parent_msg.parent is not None
         await toggle_expanded_reactions_description(
-            context.bot, callback_data, parent_msg.parent, parent_msg.msg_id, chat_id
+            bot, callback_data, parent_msg.parent, parent_msg.msg_id, chat_id
         )
     elif callback_data.endswith("__delete"):
         assert parent_msg.parent is not None
         try:
             msg_id = int(callback_data.split("__")[0])
-            await remove_message_with_retries(context.bot, chat_id, msg_id)
-        except Exception as e:
-            get_default_logger().error(f"Failed to delete message: {e}")
+        except ValueError as e:
+            get_default_logger().error("Failed to delete message: %s", e)
+        else:
+            get_deletion_queue().enqueue(chat_id, msg_id)
     else:
         assert parent_msg.parent is not None
         await toggle_reaction(
-            context.bot,
+            bot,
             parent=parent_msg.parent,
             author=author,
             reactions=[callback_data],
@@ -381,4 +328,28 @@ async def handler_button_callback(update: Update, context: CallbackContext) -> N
             chat_id=chat_id,
         )
 
-    await context.bot.answer_callback_query(update.callback_query.id)
+
+@measured_handler("button_callback")
+async def handler_button_callback(update: Update, context: CallbackContext) -> None:
+    assert update.callback_query is not None
+    callback_query = update.callback_query
+    callback_data = callback_query.data
+    assert isinstance(callback_data, str)
+    assert callback_query.message is not None
+    parent_msg = MsgWrapper(callback_query.message)
+    callback_query_data: Any = update["callback_query"]
+    author = get_name_from_author_obj(callback_query_data["from_user"])
+    author_id = callback_query_data["from_user"]["id"]
+
+    logger = get_default_logger()
+    logger.info(
+        "button: %s, %s", callback_data, author, extra={"event": "button_pressed"}
+    )
+    # formatted only when debug logging is enabled
+    logger.debug("Update: %s", update, extra={"event": "button_pressed"})
+
+    # the button stops spinning as soon as possible, independently of the update
+    await gather_steps(
+        handle_button(context.bot, callback_data, parent_msg, author, author_id),
+        answer_callback_query(context.bot, callback_query.id),
+    )
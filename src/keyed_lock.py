@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import asyncio
+
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Hashable
+
+__all__ = (
+    "KeyedLock",
+    "MESSAGE_LOCKS",
+    "CHAT_LOCKS",
+)
+
+
+class KeyedLock:
+    """Serializes the coroutines holding the same key, in the order of arrival.
+
+    Coroutines holding different keys run concurrently. The lock of a key
+    exists only while someone holds or waits for it.
+    """
+
+    _locks: dict[Hashable, asyncio.Lock]
+    # number of coroutines holding or waiting for the lock of a key
+    _users: dict[Hashable, int]
+
+    def __init__(self) -> None:
+        self._locks = {}
+        self._users = {}
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable) -> AsyncIterator[None]:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._users[key] = self._users.get(key, 0) + 1
+
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key]
+                del self._locks[key]
+
+
+# (chat id, parent message id): reactions to a message and its bot reaction message
+MESSAGE_LOCKS = KeyedLock()
+# chat id: commands
+CHAT_LOCKS = KeyedLock()
@@ -1,30 +1,119 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
+import random
+
+from typing import Any
 
 from src.settings import Settings, get_settings
 
 __all__ = (
     "get_logger",
     "get_default_logger",
+    "stop_logging",
+    "JsonFormatter",
+    "SamplingFilter",
 )
 
-LOGGER = None
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+LOGGER: logging.Logger | None = None
+LISTENER: logging.handlers.QueueListener | None = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict[str, Any] = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        event = getattr(record, "event", None)
+        if event is not None:
+            entry["event"] = event
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps only a fraction of the records of frequent events.
+
+    The event of a record is given with ``extra={"event": ...}``, records of
+    the events without a rate are all kept.
+    """
+
+    rates: dict[str, float]
+
+    def __init__(self, rates: dict[str, float]) -> None:
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(getattr(record, "event", ""), 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class _EnqueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the records never leave the process, so unlike the base class
+        # the message is formatted later, by the listener thread
+        return record
 
 
 def get_logger(settings: Settings) -> logging.Logger:
-    global LOGGER
+    """Log to the log file and stderr from a background thread.
+
+    The caller only puts the record on a queue, the formatting and the
+    writes happen in the listener thread.
+    """
+    global LOGGER, LISTENER
 
     if LOGGER:
         return LOGGER
 
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        handlers=[logging.FileHandler(settings.log_file), logging.StreamHandler()],
-    )
+    formatter: logging.Formatter
+    if settings.log_format == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+    handlers: list[logging.Handler] = [
+        logging.FileHandler(settings.log_file),
+        logging.StreamHandler(),
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    queue_handler = _EnqueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(settings.log_sampling))
+
+    root = logging.getLogger()
+    root.setLevel(settings.log_level)
+    root.addHandler(queue_handler)
+    for name, level in settings.log_levels.items():
+        logging.getLogger(name).setLevel(level)
+
+    LISTENER = logging.handlers.QueueListener(log_queue, *handlers)
+    LISTENER.start()
+    atexit.register(stop_logging)
 
     LOGGER = logging.getLogger("pyreactions_bot")
     return LOGGER
 
 
+def stop_logging() -> None:
+    """Write out the queued records and stop the listener thread."""
+    global LISTENER
+    if LISTENER is not None:
+        LISTENER.stop()
+        LISTENER = None
+
+
 def get_default_logger() -> logging.Logger:
     return get_logger(get_settings())
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-from typing import cast
+from enum import Enum
+from typing import NamedTuple, cast
 
 from telegram import Message as TelegramMessage
 
@@ -13,13 +14,19 @@ from src.settings import get_settings
 from src.utils import (
     extract_anon_message_text,
     extract_custom_reaction,
-    find_emojis_in_str,
     get_name_from_author_obj,
     is_disallowed_reaction,
-    remove_emojis_from_text,
+    split_emojis,
     unique_list,
 )
 
+__all__ = (
+    "MsgWrapper",
+    "MessageKind",
+    "ParsedMessage",
+    "parse_message",
+)
+
 
 class MsgWrapper:
     msg: TelegramMessage
@@ -46,71 +53,6 @@ class MsgWrapper:
             return cast(int, self.msg.reply_to_message.message_id)
         return None
 
-    @property
-    def is_reaction_msg(self) -> bool:
-        return (
-            self.is_simple_emoji_or_textual_reaction
-            or self.is_multiple_reactions
-            or self.is_custom_reaction
-        )
-
-    @property
-    def is_anon_message(self) -> bool:
-        return get_settings().anon_messages_allowed and bool(
-            extract_anon_message_text(self.text)
-        )
-
-    @property
-    def is_simple_emoji_or_textual_reaction(self) -> bool:
-        if is_disallowed_reaction(self.text):
-            return False
-        if len(self.text) == 1 or self.text in TEXTUAL_REACTIONS:
-            return True
-
-        found_reactions = find_emojis_in_str(self.text)
-        return (
-            len(found_reactions) == 1 and not remove_emojis_from_text(self.text).strip()
-        )
-
-    @property
-    def is_multiple_reactions(self) -> bool:
-        found_reactions = find_emojis_in_str(self.text)
-        if any(is_disallowed_reaction(r) for r in found_reactions):
-            return False
-
-        return (
-            REACTIONS_IN_SINGLE_MSG_LIMIT >= len(found_reactions) > 1
-            and not remove_emojis_from_text(self.text).strip()
-        )
-
-    @property
-    def is_custom_reaction(self) -> bool:
-        if not get_settings().custom_text_reaction_allowed:
-            return False
-
-        return bool(extract_custom_reaction(self.text))
-
-    @property
-    def get_reactions_list(self) -> list[str]:
-        if self.is_simple_emoji_or_textual_reaction:
-            return [self.text]
-        elif self.is_multiple_reactions:
-            return unique_list(find_emojis_in_str(self.text))
-        elif self.is_custom_reaction:
-            return [cast(str, extract_custom_reaction(self.text))]
-        else:
-            raise ValueError("Can't extract reaction")
-
-    @property
-    def text(self) -> str:
-        assert self.msg.text is not None
-        lower_text = self.msg.text.lower()
-
-        if lower_text in TEXTUAL_NORMALIZATION:
-            return TEXTUAL_NORMALIZATION[lower_text]
-
-        return cast(str, self.msg.text.strip())
-
     @property
     def author(self) -> str:
         return get_name_from_author_obj(cast(dict, self.msg["from_user"]))
@@ -119,3 +61,90 @@ class MsgWrapper:
     def author_id(self) -> int:
         assert self.msg.from_user is not None
         return cast(int, self.msg.from_user.id)
+
+
+class MessageKind(Enum):
+    # sent in a silenced chat, only saved
+    SILENCED = "silenced"
+    ANON = "anon"
+    REACTION = "reaction"
+    PLAIN = "plain"
+
+
+class ParsedMessage(NamedTuple):
+    """A received text message, classified once by ``parse_message``."""
+
+    kind: MessageKind
+    msg_id: int
+    chat_id: int
+    parent: int | None
+    author_id: int
+    author: str
+    # stripped or normalized text
+    text: str
+    # REACTION only: the reactions, without duplicates
+    reactions: tuple[str, ...] = ()
+    # ANON only: the text to repost
+    anon_text: str | None = None
+
+
+def _normalize_text(text: str) -> str:
+    return TEXTUAL_NORMALIZATION.get(text.lower(), text.strip())
+
+
+def _find_reactions(text: str) -> list[str] | None:
+    """The reactions in a reply, or None if it isn't a reaction message."""
+    # a single emoji or textual reaction
+    simple_allowed = not is_disallowed_reaction(text)
+    if simple_allowed and (len(text) == 1 or text in TEXTUAL_REACTIONS):
+        return [text]
+
+    # only emojis, found in a single scan
+    emojis, residual = split_emojis(text)
+    if emojis and not residual.strip():
+        if len(emojis) == 1 and simple_allowed:
+            return [text]
+        if REACTIONS_IN_SINGLE_MSG_LIMIT >= len(emojis) > 1 and not any(
+            is_disallowed_reaction(r) for r in emojis
+        ):
+            return unique_list(emojis)
+
+    if get_settings().custom_text_reaction_allowed:
+        custom_reaction = extract_custom_reaction(text)
+        if custom_reaction:
+            return [custom_reaction]
+
+    return None
+
+
+def parse_message(msg: TelegramMessage) -> ParsedMessage:
+    wrapper = MsgWrapper(msg)
+    assert msg.text is not None
+    text = _normalize_text(msg.text)
+    parsed = ParsedMessage(
+        MessageKind.PLAIN,
+        wrapper.msg_id,
+        wrapper.chat_id,
+        wrapper.parent,
+        wrapper.author_id,
+        wrapper.author,
+        text,
+    )
+
+    settings = get_settings()
+    if parsed.chat_id in settings.silenced_chats:
+        return parsed._replace(kind=MessageKind.SILENCED)
+
+    if settings.anon_messages_allowed:
+        anon_text = extract_anon_message_text(text)
+        if anon_text:
+            return parsed._replace(kind=MessageKind.ANON, anon_text=anon_text)
+
+    # most messages aren't replies, those never need the emoji scan
+    if parsed.parent is None:
+        return parsed
+
+    reactions = _find_reactions(text)
+    if reactions is None:
+        return parsed
+    return parsed._replace(kind=MessageKind.REACTION, reactions=tuple(reactions))
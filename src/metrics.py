@@ -0,0 +1,358 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import functools
+import math
+import threading
+import time
+
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Coroutine, Iterator, TypeVar, cast
+
+from telegram.ext import AIORateLimiter
+
+from src.logger import get_default_logger
+from src.settings import get_settings
+
+__all__ = (
+    "Counter",
+    "Histogram",
+    "CallbackMetric",
+    "render_metrics",
+    "measure_handler",
+    "measured_handler",
+    "MeasuredRateLimiter",
+    "start_metrics_server",
+    "stop_metrics_server",
+    "HANDLER_DURATION",
+    "HANDLER_ERRORS",
+    "QUERY_DURATION",
+    "API_DURATION",
+    "API_ERRORS",
+    "RATE_LIMITER_WAIT",
+)
+
+Labels = tuple[str, ...]
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+REQUEST_TIMEOUT = 5.0
+
+# all the metrics, in the order of the exposition
+METRICS: list[Metric] = []
+METRICS_SERVER: asyncio.Server | None = None
+
+
+def _format_labels(names: Labels, values: Labels) -> str:
+    if not names:
+        return ""
+    escaped = (
+        v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values
+    )
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class Metric(ABC):
+    """A metric in the Prometheus text format, registered on creation."""
+
+    kind: str
+    name: str
+    help: str
+    label_names: Labels
+
+    def __init__(self, name: str, help: str, label_names: Labels = ()) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        METRICS.append(self)
+
+    @abstractmethod
+    def samples(self) -> Iterator[str]:
+        """The sample lines of the metric, without the HELP and TYPE header."""
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.help}\n# TYPE {self.name} {self.kind}\n"
+        return header + "".join(f"{line}\n" for line in self.samples())
+
+
+class Counter(Metric):
+    kind = "counter"
+    _values: dict[Labels, float]
+    _lock: threading.Lock
+
+    def __init__(self, name: str, help: str, label_names: Labels = ()) -> None:
+        super().__init__(name, help, label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in list(self._values.items()):
+            yield (
+                f"{self.name}{_format_labels(self.label_names, labels)} "
+                f"{_format_value(value)}"
+            )
+
+
+class Histogram(Metric):
+    """Counts of the observed values in buckets, with their sum."""
+
+    kind = "histogram"
+    buckets: tuple[float, ...]
+    # per label values: a count for every bucket and the last one for +Inf, sum
+    _values: dict[Labels, tuple[list[int], list[float]]]
+    _lock: threading.Lock
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label_names: Labels = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, label_names)
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(
+                labels, ([0] * (len(self.buckets) + 1), [0.0])
+            )
+            counts[i] += 1
+            total[0] += value
+
+    def count(self, *labels: str) -> int:
+        values = self._values.get(labels)
+        return 0 if values is None else sum(values[0])
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def samples(self) -> Iterator[str]:
+        label_names = (*self.label_names, "le")
+        with self._lock:
+            values = [
+                (labels, list(counts), total[0])
+                for labels, (counts, total) in self._values.items()
+            ]
+
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield (
+                    f"{self.name}_bucket{_format_labels(label_names, (*labels, le))}"
+                    f" {cumulative}"
+                )
+            suffix = _format_labels(self.label_names, labels)
+            yield f"{self.name}_sum{suffix} {_format_value(total)}"
+            yield f"{self.name}_count{suffix} {cumulative}"
+
+
+class CallbackMetric(Metric):
+    """A metric read from the bot's state whenever the metrics are scraped."""
+
+    read: Callable[[], dict[Labels, float]]
+
+    def __init__(
+        self,
+        name: str,
+        kind: str,
+        help: str,
+        read: Callable[[], dict[Labels, float]],
+        label_names: Labels = (),
+    ) -> None:
+        super().__init__(name, help, label_names)
+        self.kind = kind
+        self.read = read
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in self.read().items():
+            yield (
+                f"{self.name}{_format_labels(self.label_names, labels)} "
+                f"{_format_value(value)}"
+            )
+
+
+def render_metrics() -> str:
+    return "".join(metric.render() for metric in METRICS)
+
+
+HANDLER_DURATION = Histogram(
+    "bot_handler_duration_seconds", "Duration of the update handlers.", ("handler",)
+)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total", "Update handlers which raised.", ("handler",)
+)
+QUERY_DURATION = Histogram(
+    "bot_db_query_duration_seconds",
+    "Duration of the SQL statements, up to their first row.",
+    ("query",),
+)
+API_DURATION = Histogram(
+    "bot_api_request_duration_seconds",
+    "Duration of the Bot API requests, without the rate limiter wait.",
+    ("endpoint",),
+)
+API_ERRORS = Counter(
+    "bot_api_request_errors_total",
+    "Bot API requests which failed.",
+    ("endpoint", "error"),
+)
+RATE_LIMITER_WAIT = Histogram(
+    "bot_rate_limiter_wait_seconds",
+    "Time the Bot API requests were delayed by the rate limiter.",
+    ("endpoint",),
+)
+
+
+@contextmanager
+def measure_handler(handler: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        HANDLER_ERRORS.inc(handler)
+        raise
+    finally:
+        HANDLER_DURATION.observe(time.perf_counter() - start, handler)
+
+
+def measured_handler(handler: str) -> Callable[[F], F]:
+    def decorator(fn: F) -> F:
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with measure_handler(handler):
+                return await fn(*args, **kwargs)
+
+        return cast(F, wrapper)
+
+    return decorator
+
+
+class MeasuredRateLimiter(AIORateLimiter):
+    """Times every Bot API request, they all pass through the rate limiter."""
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: Any,
+        kwargs: dict[str, Any],
+        endpoint: str,
+        data: dict[str, Any],
+        rate_limit_args: int | None,
+    ) -> Any:
+        queued = time.perf_counter()
+
+        async def measured_callback(*cb_args: Any, **cb_kwargs: Any) -> Any:
+            started = time.perf_counter()
+            RATE_LIMITER_WAIT.observe(started - queued, endpoint)
+            try:
+                return await callback(*cb_args, **cb_kwargs)
+            except Exception as e:
+                API_ERRORS.inc(endpoint, type(e).__name__)
+                raise
+            finally:
+                API_DURATION.observe(time.perf_counter() - started, endpoint)
+
+        return await super().process_request(
+            measured_callback, args, kwargs, endpoint, data, rate_limit_args
+        )
+
+
+async def _serve_metrics(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+) -> None:
+    try:
+        request = await asyncio.wait_for(reader.readline(), REQUEST_TIMEOUT)
+        # the headers are not needed
+        while await asyncio.wait_for(reader.readline(), REQUEST_TIMEOUT) not in (
+            b"\r\n",
+            b"\n",
+            b"",
+        ):
+            pass
+
+        method, path, *_ = request.decode("latin-1").split() + ["", ""]
+        if method == "GET" and path.split("?")[0] == "/metrics":
+            status, body = "200 OK", render_metrics().encode()
+        else:
+            status, body = "404 Not Found", b"Not found\n"
+
+        header = (
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: {CONTENT_TYPE}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        writer.write(header.encode() + body)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server() -> None:
+    """Serve the metrics on ``settings.metrics_port``, if it is set."""
+    global METRICS_SERVER
+    settings = get_settings()
+    if settings.metrics_port is None or METRICS_SERVER is not None:
+        return
+
+    METRICS_SERVER = await asyncio.start_server(
+        _serve_metrics, settings.metrics_host, settings.metrics_port
+    )
+    get_default_logger().info(
+        "Serving metrics on %s:%d", settings.metrics_host, settings.metrics_port
+    )
+
+
+async def stop_metrics_server() -> None:
+    global METRICS_SERVER
+    if METRICS_SERVER is not None:
+        METRICS_SERVER.close()
+        await METRICS_SERVER.wait_closed()
+        METRICS_SERVER = None
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import importlib.util
+import os
+import re
+import sqlite3
+import time
+
+from typing import NamedTuple
+
+from src import constants
+
+__all__ = (
+    "Migration",
+    "load_migrations",
+    "get_schema_version",
+    "apply_migrations",
+)
+
+MIGRATION_FILENAME_PATTERN = re.compile(r"^(\d+)_(\w+)\.(sql|py)$")
+
+INSERT_SCHEMA_VERSION = (
+    "INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?);"
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    path: str
+
+
+def load_migrations(directory: str = constants.MIGRATIONS_DIR) -> list[Migration]:
+    migrations = []
+    for filename in os.listdir(directory):
+        match = MIGRATION_FILENAME_PATTERN.match(filename)
+        if match is None:
+            continue
+        migrations.append(
+            Migration(
+                int(match.group(1)), match.group(2), os.path.join(directory, filename)
+            )
+        )
+
+    migrations.sort()
+    versions = [m.version for m in migrations]
+    if len(set(versions)) != len(versions):
+        raise ValueError(f"Duplicate migration versions in {directory}")
+
+    return migrations
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS schema_version "
+        "(version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at INT NOT NULL);"
+    )
+    conn.commit()
+    version = conn.execute("SELECT max(version) from schema_version;").fetchone()[0]
+    return version or 0
+
+
+def _apply_sql_migration(conn: sqlite3.Connection, migration: Migration) -> None:
+    with open(migration.path) as f:
+        script = f.read()
+
+    conn.executescript(
+        f"BEGIN;\n{script}\n"
+        "INSERT INTO schema_version (version, name, applied_at) "
+        f"VALUES ({migration.version}, '{migration.name}', {time.time_ns()});\n"
+        "COMMIT;"
+    )
+
+
+def _apply_python_migration(conn: sqlite3.Connection, migration: Migration) -> None:
+    """Run ``migrate(conn)`` defined by the migration module.
+
+    It may commit its work in batches. Whatever it leaves uncommitted is
+    committed together with the schema version, so a migration interrupted
+    in between has to be safe to run again.
+    """
+    spec = importlib.util.spec_from_file_location(
+        f"migration_{migration.version}", migration.path
+    )
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    module.migrate(conn)
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    conn.execute(
+        INSERT_SCHEMA_VERSION, (migration.version, migration.name, time.time_ns())
+    )
+    conn.commit()
+
+
+def apply_migrations(conn: sqlite3.Connection) -> list[Migration]:
+    """Apply the pending migrations in order, each in its own transaction."""
+    current_version = get_schema_version(conn)
+
+    applied = []
+    for migration in load_migrations():
+        if migration.version <= current_version:
+            continue
+
+        try:
+            if migration.path.endswith(".py"):
+                _apply_python_migration(conn, migration)
+            else:
+                _apply_sql_migration(conn, migration)
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+
+        applied.append(migration)
+
+    return applied
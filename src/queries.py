@@ -0,0 +1,233 @@
+"""All the SQL run by the handlers.
+
+Keeping the statements in one place lets ``src.query_plan_check`` verify that
+none of them needs a full table scan.
+"""
+
+BOT_REACTION_MSG = (
+    "SELECT message_id, expanded, render_hash "
+    "from message where chat_id=? and parent=? and is_bot_reaction"
+)
+
+DELETE_BOT_REACTION_MSG = (
+    "DELETE from message where chat_id=? and parent=? and is_bot_reaction"
+)
+
+RELAYED_PARENT = (
+    "SELECT parent_msg.message_id "
+    "from message inner join message as parent_msg "
+    "on parent_msg.chat_id = message.chat_id "
+    "and parent_msg.message_id = message.parent "
+    "where message.chat_id=? and message.message_id=? and message.is_bot_reaction"
+)
+
+MESSAGE_EXPANDED = "select expanded from message where chat_id=? and message_id=?;"
+
+SET_MESSAGE_EXPANDED = "UPDATE message SET expanded=? where chat_id=? and message_id=?;"
+
+SET_RENDER_HASH = "UPDATE message SET render_hash=? where chat_id=? and message_id=?;"
+
+INSERT_MESSAGE = (
+    "INSERT INTO message (chat_id, message_id, author_id, parent, "
+    "is_bot_reaction, is_ranking, is_anon, timestamp) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?);"
+)
+
+INSERT_MESSAGE_IF_MISSING = (
+    "INSERT OR IGNORE INTO message (chat_id, message_id, author_id, parent, "
+    "is_bot_reaction, is_ranking, is_anon, timestamp) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?);"
+)
+
+RESTORE_ARCHIVED_REACTIONS = (
+    "INSERT OR IGNORE INTO reaction (chat_id, parent, author_id, type, timestamp) "
+    "SELECT chat_id, parent, author_id, type, timestamp from reaction_archive "
+    "where chat_id=? and parent=?;"
+)
+
+DELETE_ARCHIVED_REACTIONS = "DELETE from reaction_archive where chat_id=? and parent=?;"
+
+# live and archived reactions, the archived ones are restored on the next toggle
+REACTIONS_OF_MESSAGE = (
+    "SELECT reaction.author_id, ifnull(user.name, ''), "
+    "reaction.type, reaction.timestamp "
+    "from reaction left join user on user.id = reaction.author_id "
+    "where reaction.chat_id=? and reaction.parent=? "
+    "UNION ALL "
+    "SELECT archived.author_id, ifnull(user.name, ''), "
+    "archived.type, archived.timestamp "
+    "from reaction_archive as archived left join user on user.id = archived.author_id "
+    "where archived.chat_id=? and archived.parent=?"
+)
+
+# a toggle inserts the reaction, and deletes it only if nothing was inserted
+INSERT_REACTION = (
+    "INSERT INTO reaction (chat_id, parent, author_id, type, timestamp) "
+    "VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT (chat_id, parent, author_id, type) DO NOTHING;"
+)
+
+# the day of the removed reaction is needed to update its rollup
+DELETE_REACTION = (
+    "DELETE from reaction where chat_id=? and parent=? and author_id=? and type=? "
+    "RETURNING timestamp;"
+)
+
+MESSAGE_AUTHOR = "SELECT author_id from message where chat_id=? and message_id=?;"
+
+# -- rollups --
+
+# adds the deltas to the counters of a user in a day, creating the row
+ADD_TO_ROLLUP = (
+    "INSERT INTO reaction_rollup (chat_id, day, user_id, received, given) "
+    "VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT (chat_id, day, user_id) "
+    "DO UPDATE SET received=received + excluded.received, given=given + excluded.given;"
+)
+
+DELETE_EMPTY_ROLLUP = (
+    "DELETE from reaction_rollup where chat_id=? and day=? and user_id=? "
+    "and received=0 and given=0;"
+)
+
+# a page of users ordered by the count, then by the id, continuing after
+# or before the (count, user id) of an entry of the neighbouring page
+_RANKING_PAGE_TEMPLATE = (
+    "SELECT page.user_id, ifnull(user.name, ''), page.cnt "
+    "from (SELECT user_id, sum({column}) as cnt "
+    "from reaction_rollup "
+    "where chat_id = ? and day >= ? "
+    "group by user_id "
+    "having cnt > 0 {keyset}"
+    "order by {order} "
+    "limit ?) as page "
+    "left join user on user.id = page.user_id "
+    "order by page.cnt desc, page.user_id"
+)
+
+_FIRST_PAGE = {"keyset": "", "order": "cnt desc, user_id"}
+_PAGE_AFTER = {
+    "keyset": "and (cnt < ? or (cnt = ? and user_id > ?)) ",
+    "order": "cnt desc, user_id",
+}
+_PAGE_BEFORE = {
+    "keyset": "and (cnt > ? or (cnt = ? and user_id < ?)) ",
+    "order": "cnt, user_id desc",
+}
+
+RANKING_RECEIVED = _RANKING_PAGE_TEMPLATE.format(column="received", **_FIRST_PAGE)
+RANKING_RECEIVED_AFTER = _RANKING_PAGE_TEMPLATE.format(column="received", **_PAGE_AFTER)
+RANKING_RECEIVED_BEFORE = _RANKING_PAGE_TEMPLATE.format(
+    column="received", **_PAGE_BEFORE
+)
+
+RANKING_GIVEN = _RANKING_PAGE_TEMPLATE.format(column="given", **_FIRST_PAGE)
+RANKING_GIVEN_AFTER = _RANKING_PAGE_TEMPLATE.format(column="given", **_PAGE_AFTER)
+RANKING_GIVEN_BEFORE = _RANKING_PAGE_TEMPLATE.format(column="given", **_PAGE_BEFORE)
+
+# the archived reactions count too, a window may be longer than the chat's
+# reaction_archive_days
+_TOP_MESSAGES_TEMPLATE = (
+    "select r.parent, count(*) as c "
+    "from (SELECT parent from reaction where chat_id = ? and timestamp > ? "
+    "UNION ALL "
+    "SELECT parent from reaction_archive where chat_id = ? and timestamp > ?) as r "
+    "inner join message "
+    "on message.chat_id = ? and message.message_id = r.parent "
+    "where not message.deleted "
+    "{author_filter}"
+    "group by r.parent order by c desc, r.parent "
+    "limit ?"
+)
+
+TOP_MESSAGES = _TOP_MESSAGES_TEMPLATE.format(author_filter="")
+
+TOP_MESSAGES_BY_AUTHOR = _TOP_MESSAGES_TEMPLATE.format(
+    author_filter="and message.author_id in (SELECT id from user where name = ?) "
+)
+
+MARK_MESSAGE_DELETED = (
+    "UPDATE message SET deleted=TRUE where chat_id=? and message_id=?;"
+)
+
+# -- users --
+
+# a name seen before the stored one doesn't replace it
+UPSERT_USER = (
+    "INSERT INTO user (id, name, last_seen) VALUES (?, ?, ?) "
+    "ON CONFLICT (id) DO UPDATE SET name=excluded.name, last_seen=excluded.last_seen "
+    "WHERE excluded.last_seen >= user.last_seen;"
+)
+
+# -- retention --
+
+# distinct chat ids, jumping through the index instead of scanning it
+CHAT_IDS = (
+    "WITH RECURSIVE chats(chat_id) AS ("
+    "SELECT min(chat_id) from message "
+    "UNION ALL "
+    "SELECT (SELECT min(chat_id) from message where chat_id > chats.chat_id) "
+    "from chats where chat_id IS NOT NULL"
+    ") "
+    "SELECT chat_id from chats where chat_id IS NOT NULL"
+)
+
+PRUNE_UNREACTED_MESSAGES = (
+    "DELETE from message where chat_id=? and message_id in ("
+    "SELECT message_id from message "
+    "where chat_id=? and timestamp < ? and not is_bot_reaction "
+    "and not exists (SELECT 1 from reaction "
+    "where reaction.chat_id=message.chat_id and reaction.parent=message.message_id) "
+    "and not exists (SELECT 1 from reaction_archive "
+    "where reaction_archive.chat_id=message.chat_id "
+    "and reaction_archive.parent=message.message_id) "
+    "LIMIT ?)"
+)
+
+COLD_REACTED_MESSAGES = (
+    "SELECT message.chat_id, message.message_id "
+    "from message inner join reaction "
+    "on reaction.chat_id=message.chat_id and reaction.parent=message.message_id "
+    "where message.chat_id=? and message.timestamp < ? "
+    "group by message.message_id "
+    "having max(reaction.timestamp) < ? "
+    "LIMIT ?"
+)
+
+ARCHIVE_REACTIONS = (
+    "INSERT OR IGNORE INTO reaction_archive "
+    "(chat_id, parent, author_id, type, timestamp) "
+    "SELECT chat_id, parent, author_id, type, timestamp from reaction "
+    "where chat_id=? and parent=?;"
+)
+
+DELETE_REACTIONS_OF_MESSAGE = "DELETE from reaction where chat_id=? and parent=?;"
+
+# -- deletion queue --
+
+SAVE_PENDING_DELETION = (
+    "INSERT INTO pending_deletion (chat_id, message_id, attempts, next_attempt) "
+    "VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (chat_id, message_id) "
+    "DO UPDATE SET attempts=excluded.attempts, next_attempt=excluded.next_attempt;"
+)
+
+REMOVE_PENDING_DELETION = (
+    "DELETE from pending_deletion where chat_id=? and message_id=?;"
+)
+
+# the whole queue, loaded at startup
+PENDING_DELETIONS = (
+    "SELECT chat_id, message_id, attempts, next_attempt from pending_deletion;"
+)
+
+# -- statistics --
+
+# sizes of the tables and indexes, reads every page of the database
+OBJECT_SIZES = (
+    "SELECT stat.name, object.type, object.tbl_name, stat.pgsize "
+    "from dbstat as stat inner join sqlite_schema as object "
+    "on object.name = stat.name "
+    "where stat.aggregate = TRUE "
+    "order by stat.pgsize desc"
+)
@@ -0,0 +1,86 @@
+"""Fail if any query in ``src.queries`` needs a full table scan.
+
+Usage: python -m src.query_plan_check
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import sys
+
+from src import queries
+from src.migrations import apply_migrations
+
+__all__ = (
+    "ALLOWED_FULL_SCANS",
+    "get_queries",
+    "find_full_scans",
+    "main",
+)
+
+# queries which read a whole table on purpose, a small one or for statistics
+ALLOWED_FULL_SCANS = frozenset({"PENDING_DELETIONS", "OBJECT_SIZES"})
+
+
+def get_queries() -> dict[str, str]:
+    return {
+        name: value
+        for name, value in vars(queries).items()
+        if name.isupper() and not name.startswith("_") and isinstance(value, str)
+    }
+
+
+def _explain(conn: sqlite3.Connection, sql: str) -> list[str]:
+    # parameters only affect the plan through their count
+    params = [None] * sql.count("?")
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def find_full_scans(conn: sqlite3.Connection) -> dict[str, list[str]]:
+    """Map query names to the plan lines which scan a whole table or index.
+
+    Scans of subquery results (co-routines and materialized views) are
+    fine, those are already narrowed down by an index.
+    """
+    full_scans = {}
+    for name, sql in get_queries().items():
+        # the allowed queries are still explained, which checks that they compile
+        plan = _explain(conn, sql)
+        if name in ALLOWED_FULL_SCANS:
+            continue
+        subqueries = {
+            line.split()[1]
+            for line in plan
+            if line.startswith(("CO-ROUTINE ", "MATERIALIZE "))
+        }
+        offending = [
+            line
+            for line in plan
+            if line.startswith("SCAN ")
+            and line.split()[1] not in subqueries
+            and line != "SCAN CONSTANT ROW"
+        ]
+        if offending:
+            full_scans[name] = offending
+
+    return full_scans
+
+
+def main() -> int:
+    conn = sqlite3.connect(":memory:")
+    apply_migrations(conn)
+
+    full_scans = find_full_scans(conn)
+    for name, lines in full_scans.items():
+        print(f"{name}: {'; '.join(lines)}")
+
+    if full_scans:
+        print(f"{len(full_scans)} queries need a full scan.")
+        return 1
+
+    print(f"OK, checked {len(get_queries())} queries.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
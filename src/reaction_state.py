@@ -0,0 +1,292 @@
+from __future__ import annotations
+
+import asyncio
+
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from src.logger import get_default_logger
+from src.result_cache import get_result_cache
+from src.settings import get_settings
+from src.storage import MessageRecord, ReactionCount, ReactionRecord, Store, get_store
+from src.timings import timed
+
+__all__ = (
+    "ReactionState",
+    "ReactionStateCache",
+    "get_reaction_states",
+)
+
+MsgKey = tuple[int, int]  # (chat id, message id)
+
+REACTION_STATES: ReactionStateCache | None = None
+
+
+class ReactionState:
+    """Reactions to a single message, together with the bot message showing them."""
+
+    __slots__ = (
+        "chat_id",
+        "parent_id",
+        "reactions",
+        "bot_message_id",
+        "expanded",
+        "render_hash",
+    )
+
+    chat_id: int
+    parent_id: int
+    # type -> author id -> (author name, timestamp), in the order of reacting
+    reactions: dict[str, dict[int, tuple[str, int]]]
+    bot_message_id: int | None
+    expanded: bool
+    # hash of the text and markup last sent in the bot message
+    render_hash: int | None
+
+    def __init__(
+        self,
+        chat_id: int,
+        parent_id: int,
+        reactions: list[ReactionRecord],
+        bot_message_id: int | None,
+        expanded: bool,
+        render_hash: int | None = None,
+    ) -> None:
+        self.chat_id = chat_id
+        self.parent_id = parent_id
+        self.reactions = {}
+        for r in reactions:
+            self.reactions.setdefault(r.type, {})[r.author_id] = (r.author, r.timestamp)
+        self.bot_message_id = bot_message_id
+        self.expanded = expanded
+        self.render_hash = render_hash
+
+    def toggle(
+        self, author_id: int, author: str, reaction: str, timestamp: int
+    ) -> None:
+        authors = self.reactions.setdefault(reaction, {})
+        if authors.pop(author_id, None) is None:
+            authors[author_id] = (author, timestamp)
+        elif not authors:
+            del self.reactions[reaction]
+
+    def counts(self) -> list[ReactionCount]:
+        """Reactions to the message, the most frequent (then the oldest) first."""
+        counts = [
+            ReactionCount(reaction, len(authors), min(t for _, t in authors.values()))
+            for reaction, authors in self.reactions.items()
+        ]
+        return sorted(counts, key=lambda r: (-r.cnt, r.first_timestamp))
+
+    def authors(self, reaction: str) -> list[str]:
+        return [author for author, _ in self.reactions.get(reaction, {}).values()]
+
+
+class ReactionStateCache:
+    """LRU cache of ``ReactionState``, the source of truth for active messages.
+
+    The handlers read and modify the cached state directly, the changes are
+    persisted in the background, in the order they were made. Evicted
+    entries are loaded back from the store when needed again.
+    """
+
+    store: Store
+    capacity: int
+    _states: OrderedDict[MsgKey, ReactionState]
+    # (chat id, bot reaction message id) -> parent id, for the cached states
+    _bot_messages: dict[MsgKey, int]
+    _loading: dict[MsgKey, asyncio.Future[ReactionState]]
+    # number of not yet persisted changes per message
+    _pending: dict[MsgKey, int]
+    # set once the pending changes of the message are persisted
+    _persisted: dict[MsgKey, asyncio.Event]
+    _queue: asyncio.Queue[tuple[MsgKey, Callable[[], Awaitable[None]]]]
+    _worker: asyncio.Task[None] | None
+
+    def __init__(self, store: Store, capacity: int) -> None:
+        self.store = store
+        self.capacity = capacity
+        self._states = OrderedDict()
+        self._bot_messages = {}
+        self._loading = {}
+        self._pending = {}
+        self._persisted = {}
+        self._queue = asyncio.Queue()
+        self._worker = None
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    async def get(self, chat_id: int, parent_id: int) -> ReactionState:
+        key = (chat_id, parent_id)
+        state = self._states.get(key)
+        if state is not None:
+            self._states.move_to_end(key)
+            return state
+
+        if key not in self._loading:
+            self._loading[key] = asyncio.ensure_future(self._load(key))
+        try:
+            state = await asyncio.shield(self._loading[key])
+        finally:
+            self._loading.pop(key, None)
+
+        self._states[key] = state
+        self._states.move_to_end(key)
+        if state.bot_message_id is not None:
+            self._bot_messages[(chat_id, state.bot_message_id)] = parent_id
+        while len(self._states) > self.capacity:
+            self._evict(next(iter(self._states)))
+
+        return state
+
+    def _evict(self, key: MsgKey) -> None:
+        state = self._states.pop(key, None)
+        if state is not None and state.bot_message_id is not None:
+            self._bot_messages.pop((state.chat_id, state.bot_message_id), None)
+
+    async def get_relayed_parent(self, chat_id: int, message_id: int) -> int | None:
+        """If ``message_id`` is a bot reaction message, the message it reacts to."""
+        parent_id = self._bot_messages.get((chat_id, message_id))
+        if parent_id is not None:
+            return parent_id
+        return await self.store.get_relayed_parent(chat_id, message_id)
+
+    async def _load(self, key: MsgKey) -> ReactionState:
+        if self._pending.get(key):
+            # the changes made before the eviction have to be saved first,
+            # the writes of the other messages queued after them don't matter
+            await self._persisted.setdefault(key, asyncio.Event()).wait()
+
+        chat_id, parent_id = key
+        with timed("load_reaction_state"):
+            reactions, bot_msg = await asyncio.gather(
+                self.store.get_reactions(chat_id, parent_id),
+                self.store.get_bot_reaction_message(chat_id, parent_id),
+            )
+        if bot_msg is None:
+            return ReactionState(chat_id, parent_id, reactions, None, False)
+        return ReactionState(
+            chat_id,
+            parent_id,
+            reactions,
+            bot_msg.message_id,
+            bot_msg.expanded,
+            bot_msg.render_hash,
+        )
+
+    def persist(
+        self, state: ReactionState, write: Callable[[], Awaitable[None]]
+    ) -> None:
+        """Schedule ``write`` after all the previously scheduled writes."""
+        key = (state.chat_id, state.parent_id)
+        self._pending[key] = self._pending.get(key, 0) + 1
+        self._queue.put_nowait((key, write))
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._persist_changes())
+
+    def set_bot_message(
+        self,
+        state: ReactionState,
+        msg: MessageRecord | None,
+        render_hash: int | None = None,
+    ) -> None:
+        """Record a newly sent bot reaction message, or the removal of the old one."""
+        chat_id, parent_id = state.chat_id, state.parent_id
+        if state.bot_message_id is not None:
+            self._bot_messages.pop((chat_id, state.bot_message_id), None)
+
+        state.expanded = False
+        state.render_hash = None
+        if msg is None:
+            state.bot_message_id = None
+            self.persist(
+                state,
+                lambda: self.store.delete_bot_reaction_message(chat_id, parent_id),
+            )
+        else:
+            bot_msg: MessageRecord = msg
+            state.bot_message_id = bot_msg.message_id
+            self._bot_messages[(chat_id, bot_msg.message_id)] = parent_id
+            self.persist(state, lambda: self.store.save_message(bot_msg))
+            if render_hash is not None:
+                self.set_render_hash(state, render_hash)
+
+    def set_expanded(self, state: ReactionState, expanded: bool) -> None:
+        assert state.bot_message_id is not None
+        chat_id, bot_message_id = state.chat_id, state.bot_message_id
+        state.expanded = expanded
+        self.persist(
+            state, lambda: self.store.set_expanded(chat_id, bot_message_id, expanded)
+        )
+
+    def set_render_hash(self, state: ReactionState, render_hash: int) -> None:
+        assert state.bot_message_id is not None
+        chat_id, bot_message_id = state.chat_id, state.bot_message_id
+        state.render_hash = render_hash
+        self.persist(
+            state,
+            lambda: self.store.set_render_hash(chat_id, bot_message_id, render_hash),
+        )
+
+    async def toggle(
+        self,
+        chat_id: int,
+        parent_id: int,
+        author_id: int,
+        author: str,
+        reactions: list[str],
+        timestamp: int,
+    ) -> ReactionState:
+        state = await self.get(chat_id, parent_id)
+        for reaction in reactions:
+            state.toggle(author_id, author, reaction, timestamp)
+
+        types = list(reactions)
+
+        async def write() -> None:
+            await self.store.toggle_reactions(
+                chat_id, parent_id, author_id, author, types, timestamp
+            )
+            # the cached results computed before the commit are stale now
+            get_result_cache().invalidate(chat_id)
+
+        self.persist(state, write)
+        return state
+
+    async def _persist_changes(self) -> None:
+        while True:
+            key, write = await self._queue.get()
+            try:
+                await write()
+            except Exception as e:
+                get_default_logger().error("Failed to persist %s: %s", key, e)
+                # the cached state might have diverged from the database
+                self._evict(key)
+            finally:
+                self._pending[key] -= 1
+                if not self._pending[key]:
+                    del self._pending[key]
+                    persisted = self._persisted.pop(key, None)
+                    if persisted is not None:
+                        persisted.set()
+                self._queue.task_done()
+
+    async def close(self) -> None:
+        await self._queue.join()
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+
+def get_reaction_states() -> ReactionStateCache:
+    global REACTION_STATES
+    if REACTION_STATES is None:
+        REACTION_STATES = ReactionStateCache(
+            get_store(), get_settings().reaction_state_cache_size
+        )
+    return REACTION_STATES
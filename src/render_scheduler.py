@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import asyncio
+
+from typing import Awaitable, Callable
+
+from src.logger import get_default_logger
+from src.settings import get_settings
+
+__all__ = (
+    "RenderScheduler",
+    "get_render_scheduler",
+)
+
+MsgKey = tuple[int, int]  # (chat id, message id)
+Render = Callable[[], Awaitable[None]]
+
+RENDER_SCHEDULER: RenderScheduler | None = None
+
+
+class RenderScheduler:
+    """Coalesces the updates of bot reaction messages.
+
+    A message marked dirty is rendered once, ``delay`` seconds later, so a burst
+    of reactions results in a single edit showing the final state. Changes made
+    while a render is in flight schedule another one, one window later.
+    """
+
+    delay: float
+    _dirty: dict[MsgKey, Render]
+    _tasks: dict[MsgKey, asyncio.Task[None]]
+    _closing: asyncio.Event
+
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+        self._dirty = {}
+        self._tasks = {}
+        self._closing = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._dirty)
+
+    def schedule(self, key: MsgKey, render: Render) -> None:
+        """Render the message ``key`` at the end of the current window."""
+        self._dirty[key] = render
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._render_when_due(key))
+
+    async def _wait(self) -> None:
+        if self.delay <= 0 or self._closing.is_set():
+            return
+        try:
+            await asyncio.wait_for(self._closing.wait(), self.delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _render_when_due(self, key: MsgKey) -> None:
+        try:
+            while key in self._dirty:
+                await self._wait()
+                render = self._dirty.pop(key)
+                try:
+                    await render()
+                except Exception as e:
+                    get_default_logger().error("Failed to render %s: %s", key, e)
+        finally:
+            del self._tasks[key]
+
+    async def close(self) -> None:
+        """Render all the dirty messages without waiting for their windows."""
+        self._closing.set()
+        while self._tasks:
+            await asyncio.gather(*self._tasks.values())
+
+
+def get_render_scheduler() -> RenderScheduler:
+    global RENDER_SCHEDULER
+    if RENDER_SCHEDULER is None:
+        RENDER_SCHEDULER = RenderScheduler(get_settings().reaction_edit_delay)
+    return RENDER_SCHEDULER
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import time
+
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, TypeVar
+
+from src.metrics import Counter
+from src.settings import get_settings
+
+__all__ = (
+    "ResultCache",
+    "get_result_cache",
+    "RESULT_CACHE_REQUESTS",
+)
+
+T = TypeVar("T")
+# (chat id, command, normalized arguments)
+CacheKey = tuple[int, str, Hashable]
+
+RESULT_CACHE: ResultCache | None = None
+
+RESULT_CACHE_REQUESTS = Counter(
+    "bot_result_cache_requests_total",
+    "Lookups in the command result cache.",
+    ("command", "result"),
+)
+
+
+class ResultCache:
+    """Query results of the commands, reused until the chat gets a new reaction.
+
+    Every reaction write bumps the generation of its chat, a result is valid
+    only while the generation it was computed at is the current one. The
+    time spans of the commands end at the current time, so the results also
+    expire after ``ttl`` seconds.
+    """
+
+    ttl: float
+    max_size: int
+    _generations: dict[int, int]
+    # key -> (generation, expiry, result), the least recently used first
+    _entries: OrderedDict[CacheKey, tuple[int, float, Any]]
+
+    def __init__(self, ttl: float, max_size: int) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self._generations = {}
+        self._entries = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def invalidate(self, chat_id: int) -> None:
+        self._generations[chat_id] = self._generations.get(chat_id, 0) + 1
+
+    async def get_or_compute(
+        self,
+        chat_id: int,
+        command: str,
+        args: Hashable,
+        compute: Callable[[], Awaitable[T]],
+    ) -> T:
+        key = (chat_id, command, args)
+        generation = self._generations.get(chat_id, 0)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] == generation and entry[1] > time.monotonic():
+                RESULT_CACHE_REQUESTS.inc(command, "hit")
+                self._entries.move_to_end(key)
+                return entry[2]  # type: ignore[no-any-return]
+            del self._entries[key]
+
+        RESULT_CACHE_REQUESTS.inc(command, "miss")
+        result = await compute()
+        if self.ttl > 0:
+            # a write during the computation makes the result stale right away
+            self._entries[key] = (generation, time.monotonic() + self.ttl, result)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return result
+
+
+def get_result_cache() -> ResultCache:
+    global RESULT_CACHE
+    if RESULT_CACHE is None:
+        settings = get_settings()
+        RESULT_CACHE = ResultCache(
+            settings.result_cache_ttl, settings.result_cache_size
+        )
+    return RESULT_CACHE
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+import time
+
+from typing import NamedTuple
+
+from telegram.ext import CallbackContext
+
+from src import constants, db, queries
+from src.logger import get_default_logger
+from src.settings import get_settings
+
+__all__ = (
+    "RetentionStats",
+    "prune_messages",
+    "archive_reactions",
+    "run_retention",
+    "retention_job",
+)
+
+
+class RetentionStats(NamedTuple):
+    pruned_messages: int
+    archived_messages: int
+
+
+async def prune_messages(chat_id: int, older_than: int, batch_size: int) -> int:
+    """Remove messages without reactions saved before ``older_than``.
+
+    Every batch is a separate short transaction, so the writer is never held
+    for long and the handlers' writes get in between the batches.
+    """
+    pruned = 0
+    while True:
+        removed = await db.run_in_transaction(
+            lambda conn: conn.execute(
+                queries.PRUNE_UNREACTED_MESSAGES,
+                (chat_id, chat_id, older_than, batch_size),
+            ).rowcount
+        )
+        pruned += removed
+        if removed < batch_size:
+            return pruned
+        await asyncio.sleep(0)
+
+
+async def archive_reactions(chat_id: int, older_than: int, batch_size: int) -> int:
+    """Move the reactions of messages with no reaction since ``older_than``
+    to the archive table.
+
+    The archived reactions are moved back as soon as the message gets
+    a new reaction. The messages are selected in the transaction moving
+    their reactions, so a reaction added in between can't be archived.
+    """
+
+    def move(conn: sqlite3.Connection) -> int:
+        parents = conn.execute(
+            queries.COLD_REACTED_MESSAGES,
+            (chat_id, older_than, older_than, batch_size),
+        ).fetchall()
+        conn.executemany(queries.ARCHIVE_REACTIONS, parents)
+        conn.executemany(queries.DELETE_REACTIONS_OF_MESSAGE, parents)
+        return len(parents)
+
+    archived = 0
+    while True:
+        moved = await db.run_in_transaction(move)
+        archived += moved
+        if moved < batch_size:
+            return archived
+        await asyncio.sleep(0)
+
+
+async def run_retention() -> RetentionStats:
+    settings = get_settings()
+    now = time.time_ns()
+
+    pruned = archived = 0
+    for (chat_id,) in await db.fetch_all(queries.CHAT_IDS):
+        policy = settings.get_retention_policy(chat_id)
+        if policy.reaction_archive_days is not None:
+            # the archived reactions still count, no cached result gets stale
+            archived += await archive_reactions(
+                chat_id,
+                now - policy.reaction_archive_days * constants.NS_IN_ONE_DAY,
+                settings.retention_batch_size,
+            )
+        if policy.message_days is not None:
+            pruned += await prune_messages(
+                chat_id,
+                now - policy.message_days * constants.NS_IN_ONE_DAY,
+                settings.retention_batch_size,
+            )
+
+    return RetentionStats(pruned, archived)
+
+
+async def retention_job(context: CallbackContext) -> None:
+    stats = await run_retention()
+    get_default_logger().info(
+        "Retention: pruned %d messages, archived reactions of %d messages",
+        stats.pruned_messages,
+        stats.archived_messages,
+    )
@@ -0,0 +1,22 @@
+-- parent_idx is a prefix of reaction_parent_author_type_idx
+DROP INDEX IF EXISTS parent_idx;
+
+-- bot reaction message lookup by the message it reacts to
+CREATE INDEX IF NOT EXISTS message_bot_reaction_idx
+    ON message (parent, original_id, expanded) WHERE is_bot_reaction;
+-- display name lookup by user
+CREATE INDEX IF NOT EXISTS message_author_idx ON message (author_id, author);
+-- per chat statistics (/ranking, /top [@author])
+CREATE INDEX IF NOT EXISTS message_chat_idx ON message (chat_id, author, author_id);
+
+-- toggling a single reaction
+CREATE INDEX IF NOT EXISTS reaction_parent_author_type_idx
+    ON reaction (parent, author_id, type);
+-- reaction counts, first reaction time and authors of a message
+CREATE INDEX IF NOT EXISTS reaction_parent_type_idx
+    ON reaction (parent, type, timestamp, author);
+-- reactions of a message within a time window
+CREATE INDEX IF NOT EXISTS reaction_parent_timestamp_idx
+    ON reaction (parent, timestamp, author_id);
+-- display name lookup by user
+CREATE INDEX IF NOT EXISTS reaction_author_idx ON reaction (author_id, author);
@@ -0,0 +1,23 @@
+-- when the bot saw the message, used by the retention job
+ALTER TABLE message ADD COLUMN timestamp INT;
+
+UPDATE message
+SET timestamp = coalesce(
+        (SELECT min(timestamp) FROM reaction WHERE reaction.parent = message.id),
+        CAST(strftime('%s', 'now') AS INT) * 1000000000
+    );
+
+CREATE INDEX IF NOT EXISTS message_chat_timestamp_idx ON message (chat_id, timestamp);
+
+-- reactions of messages which haven't been reacted to for a long time,
+-- moved out of the hot reaction table and its indexes
+CREATE TABLE IF NOT EXISTS reaction_archive
+(
+    parent    INTEGER NOT NULL,
+    author_id INT     NOT NULL,
+    type      TEXT    NOT NULL,
+    author    TEXT    NOT NULL,
+    timestamp INT     NOT NULL,
+
+    PRIMARY KEY (parent, author_id, type)
+) WITHOUT ROWID;
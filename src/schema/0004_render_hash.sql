@@ -0,0 +1,3 @@
+-- hash of the text and markup last sent in a bot reaction message,
+-- used to skip the edits which wouldn't change anything
+ALTER TABLE message ADD COLUMN render_hash INT;
@@ -0,0 +1,10 @@
+-- concurrent toggles could add the same reaction twice, keep the oldest one
+DELETE
+FROM reaction
+WHERE id NOT IN (SELECT min(id) FROM reaction GROUP BY parent, author_id, type);
+
+-- an author reacts with a given type at most once,
+-- the toggle relies on it to insert or delete atomically
+DROP INDEX IF EXISTS reaction_parent_author_type_idx;
+CREATE UNIQUE INDEX IF NOT EXISTS reaction_parent_author_type_idx
+    ON reaction (parent, author_id, type);
@@ -0,0 +1,10 @@
+-- messages the bot failed to delete so far, retried with a backoff
+CREATE TABLE IF NOT EXISTS pending_deletion
+(
+    chat_id      INT NOT NULL,
+    message_id   INT NOT NULL,
+    attempts     INT NOT NULL,
+    next_attempt INT NOT NULL,
+
+    PRIMARY KEY (chat_id, message_id)
+) WITHOUT ROWID;
@@ -0,0 +1,155 @@
+"""Key messages and reactions by (chat_id, message_id) instead of a hash.
+
+The rows are copied to new tables in batches, each committed separately,
+then the new tables replace the old ones in the final transaction. Running
+it again after an interruption copies all the rows again, the ones already
+copied are skipped by INSERT OR IGNORE.
+
+A reply keeps its parent only if the parent message was saved as well, the
+hash can't be reversed otherwise. Reactions of unsaved messages are dropped,
+none of the queries could see them anyway. The bot reaction messages of
+those are not copied but queued for deletion instead; the bot couldn't
+find them anymore and would post a new one next to the stale one.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+
+BATCH_SIZE = 10_000
+
+CREATE_TABLES = """
+CREATE TABLE IF NOT EXISTS message_v2
+(
+    chat_id         INT     NOT NULL,
+    message_id      INT     NOT NULL,
+    author_id       INT     NOT NULL,
+    author          TEXT    NOT NULL,
+    -- id of the replied to message, in the same chat
+    parent          INT,
+    is_bot_reaction BOOLEAN NOT NULL,
+    is_ranking      BOOLEAN NOT NULL,
+    is_anon         BOOLEAN NOT NULL,
+    expanded        BOOLEAN NOT NULL DEFAULT FALSE,
+    timestamp       INT,
+    render_hash     INT,
+
+    PRIMARY KEY (chat_id, message_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS reaction_v2
+(
+    chat_id   INT  NOT NULL,
+    parent    INT  NOT NULL,
+    author_id INT  NOT NULL,
+    type      TEXT NOT NULL,
+    author    TEXT NOT NULL,
+    timestamp INT  NOT NULL,
+
+    PRIMARY KEY (chat_id, parent, author_id, type),
+    FOREIGN KEY (chat_id, parent) REFERENCES message (chat_id, message_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS reaction_archive_v2
+(
+    chat_id   INT  NOT NULL,
+    parent    INT  NOT NULL,
+    author_id INT  NOT NULL,
+    type      TEXT NOT NULL,
+    author    TEXT NOT NULL,
+    timestamp INT  NOT NULL,
+
+    PRIMARY KEY (chat_id, parent, author_id, type)
+) WITHOUT ROWID;
+"""
+
+# copy the rows with the old key in (?, ?]
+COPY_MESSAGES = (
+    "INSERT OR IGNORE INTO message_v2 (chat_id, message_id, author_id, author, "
+    "parent, is_bot_reaction, is_ranking, is_anon, expanded, timestamp, render_hash) "
+    "SELECT m.chat_id, m.original_id, m.author_id, m.author, p.original_id, "
+    "m.is_bot_reaction, m.is_ranking, m.is_anon, m.expanded, m.timestamp, "
+    "m.render_hash "
+    "from message as m left join message as p "
+    "on p.id = m.parent and p.chat_id = m.chat_id "
+    "where m.id > ? and m.id <= ? "
+    "and (p.id is not null or m.parent is null or not m.is_bot_reaction)"
+)
+
+# bot reaction messages of unsaved messages, deleted by the deletion queue
+QUEUE_ORPHANED_BOT_MESSAGES = (
+    "INSERT OR IGNORE INTO pending_deletion "
+    "(chat_id, message_id, attempts, next_attempt) "
+    "SELECT m.chat_id, m.original_id, 0, 0 "
+    "from message as m left join message as p "
+    "on p.id = m.parent and p.chat_id = m.chat_id "
+    "where m.is_bot_reaction and m.parent is not null and p.id is null"
+)
+
+COPY_REACTIONS = (
+    "INSERT OR IGNORE INTO reaction_v2 "
+    "(chat_id, parent, author_id, type, author, timestamp) "
+    "SELECT m.chat_id, m.original_id, r.author_id, r.type, r.author, r.timestamp "
+    "from reaction as r inner join message as m on m.id = r.parent "
+    "where r.id > ? and r.id <= ?"
+)
+
+COPY_ARCHIVED_REACTIONS = (
+    "INSERT OR IGNORE INTO reaction_archive_v2 "
+    "(chat_id, parent, author_id, type, author, timestamp) "
+    "SELECT m.chat_id, m.original_id, r.author_id, r.type, r.author, r.timestamp "
+    "from reaction_archive as r inner join message as m on m.id = r.parent "
+    "where r.parent > ? and r.parent <= ?"
+)
+
+REPLACE_TABLES = [
+    "DROP TABLE reaction_archive",
+    "DROP TABLE reaction",
+    "DROP TABLE message",
+    "ALTER TABLE message_v2 RENAME TO message",
+    "ALTER TABLE reaction_v2 RENAME TO reaction",
+    "ALTER TABLE reaction_archive_v2 RENAME TO reaction_archive",
+    # bot reaction message lookup by the message it reacts to
+    "CREATE INDEX message_bot_reaction_idx ON message (chat_id, parent) "
+    "WHERE is_bot_reaction",
+    # display name lookup by user
+    "CREATE INDEX message_author_idx ON message (author_id, author)",
+    # retention
+    "CREATE INDEX message_chat_timestamp_idx ON message (chat_id, timestamp)",
+    # per chat statistics within a time window (/ranking, /top)
+    "CREATE INDEX reaction_chat_timestamp_idx "
+    "ON reaction (chat_id, timestamp, author_id, parent)",
+    # display name lookup by user
+    "CREATE INDEX reaction_author_idx ON reaction (author_id, author)",
+]
+
+
+def _copy_in_batches(
+    conn: sqlite3.Connection, table: str, key: str, copy_sql: str
+) -> None:
+    last = -1
+    while True:
+        upper = conn.execute(
+            f"SELECT max({key}) from "
+            f"(SELECT {key} from {table} where {key} > ? order by {key} LIMIT ?)",
+            (last, BATCH_SIZE),
+        ).fetchone()[0]
+        if upper is None:
+            return
+
+        conn.execute(copy_sql, (last, upper))
+        conn.commit()
+        last = upper
+
+
+def migrate(conn: sqlite3.Connection) -> None:
+    conn.executescript(CREATE_TABLES)
+    _copy_in_batches(conn, "message", "id", COPY_MESSAGES)
+    _copy_in_batches(conn, "reaction", "id", COPY_REACTIONS)
+    _copy_in_batches(conn, "reaction_archive", "parent", COPY_ARCHIVED_REACTIONS)
+
+    # committed together with the schema version
+    conn.execute("BEGIN")
+    conn.execute(QUEUE_ORPHANED_BOT_MESSAGES)
+    for statement in REPLACE_TABLES:
+        conn.execute(statement)
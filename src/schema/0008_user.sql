@@ -0,0 +1,28 @@
+-- the latest display name of every user, instead of a copy on every row
+CREATE TABLE IF NOT EXISTS user
+(
+    id        INTEGER NOT NULL PRIMARY KEY,
+    name      TEXT    NOT NULL,
+    last_seen INT     NOT NULL
+);
+
+-- /top @name
+CREATE INDEX IF NOT EXISTS user_name_idx ON user (name);
+
+-- the name is taken from the row with the latest timestamp
+INSERT INTO user (id, name, last_seen)
+SELECT author_id, author, max(timestamp)
+FROM (SELECT author_id, author, coalesce(timestamp, 0) AS timestamp FROM message
+      UNION ALL
+      SELECT author_id, author, timestamp FROM reaction
+      UNION ALL
+      SELECT author_id, author, timestamp FROM reaction_archive)
+GROUP BY author_id;
+
+-- the names were only looked up through these
+DROP INDEX message_author_idx;
+DROP INDEX reaction_author_idx;
+
+ALTER TABLE message DROP COLUMN author;
+ALTER TABLE reaction DROP COLUMN author;
+ALTER TABLE reaction_archive DROP COLUMN author;
@@ -0,0 +1,29 @@
+-- reactions received and given per user and UTC day, kept up to date by the
+-- toggles, so /ranking sums at most one row per user and day
+CREATE TABLE IF NOT EXISTS reaction_rollup
+(
+    chat_id  INT NOT NULL,
+    day      INT NOT NULL, -- timestamp / NS_IN_ONE_DAY
+    user_id  INT NOT NULL,
+    received INT NOT NULL,
+    given    INT NOT NULL,
+
+    PRIMARY KEY (chat_id, day, user_id)
+) WITHOUT ROWID;
+
+-- the archived reactions are still counted, archiving only moves them
+INSERT INTO reaction_rollup (chat_id, day, user_id, received, given)
+SELECT chat_id, day, user_id, sum(received), sum(given)
+FROM (SELECT r.chat_id, r.timestamp / 86400000000000 AS day, m.author_id AS user_id,
+             1 AS received, 0 AS given
+      FROM (SELECT chat_id, parent, timestamp FROM reaction
+            UNION ALL
+            SELECT chat_id, parent, timestamp FROM reaction_archive) AS r
+               INNER JOIN message AS m
+                          ON m.chat_id = r.chat_id AND m.message_id = r.parent
+      UNION ALL
+      SELECT chat_id, timestamp / 86400000000000, author_id, 0, 1
+      FROM (SELECT chat_id, author_id, timestamp FROM reaction
+            UNION ALL
+            SELECT chat_id, author_id, timestamp FROM reaction_archive))
+GROUP BY chat_id, day, user_id;
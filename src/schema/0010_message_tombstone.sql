@@ -0,0 +1,3 @@
+-- messages found deleted in telegram, /top leaves them out instead of
+-- trying to reply to them again
+ALTER TABLE message ADD COLUMN deleted BOOLEAN NOT NULL DEFAULT FALSE;
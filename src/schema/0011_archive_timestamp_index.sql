@@ -0,0 +1,3 @@
+-- /top counts the archived reactions within its time window too
+CREATE INDEX IF NOT EXISTS reaction_archive_chat_timestamp_idx
+    ON reaction_archive (chat_id, timestamp, parent);
@@ -2,19 +2,39 @@ from __future__ import annotations
 
 import json
 
+from typing import NamedTuple
+
 from src import constants
 
-SETTINGS: Settings
+SETTINGS: Settings | None = None
+
+STORAGE_BACKENDS = ("sqlite", "memory")
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+TEMP_STORE_MODES = ("DEFAULT", "FILE", "MEMORY")
+LOG_LEVELS = ("CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG")
+LOG_FORMATS = ("text", "json")
 
 __all__ = (
     "get_settings",
     "configure_settings",
     "Settings",
+    "RetentionPolicy",
 )
 
 
+class RetentionPolicy(NamedTuple):
+    # messages without reactions are removed after this many days
+    message_days: int | None
+    # reactions of messages without any recent reaction are archived
+    reaction_archive_days: int | None
+
+
 class Settings:
     log_file: str
+    log_level: str
+    log_levels: dict[str, str]
+    log_format: str
+    log_sampling: dict[str, float]
     token: str
     show_summary_button: bool
     disallowed_reactions: set[str]
@@ -23,6 +43,31 @@ class Settings:
     anon_msg_prefix: str
     display_remove_ranking_button: bool
     silenced_chats: set[int]
+    admin_ids: set[int]
+    storage_backend: str
+    db_synchronous: str
+    db_cache_size: int
+    db_mmap_size: int
+    db_temp_store: str
+    db_read_pool_size: int
+    db_trace: bool
+    db_slow_query_ms: float | None
+    message_buffer_size: int
+    message_buffer_max_delay: float
+    reaction_state_cache_size: int
+    result_cache_ttl: float
+    result_cache_size: int
+    reaction_edit_delay: float
+    concurrent_updates: int
+    deletion_interval: float
+    deletion_retry_delay: float
+    deletion_max_attempts: int
+    retention: RetentionPolicy
+    chat_retention: dict[int, RetentionPolicy]
+    retention_interval: float
+    retention_batch_size: int
+    metrics_host: str
+    metrics_port: int | None
 
     def __init__(self, env_file_name: str) -> None:
         with open(env_file_name) as f:
@@ -33,6 +78,25 @@ class Settings:
             self.token = content["token"]
         except Exception as e:
             raise ValueError("Missing required attributes in config file") from e
+        self.log_level = content.get("log_level", "INFO").upper()
+        # levels of single loggers, e.g. {"httpx": "WARNING"}
+        self.log_levels = {
+            name: level.upper() for name, level in content.get("log_levels", {}).items()
+        }
+        for level in (self.log_level, *self.log_levels.values()):
+            if level not in LOG_LEVELS:
+                raise ValueError(f"log levels must be one of {LOG_LEVELS}")
+        self.log_format = content.get("log_format", "text")
+        if self.log_format not in LOG_FORMATS:
+            raise ValueError(f"log_format must be one of {LOG_FORMATS}")
+        # fraction of the records of an event which are logged,
+        # e.g. {"message_received": 0.01}
+        self.log_sampling = {
+            event: float(rate)
+            for event, rate in content.get("log_sampling", {}).items()
+        }
+        if any(not 0 <= rate <= 1 for rate in self.log_sampling.values()):
+            raise ValueError("log_sampling rates must be between 0 and 1")
         self.show_summary_button = content.get("show_summary_button", True)
         self.disallowed_reactions = set(content.get("disallowed_reactions", []))
         self.custom_text_reaction_allowed = content.get(
@@ -44,18 +108,106 @@ class Settings:
             "display_remove_ranking_button", False
         )
         self.silenced_chats = set(content.get("silenced_chats", []))
+        # users allowed to run the admin commands
+        self.admin_ids = set(content.get("admin_ids", []))
+
+        self.storage_backend = content.get("storage_backend", "sqlite")
+        if self.storage_backend not in STORAGE_BACKENDS:
+            raise ValueError(f"storage_backend must be one of {STORAGE_BACKENDS}")
+        self.db_synchronous = content.get("db_synchronous", "NORMAL").upper()
+        if self.db_synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"db_synchronous must be one of {SYNCHRONOUS_MODES}")
+        self.db_cache_size = int(content.get("db_cache_size", -16000))
+        self.db_mmap_size = int(content.get("db_mmap_size", 64 * 1024 * 1024))
+        self.db_temp_store = content.get("db_temp_store", "MEMORY").upper()
+        if self.db_temp_store not in TEMP_STORE_MODES:
+            raise ValueError(f"db_temp_store must be one of {TEMP_STORE_MODES}")
+        self.db_read_pool_size = int(content.get("db_read_pool_size", 4))
+        if self.db_read_pool_size < 1:
+            raise ValueError("db_read_pool_size must be >= 1")
+        # count and time every statement, reported by /dbstats
+        self.db_trace = content.get("db_trace", False)
+        # statements slower than this are logged with their query plan
+        self.db_slow_query_ms = content.get("db_slow_query_ms")
+        if self.db_slow_query_ms is not None and self.db_slow_query_ms < 0:
+            raise ValueError("db_slow_query_ms must be >= 0")
+
+        self.message_buffer_size = int(content.get("message_buffer_size", 100))
+        self.message_buffer_max_delay = float(
+            content.get("message_buffer_max_delay", 5.0)
+        )
+
+        self.reaction_state_cache_size = int(
+            content.get("reaction_state_cache_size", 10_000)
+        )
+        # seconds a /ranking or /top result is reused for, 0 disables the cache
+        self.result_cache_ttl = float(content.get("result_cache_ttl", 60.0))
+        if self.result_cache_ttl < 0:
+            raise ValueError("result_cache_ttl must be >= 0")
+        self.result_cache_size = int(content.get("result_cache_size", 1000))
+        if self.result_cache_size < 1:
+            raise ValueError("result_cache_size must be >= 1")
+        # seconds between the updates of a single bot reaction message
+        self.reaction_edit_delay = float(content.get("reaction_edit_delay", 1.0))
+        if self.reaction_edit_delay < 0:
+            raise ValueError("reaction_edit_delay must be >= 0")
+        # updates processed at the same time, the handlers take care of the order
+        self.concurrent_updates = int(content.get("concurrent_updates", 256))
+        if self.concurrent_updates < 1:
+            raise ValueError("concurrent_updates must be >= 1")
 
+        # seconds between the runs of the deletion queue
+        self.deletion_interval = float(content.get("deletion_interval", 1.0))
+        # delay before the first retry, doubled with every failed attempt
+        self.deletion_retry_delay = float(content.get("deletion_retry_delay", 1.0))
+        self.deletion_max_attempts = int(content.get("deletion_max_attempts", 8))
+        if self.deletion_max_attempts < 1:
+            raise ValueError("deletion_max_attempts must be >= 1")
 
-def configure_settings(env_file_name: str | None = None) -> None:
+        self.retention = RetentionPolicy(
+            content.get("retention_days"), content.get("reaction_archive_days")
+        )
+        self.chat_retention = {
+            int(chat_id): RetentionPolicy(
+                policy.get("retention_days", self.retention.message_days),
+                policy.get(
+                    "reaction_archive_days", self.retention.reaction_archive_days
+                ),
+            )
+            for chat_id, policy in content.get("chat_retention", {}).items()
+        }
+        self.retention_interval = float(content.get("retention_interval", 3600))
+        self.retention_batch_size = int(content.get("retention_batch_size", 500))
+
+        # the metrics are served only when the port is set
+        self.metrics_host = content.get("metrics_host", "127.0.0.1")
+        self.metrics_port = content.get("metrics_port")
+        if self.metrics_port is not None and not 0 <= self.metrics_port <= 65535:
+            raise ValueError("metrics_port must be between 0 and 65535")
+
+    def get_retention_policy(self, chat_id: int) -> RetentionPolicy:
+        return self.chat_retention.get(chat_id, self.retention)
+
+    @property
+    def retention_enabled(self) -> bool:
+        return any(
+            days is not None
+            for policy in (self.retention, *self.chat_retention.values())
+            for days in policy
+        )
+
+
+def configure_settings(env_file_name: str | None = None) -> Settings:
     env_file_name = env_file_name or constants.CONFIG_FILENAME
 
     global SETTINGS
     SETTINGS = Settings(env_file_name)
+    return SETTINGS
 
 
 def get_settings() -> Settings:
-    global SETTINGS
+    """The configured settings, read from the default config file on first use."""
     if SETTINGS is None:
-        configure_settings()
+        return configure_settings()
 
     return SETTINGS
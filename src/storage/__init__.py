@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+from src.settings import get_settings
+from src.storage.base import (
+    BotReactionMessage,
+    DeletionStore,
+    MessageRecord,
+    MessageStore,
+    PendingDeletion,
+    RankingCursor,
+    RankingEntry,
+    ReactionCount,
+    ReactionRecord,
+    ReactionStore,
+    Store,
+    TopMessage,
+)
+
+__all__ = (
+    "BotReactionMessage",
+    "DeletionStore",
+    "MessageRecord",
+    "MessageStore",
+    "PendingDeletion",
+    "RankingCursor",
+    "RankingEntry",
+    "ReactionCount",
+    "ReactionRecord",
+    "ReactionStore",
+    "Store",
+    "TopMessage",
+    "get_store",
+    "set_store",
+)
+
+STORE: Store | None = None
+
+
+def get_store() -> Store:
+    global STORE
+    if STORE is None:
+        settings = get_settings()
+        if settings.storage_backend == "memory":
+            from src.storage.memory import MemoryStore
+
+            STORE = MemoryStore()
+        else:
+            from src.storage.sqlite import SQLiteStore
+
+            STORE = SQLiteStore(settings.message_buffer_size)
+
+    return STORE
+
+
+def set_store(store: Store | None) -> None:
+    global STORE
+    STORE = store
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from typing import NamedTuple
+
+__all__ = (
+    "MessageRecord",
+    "BotReactionMessage",
+    "ReactionCount",
+    "ReactionRecord",
+    "RankingEntry",
+    "RankingCursor",
+    "TopMessage",
+    "PendingDeletion",
+    "MessageStore",
+    "ReactionStore",
+    "DeletionStore",
+    "Store",
+)
+
+# All the message ids in the interface are the ids assigned by Telegram,
+# unique only within their chat.
+
+
+class MessageRecord(NamedTuple):
+    chat_id: int
+    message_id: int
+    author_id: int
+    author: str
+    parent_id: int | None
+    timestamp: int
+    is_bot_reaction: bool = False
+    is_ranking: bool = False
+    is_anon: bool = False
+
+
+class BotReactionMessage(NamedTuple):
+    message_id: int
+    expanded: bool
+    # hash of the last sent text and markup
+    render_hash: int | None = None
+
+
+class ReactionCount(NamedTuple):
+    type: str
+    cnt: int
+    first_timestamp: int
+
+
+class ReactionRecord(NamedTuple):
+    author_id: int
+    author: str
+    type: str
+    timestamp: int
+
+
+class RankingEntry(NamedTuple):
+    user_id: int
+    name: str
+    cnt: int
+
+
+class RankingCursor(NamedTuple):
+    """Position of an entry in a ranking, ordered by ``cnt`` and then ``user_id``."""
+
+    cnt: int
+    user_id: int
+
+
+class TopMessage(NamedTuple):
+    message_id: int
+    cnt: int
+
+
+class PendingDeletion(NamedTuple):
+    chat_id: int
+    message_id: int
+    # failed attempts so far
+    attempts: int
+    # time.time_ns() of the next attempt
+    next_attempt: int
+
+
+class MessageStore(ABC):
+    @abstractmethod
+    async def save_message(self, msg: MessageRecord) -> None:
+        """Save a message; plain messages may be persisted lazily."""
+
+    @abstractmethod
+    async def get_bot_reaction_message(
+        self, chat_id: int, parent_id: int
+    ) -> BotReactionMessage | None:
+        """The bot message displaying the reactions to ``parent_id``."""
+
+    @abstractmethod
+    async def delete_bot_reaction_message(
+        self, chat_id: int, parent_id: int
+    ) -> None: ...
+
+    @abstractmethod
+    async def get_relayed_parent(self, chat_id: int, message_id: int) -> int | None:
+        """If ``message_id`` is a bot reaction message, the message it reacts to."""
+
+    @abstractmethod
+    async def is_expanded(self, chat_id: int, message_id: int) -> bool | None:
+        """Whether the bot reaction message ``message_id`` shows the summary."""
+
+    @abstractmethod
+    async def set_expanded(
+        self, chat_id: int, message_id: int, expanded: bool
+    ) -> None: ...
+
+    @abstractmethod
+    async def set_render_hash(
+        self, chat_id: int, message_id: int, render_hash: int
+    ) -> None: ...
+
+    @abstractmethod
+    async def top_messages(
+        self, chat_id: int, min_timestamp: int, limit: int, author: str | None = None
+    ) -> list[TopMessage]:
+        """Messages with the most reactions given after ``min_timestamp``.
+
+        Ties are ordered by the message id, the deleted messages are left out.
+        """
+
+    @abstractmethod
+    async def mark_deleted(self, chat_id: int, message_ids: list[int]) -> None:
+        """Remember the messages were deleted in telegram."""
+
+
+class ReactionStore(ABC):
+    @abstractmethod
+    async def toggle_reactions(
+        self,
+        chat_id: int,
+        parent_id: int,
+        author_id: int,
+        author: str,
+        types: list[str],
+        timestamp: int,
+    ) -> None:
+        """Add each of the reactions, or remove it if the author already reacted."""
+
+    @abstractmethod
+    async def get_reactions(self, chat_id: int, parent_id: int) -> list[ReactionRecord]:
+        """All the reactions to a message, the oldest first."""
+
+    @abstractmethod
+    async def ranking_page(
+        self,
+        chat_id: int,
+        min_timestamp: int,
+        given: bool,
+        limit: int,
+        after: RankingCursor | None = None,
+        before: RankingCursor | None = None,
+    ) -> list[RankingEntry]:
+        """Users ordered by the reactions received, or given, after ``min_timestamp``.
+
+        At most ``limit`` users, the first ones following ``after``, or the last
+        ones preceding ``before``. The users with the same count are ordered
+        by their id.
+
+        The reactions are counted in whole UTC days, the whole day of
+        ``min_timestamp`` included.
+        """
+
+
+class DeletionStore(ABC):
+    @abstractmethod
+    async def save_deletions(self, deletions: list[PendingDeletion]) -> None:
+        """Add the deletions, or update the already saved ones."""
+
+    @abstractmethod
+    async def remove_deletions(self, deletions: list[PendingDeletion]) -> None: ...
+
+    @abstractmethod
+    async def load_deletions(self) -> list[PendingDeletion]: ...
+
+
+class Store(MessageStore, ReactionStore, DeletionStore, ABC):
+    async def flush(self) -> None:
+        """Persist the pending writes, if the backend defers any."""
+
+    async def close(self) -> None:
+        await self.flush()
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import bisect
+
+from collections import Counter
+
+from src import constants
+from src.storage.base import (
+    BotReactionMessage,
+    MessageRecord,
+    PendingDeletion,
+    RankingCursor,
+    RankingEntry,
+    ReactionRecord,
+    Store,
+    TopMessage,
+)
+
+__all__ = ("MemoryStore",)
+
+MsgKey = tuple[int, int]  # (chat id, message id)
+
+
+class MemoryStore(Store):
+    """Dict based store without any persistence.
+
+    Meant for tests and load tests, which measure the handlers' own overhead.
+    """
+
+    _messages: dict[MsgKey, MessageRecord]
+    _expanded: dict[MsgKey, bool]
+    _render_hashes: dict[MsgKey, int]
+    _deleted: set[MsgKey]
+    # parent message -> bot reaction message id
+    _bot_reaction_msgs: dict[MsgKey, int]
+    # parent message -> (author id, type) -> (author, timestamp)
+    _reactions: dict[MsgKey, dict[tuple[int, str], tuple[str, int]]]
+    _deletions: dict[MsgKey, PendingDeletion]
+
+    def __init__(self) -> None:
+        self._messages = {}
+        self._expanded = {}
+        self._render_hashes = {}
+        self._deleted = set()
+        self._bot_reaction_msgs = {}
+        self._reactions = {}
+        self._deletions = {}
+
+    async def save_message(self, msg: MessageRecord) -> None:
+        key = (msg.chat_id, msg.message_id)
+        self._messages[key] = msg
+        if msg.is_bot_reaction and msg.parent_id is not None:
+            self._bot_reaction_msgs[(msg.chat_id, msg.parent_id)] = msg.message_id
+
+    async def get_bot_reaction_message(
+        self, chat_id: int, parent_id: int
+    ) -> BotReactionMessage | None:
+        message_id = self._bot_reaction_msgs.get((chat_id, parent_id))
+        if message_id is None:
+            return None
+        return BotReactionMessage(
+            message_id,
+            self._expanded.get((chat_id, message_id), False),
+            self._render_hashes.get((chat_id, message_id)),
+        )
+
+    async def delete_bot_reaction_message(self, chat_id: int, parent_id: int) -> None:
+        message_id = self._bot_reaction_msgs.pop((chat_id, parent_id), None)
+        if message_id is not None:
+            self._messages.pop((chat_id, message_id), None)
+            self._expanded.pop((chat_id, message_id), None)
+            self._render_hashes.pop((chat_id, message_id), None)
+
+    async def get_relayed_parent(self, chat_id: int, message_id: int) -> int | None:
+        msg = self._messages.get((chat_id, message_id))
+        if msg is None or not msg.is_bot_reaction or msg.parent_id is None:
+            return None
+        if (chat_id, msg.parent_id) not in self._messages:
+            return None
+        return msg.parent_id
+
+    async def is_expanded(self, chat_id: int, message_id: int) -> bool | None:
+        if (chat_id, message_id) not in self._messages:
+            return None
+        return self._expanded.get((chat_id, message_id), False)
+
+    async def set_expanded(self, chat_id: int, message_id: int, expanded: bool) -> None:
+        self._expanded[(chat_id, message_id)] = expanded
+
+    async def set_render_hash(
+        self, chat_id: int, message_id: int, render_hash: int
+    ) -> None:
+        self._render_hashes[(chat_id, message_id)] = render_hash
+
+    def _chat_reactions(
+        self, chat_id: int, min_timestamp: int
+    ) -> list[tuple[MessageRecord | None, int, str]]:
+        """(reacted message if saved, reaction author id, reaction author name)"""
+        return [
+            (self._messages.get(key), author_id, author)
+            for key, reactions in self._reactions.items()
+            if key[0] == chat_id
+            for (author_id, _), (author, timestamp) in reactions.items()
+            if timestamp > min_timestamp
+        ]
+
+    async def top_messages(
+        self, chat_id: int, min_timestamp: int, limit: int, author: str | None = None
+    ) -> list[TopMessage]:
+        counts = Counter(
+            msg.message_id
+            for msg, _, _ in self._chat_reactions(chat_id, min_timestamp)
+            if msg is not None
+            and (author is None or msg.author == author)
+            and (chat_id, msg.message_id) not in self._deleted
+        )
+        top = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        return [TopMessage(*item) for item in top[:limit]]
+
+    async def mark_deleted(self, chat_id: int, message_ids: list[int]) -> None:
+        self._deleted.update((chat_id, message_id) for message_id in message_ids)
+
+    async def toggle_reactions(
+        self,
+        chat_id: int,
+        parent_id: int,
+        author_id: int,
+        author: str,
+        types: list[str],
+        timestamp: int,
+    ) -> None:
+        reactions = self._reactions.setdefault((chat_id, parent_id), {})
+        for reaction_type in types:
+            if reactions.pop((author_id, reaction_type), None) is None:
+                reactions[(author_id, reaction_type)] = (author, timestamp)
+
+        if not reactions:
+            del self._reactions[(chat_id, parent_id)]
+
+    async def get_reactions(self, chat_id: int, parent_id: int) -> list[ReactionRecord]:
+        reactions = self._reactions.get((chat_id, parent_id), {})
+        return sorted(
+            (
+                ReactionRecord(author_id, author, reaction_type, timestamp)
+                for (author_id, reaction_type), (author, timestamp) in reactions.items()
+            ),
+            key=lambda r: r.timestamp,
+        )
+
+    async def ranking_page(
+        self,
+        chat_id: int,
+        min_timestamp: int,
+        given: bool,
+        limit: int,
+        after: RankingCursor | None = None,
+        before: RankingCursor | None = None,
+    ) -> list[RankingEntry]:
+        # whole days like the rollups of the sqlite store
+        min_day = min_timestamp // constants.NS_IN_ONE_DAY
+        day_start = min_day * constants.NS_IN_ONE_DAY - 1
+
+        names: dict[int, str] = {}
+        counts: Counter[int] = Counter()
+        for msg, author_id, author in self._chat_reactions(chat_id, day_start):
+            if given:
+                # a reaction to a message the bot never saw counts as given
+                user_id, name = author_id, author
+            elif msg is not None:
+                user_id, name = msg.author_id, msg.author
+            else:
+                continue
+            names.setdefault(user_id, name)
+            counts[user_id] += 1
+
+        entries = sorted(
+            (
+                RankingEntry(user_id, names[user_id], cnt)
+                for user_id, cnt in counts.items()
+            ),
+            key=lambda e: (-e.cnt, e.user_id),
+        )
+        keys = [(-e.cnt, e.user_id) for e in entries]
+        if after is not None:
+            start = bisect.bisect_right(keys, (-after.cnt, after.user_id))
+            return entries[start : start + limit]
+        if before is not None:
+            end = bisect.bisect_left(keys, (-before.cnt, before.user_id))
+            return entries[max(end - limit, 0) : end]
+        return entries[:limit]
+
+    async def save_deletions(self, deletions: list[PendingDeletion]) -> None:
+        for deletion in deletions:
+            self._deletions[(deletion.chat_id, deletion.message_id)] = deletion
+
+    async def remove_deletions(self, deletions: list[PendingDeletion]) -> None:
+        for deletion in deletions:
+            self._deletions.pop((deletion.chat_id, deletion.message_id), None)
+
+    async def load_deletions(self) -> list[PendingDeletion]:
+        return list(self._deletions.values())
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import sqlite3
+
+from src import db, queries
+from src.logger import get_default_logger
+from src.storage.user_directory import UserDirectory, UserRow
+
+__all__ = (
+    "MessageRow",
+    "MessageWriteBuffer",
+)
+
+# (chat_id, message_id, author_id, parent,
+#  is_bot_reaction, is_ranking, is_anon, timestamp) - the INSERT_MESSAGE parameters
+MessageRow = tuple[int, int, int, int | None, bool, bool, bool, int]
+MsgKey = tuple[int, int]  # (chat id, message id)
+
+
+class MessageWriteBuffer:
+    """Write-behind buffer for message rows.
+
+    Most messages never get a reaction, so instead of committing every one of
+    them separately the rows are queued and inserted with a single
+    ``executemany`` once ``max_size`` rows are pending, or when the store is
+    flushed. Rows which are still pending can be taken out with ``pop`` and
+    written as a part of another transaction.
+
+    The user rows of the authors are buffered the same way, only those
+    which ``users`` does not know yet are written.
+    """
+
+    max_size: int
+    users: UserDirectory
+    _pending: dict[MsgKey, MessageRow]
+    _pending_users: dict[int, UserRow]
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.users = UserDirectory()
+        self._pending = {}
+        self._pending_users = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def pop(self, key: MsgKey) -> MessageRow | None:
+        return self._pending.pop(key, None)
+
+    def pop_user(self, user_id: int) -> UserRow | None:
+        return self._pending_users.pop(user_id, None)
+
+    def restore(self, row: MessageRow | None, user: UserRow | None) -> None:
+        """Put back the rows taken out with ``pop`` when their transaction failed.
+
+        Rows buffered again in the meantime are newer and are kept.
+        """
+        if row is not None:
+            self._pending.setdefault((row[0], row[1]), row)
+        if user is not None:
+            self._pending_users.setdefault(user[0], user)
+
+    async def add(self, row: MessageRow, user: UserRow | None) -> None:
+        self._pending[(row[0], row[1])] = row
+        if user is not None:
+            self._pending_users[user[0]] = user
+        if len(self._pending) >= self.max_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self._pending and not self._pending_users:
+            return
+
+        # swap the buffer before yielding to the event loop, rows added
+        # during the flush go to the next batch
+        rows, self._pending = self._pending, {}
+        users, self._pending_users = self._pending_users, {}
+
+        def insert_all(conn: sqlite3.Connection) -> None:
+            conn.executemany(queries.INSERT_MESSAGE_IF_MISSING, rows.values())
+            conn.executemany(queries.UPSERT_USER, users.values())
+
+        try:
+            await db.run_in_transaction(insert_all)
+        except Exception:
+            # keep the rows for the next attempt
+            self._pending = rows | self._pending
+            self._pending_users = users | self._pending_users
+            raise
+
+        self.users.written(users.values())
+
+        get_default_logger().debug("Flushed %d buffered messages", len(rows))
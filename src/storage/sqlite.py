@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import sqlite3
+
+from src import constants, db, queries
+from src.logger import get_default_logger
+from src.storage.base import (
+    BotReactionMessage,
+    MessageRecord,
+    PendingDeletion,
+    RankingCursor,
+    RankingEntry,
+    ReactionRecord,
+    Store,
+    TopMessage,
+)
+from src.storage.message_buffer import MessageRow, MessageWriteBuffer
+
+__all__ = ("SQLiteStore",)
+
+
+def _add_to_rollups(
+    conn: sqlite3.Connection,
+    chat_id: int,
+    timestamp: int,
+    author_id: int,
+    parent_author_id: int | None,
+    delta: int,
+) -> None:
+    """Count a reaction added (``delta`` 1) or removed (-1) in the day rollups."""
+    day = timestamp // constants.NS_IN_ONE_DAY
+    counters = [(author_id, 0, delta)]
+    if parent_author_id is not None:
+        counters.append((parent_author_id, delta, 0))
+
+    for user_id, received, given in counters:
+        conn.execute(queries.ADD_TO_ROLLUP, (chat_id, day, user_id, received, given))
+        if delta < 0:
+            conn.execute(queries.DELETE_EMPTY_ROLLUP, (chat_id, day, user_id))
+
+
+class SQLiteStore(Store):
+    buffer: MessageWriteBuffer
+
+    def __init__(self, buffer_size: int) -> None:
+        self.buffer = MessageWriteBuffer(buffer_size)
+
+    async def flush(self) -> None:
+        await self.buffer.flush()
+
+    async def close(self) -> None:
+        await self.flush()
+        await db.shutdown()
+
+    async def save_message(self, msg: MessageRecord) -> None:
+        row: MessageRow = (
+            msg.chat_id,
+            msg.message_id,
+            msg.author_id,
+            msg.parent_id,
+            msg.is_bot_reaction,
+            msg.is_ranking,
+            msg.is_anon,
+            msg.timestamp,
+        )
+
+        user = self.buffer.users.row_to_write(msg.author_id, msg.author, msg.timestamp)
+
+        if msg.is_bot_reaction:
+            # looked up right away by the following reactions, skip the buffer
+            def insert(conn: sqlite3.Connection) -> None:
+                conn.execute(queries.INSERT_MESSAGE, row)
+                if user is not None:
+                    conn.execute(queries.UPSERT_USER, user)
+
+            await db.run_in_transaction(insert)
+            if user is not None:
+                self.buffer.users.written([user])
+        else:
+            await self.buffer.add(row, user)
+
+    async def get_bot_reaction_message(
+        self, chat_id: int, parent_id: int
+    ) -> BotReactionMessage | None:
+        row = await db.fetch_one(queries.BOT_REACTION_MSG, (chat_id, parent_id))
+        if row is None:
+            return None
+        return BotReactionMessage(row[0], bool(row[1]), row[2])
+
+    async def delete_bot_reaction_message(self, chat_id: int, parent_id: int) -> None:
+        await db.execute(queries.DELETE_BOT_REACTION_MSG, (chat_id, parent_id))
+
+    async def get_relayed_parent(self, chat_id: int, message_id: int) -> int | None:
+        row = await db.fetch_one(queries.RELAYED_PARENT, (chat_id, message_id))
+        return None if row is None else int(row[0])
+
+    async def is_expanded(self, chat_id: int, message_id: int) -> bool | None:
+        row = await db.fetch_one(queries.MESSAGE_EXPANDED, (chat_id, message_id))
+        return None if row is None else bool(row[0])
+
+    async def set_expanded(self, chat_id: int, message_id: int, expanded: bool) -> None:
+        await db.execute(queries.SET_MESSAGE_EXPANDED, (expanded, chat_id, message_id))
+
+    async def set_render_hash(
+        self, chat_id: int, message_id: int, render_hash: int
+    ) -> None:
+        await db.execute(queries.SET_RENDER_HASH, (render_hash, chat_id, message_id))
+
+    async def top_messages(
+        self, chat_id: int, min_timestamp: int, limit: int, author: str | None = None
+    ) -> list[TopMessage]:
+        window = (chat_id, min_timestamp, chat_id, min_timestamp, chat_id)
+        if author is None:
+            rows = await db.fetch_all(queries.TOP_MESSAGES, (*window, limit))
+        else:
+            rows = await db.fetch_all(
+                queries.TOP_MESSAGES_BY_AUTHOR, (*window, author, limit)
+            )
+        return [TopMessage(*row) for row in rows]
+
+    async def mark_deleted(self, chat_id: int, message_ids: list[int]) -> None:
+        keys = [(chat_id, message_id) for message_id in message_ids]
+        await db.run_in_transaction(
+            lambda conn: conn.executemany(queries.MARK_MESSAGE_DELETED, keys)
+        )
+
+    async def toggle_reactions(
+        self,
+        chat_id: int,
+        parent_id: int,
+        author_id: int,
+        author: str,
+        types: list[str],
+        timestamp: int,
+    ) -> None:
+        parent = (chat_id, parent_id)
+        # the reacted message may still wait in the write buffer
+        pending_parent = self.buffer.pop(parent)
+        parent_author = None
+        if pending_parent is not None:
+            parent_author = self.buffer.pop_user(pending_parent[2])
+        users = [parent_author] if parent_author is not None else []
+        reaction_author = self.buffer.users.row_to_write(author_id, author, timestamp)
+        if reaction_author is not None:
+            users.append(reaction_author)
+
+        def toggle_all(conn: sqlite3.Connection) -> None:
+            if pending_parent is not None:
+                conn.execute(queries.INSERT_MESSAGE_IF_MISSING, pending_parent)
+            conn.executemany(queries.UPSERT_USER, users)
+            # reacting to an old message brings its archived reactions back
+            conn.execute(queries.RESTORE_ARCHIVED_REACTIONS, parent)
+            conn.execute(queries.DELETE_ARCHIVED_REACTIONS, parent)
+            # a reaction to a message the bot never saw is only counted as given
+            parent_row = conn.execute(queries.MESSAGE_AUTHOR, parent).fetchone()
+            parent_author_id = None if parent_row is None else parent_row[0]
+
+            for reaction_type in types:
+                added = conn.execute(
+                    queries.INSERT_REACTION,
+                    (*parent, author_id, reaction_type, timestamp),
+                ).rowcount
+                if added:
+                    get_default_logger().info(
+                        "adding", extra={"event": "reaction_added"}
+                    )
+                    _add_to_rollups(
+                        conn, chat_id, timestamp, author_id, parent_author_id, 1
+                    )
+                    continue
+
+                get_default_logger().info(
+                    "deleting", extra={"event": "reaction_removed"}
+                )
+                removed = conn.execute(
+                    queries.DELETE_REACTION, (*parent, author_id, reaction_type)
+                ).fetchone()
+                if removed is not None:
+                    # taken off the day the reaction was counted in
+                    _add_to_rollups(
+                        conn, chat_id, removed[0], author_id, parent_author_id, -1
+                    )
+
+        try:
+            await db.run_in_transaction(toggle_all)
+        except Exception:
+            # written by the next flush instead
+            self.buffer.restore(pending_parent, parent_author)
+            raise
+        self.buffer.users.written(users)
+
+    async def get_reactions(self, chat_id: int, parent_id: int) -> list[ReactionRecord]:
+        rows = await db.fetch_all(
+            queries.REACTIONS_OF_MESSAGE, (chat_id, parent_id, chat_id, parent_id)
+        )
+        return sorted((ReactionRecord(*row) for row in rows), key=lambda r: r.timestamp)
+
+    async def ranking_page(
+        self,
+        chat_id: int,
+        min_timestamp: int,
+        given: bool,
+        limit: int,
+        after: RankingCursor | None = None,
+        before: RankingCursor | None = None,
+    ) -> list[RankingEntry]:
+        # summed from the day rollups, from the day of min_timestamp on
+        min_day = min_timestamp // constants.NS_IN_ONE_DAY
+
+        params: tuple[int, ...]
+        if after is not None:
+            sql = (
+                queries.RANKING_GIVEN_AFTER if given else queries.RANKING_RECEIVED_AFTER
+            )
+            params = (chat_id, min_day, after.cnt, after.cnt, after.user_id, limit)
+        elif before is not None:
+            sql = (
+                queries.RANKING_GIVEN_BEFORE
+                if given
+                else queries.RANKING_RECEIVED_BEFORE
+            )
+            params = (chat_id, min_day, before.cnt, before.cnt, before.user_id, limit)
+        else:
+            sql = queries.RANKING_GIVEN if given else queries.RANKING_RECEIVED
+            params = (chat_id, min_day, limit)
+
+        rows = await db.fetch_all(sql, params)
+        return [RankingEntry(*row) for row in rows]
+
+    async def save_deletions(self, deletions: list[PendingDeletion]) -> None:
+        await db.run_in_transaction(
+            lambda conn: conn.executemany(queries.SAVE_PENDING_DELETION, deletions)
+        )
+
+    async def remove_deletions(self, deletions: list[PendingDeletion]) -> None:
+        keys = [(d.chat_id, d.message_id) for d in deletions]
+        await db.run_in_transaction(
+            lambda conn: conn.executemany(queries.REMOVE_PENDING_DELETION, keys)
+        )
+
+    async def load_deletions(self) -> list[PendingDeletion]:
+        rows = await db.fetch_all(queries.PENDING_DELETIONS)
+        return [PendingDeletion(*row) for row in rows]
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+from typing import Iterable
+
+__all__ = (
+    "UserRow",
+    "UserDirectory",
+)
+
+# (id, name, last_seen) - the UPSERT_USER parameters
+UserRow = tuple[int, str, int]
+
+# last_seen is rewritten only once it is older than this, in ns
+LAST_SEEN_RESOLUTION = 60 * 60 * 10**9
+
+
+class UserDirectory:
+    """The user rows as they were last written.
+
+    Every message and reaction carries its author's name, but the user row
+    is only written when the name changes or ``last_seen`` gets stale.
+    """
+
+    _users: dict[int, tuple[str, int]]
+
+    def __init__(self) -> None:
+        self._users = {}
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def row_to_write(self, user_id: int, name: str, timestamp: int) -> UserRow | None:
+        known = self._users.get(user_id)
+        if (
+            known is not None
+            and known[0] == name
+            and timestamp - known[1] < LAST_SEEN_RESOLUTION
+        ):
+            return None
+        return user_id, name, timestamp
+
+    def written(self, rows: Iterable[UserRow]) -> None:
+        """Remember the rows once their transaction is committed."""
+        for user_id, name, last_seen in rows:
+            known = self._users.get(user_id)
+            # the upsert keeps the latest row, whatever the commit order
+            if known is None or last_seen >= known[1]:
+                self._users[user_id] = (name, last_seen)
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+from contextlib import contextmanager
+from typing import Any, Awaitable, Iterator
+
+from src.logger import get_default_logger
+
+__all__ = (
+    "StepTiming",
+    "timed",
+    "get_step_timings",
+    "gather_steps",
+)
+
+
+class StepTiming:
+    """Count, total and longest of a series of durations, in seconds."""
+
+    __slots__ = ("count", "total", "max")
+
+    count: int
+    total: float
+    max: float
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, duration: float) -> None:
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+STEP_TIMINGS: dict[str, StepTiming] = {}
+
+
+@contextmanager
+def timed(step: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        STEP_TIMINGS.setdefault(step, StepTiming()).add(duration)
+        get_default_logger().debug(
+            "%s took %.1f ms", step, duration * 1000, extra={"event": "step_timing"}
+        )
+
+
+def get_step_timings() -> dict[str, StepTiming]:
+    return STEP_TIMINGS
+
+
+async def gather_steps(*steps: Awaitable[Any]) -> list[Any]:
+    """Run independent steps concurrently.
+
+    Every step runs to completion even if another one fails, then the first
+    error is raised and the other ones are logged.
+    """
+    results = await asyncio.gather(*steps, return_exceptions=True)
+    errors = [r for r in results if isinstance(r, BaseException)]
+    for error in errors[1:]:
+        get_default_logger().error("Concurrent step failed: %r", error)
+    if errors:
+        raise errors[0]
+    return list(results)
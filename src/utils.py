@@ -4,8 +4,8 @@ import re
 
 from typing import Any, TypeVar, cast
 
-import demoji
-
+from src import constants
+from src.emoji_matcher import get_emoji_matcher
 from src.settings import get_settings
 
 T = TypeVar("T")
@@ -33,7 +33,12 @@ def get_name_from_author_obj(data: dict[Any, Any]) -> str:
 
 
 def find_emojis_in_str(s: str) -> list[str]:
-    return demoji.findall_list(s, desc=False)  # type: ignore
+    return get_emoji_matcher().findall(s)
+
+
+def split_emojis(s: str) -> tuple[list[str], str]:
+    """The emojis in ``s`` and the text without them."""
+    return get_emoji_matcher().split(s)
 
 
 def get_reaction_representation(text: str, count: int, with_count: bool = False) -> str:
@@ -60,6 +65,8 @@ def is_disallowed_reaction(r: str) -> bool:
         as_int = try_int(r[1:])
         if as_int is not None and as_int != 1:
             return True
+    if r.startswith(constants.RANKING_PAGE_PREFIX):
+        return True
 
     return r in get_settings().disallowed_reactions
 
@@ -92,7 +99,7 @@ def _escape_markdown_v2(txt: str) -> str:
 
 
 def remove_emojis_from_text(txt: str) -> str:
-    return demoji.replace(txt)  # type: ignore
+    return get_emoji_matcher().replace(txt)
 
 
 def hash_string(s: str) -> int:
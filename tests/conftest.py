@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Iterator
+
+import pytest
+
+from src import (
+    constants,
+    db,
+    deletion_queue,
+    reaction_state,
+    render_scheduler,
+    result_cache,
+    settings,
+    storage,
+)
+
+Runner = Callable[[Awaitable[Any]], Any]
+
+
+@pytest.fixture(autouse=True)
+def bot_config(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[Path]:
+    """Fresh settings, database and singletons for every test."""
+    config = tmp_path / "conf.json"
+    config.write_text(
+        json.dumps(
+            {
+                "token": "0:test",
+                "log_file": str(tmp_path / "bot.log"),
+                "reaction_edit_delay": 0,
+            }
+        )
+    )
+    monkeypatch.setattr(constants, "DB_FILENAME", str(tmp_path / "test.db"))
+    monkeypatch.setattr(settings, "SETTINGS", settings.Settings(str(config)))
+    for module, name in (
+        (storage, "STORE"),
+        (reaction_state, "REACTION_STATES"),
+        (render_scheduler, "RENDER_SCHEDULER"),
+        (deletion_queue, "DELETION_QUEUE"),
+        (result_cache, "RESULT_CACHE"),
+    ):
+        monkeypatch.setattr(module, name, None)
+
+    yield config
+
+    for executor in (db.READ_EXECUTOR, db.WRITE_EXECUTOR):
+        if executor is not None:
+            executor.shutdown()
+    db.READ_EXECUTOR = db.WRITE_EXECUTOR = None
+    db.close_conn()
+
+
+@pytest.fixture
+def run() -> Runner:
+    """Runs a coroutine in a new event loop, the database is closed in it too."""
+
+    def run_until_complete(coro: Awaitable[Any]) -> Any:
+        async def main() -> Any:
+            try:
+                return await coro
+            finally:
+                await db.shutdown()
+
+        return asyncio.run(main())
+
+    return run_until_complete
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import asyncio
+import datetime
+
+from types import SimpleNamespace
+from typing import Any, cast
+
+import pytest
+import telegram.error
+
+from telegram import Chat, Message, Update, User
+from telegram.ext import CallbackContext
+
+from src import db, queries
+from src.handlers.commands import DbStatsCommandHandler, TopCommandHandler
+from src.storage import MessageRecord, get_store
+from tests.conftest import Runner
+
+CHAT = -1001
+NOW = 1_700_000_000 * 10**9
+BOT_USER = User(999, "bot", True, username="bot")
+
+
+def telegram_message(message_id: int, text: str = "") -> Message:
+    return Message(
+        message_id,
+        datetime.datetime.now(),
+        Chat(CHAT, Chat.SUPERGROUP),
+        from_user=BOT_USER,
+        text=text,
+    )
+
+
+class FakeBot:
+    """Replies to all the messages, except the ones deleted in telegram.
+
+    A reply to a message with a lower id takes longer to be posted.
+    """
+
+    def __init__(self, deleted: set[int]) -> None:
+        self.deleted = deleted
+        self.replied_to: list[int] = []
+        self.posted: list[str] = []
+        self.edited: list[str] = []
+        self._next_id = 1000
+
+    async def send_message(self, **kwargs: Any) -> Message:
+        parent = kwargs["reply_to_message_id"]
+        self.replied_to.append(parent)
+        if parent in self.deleted:
+            raise telegram.error.BadRequest("Replied message not found")
+        await asyncio.sleep(0.01 / parent)
+        self.posted.append(kwargs["text"])
+        self._next_id += 1
+        return telegram_message(self._next_id, kwargs["text"])
+
+    async def edit_message_text(self, **kwargs: Any) -> None:
+        self.edited.append(kwargs["text"])
+
+
+def test_top_skips_the_deleted_messages_on_the_next_run(run: Runner) -> None:
+    async def scenario() -> tuple[list[int], list[str], list[int]]:
+        store = get_store()
+        # message 1 gets the most reactions, 3 the fewest
+        for message_id in (1, 2, 3):
+            await store.save_message(
+                MessageRecord(CHAT, message_id, 10, "user10", None, NOW)
+            )
+            for author_id in range(20, 24 - message_id):
+                await store.toggle_reactions(
+                    CHAT, message_id, author_id, f"user{author_id}", ["👍"], NOW
+                )
+
+        bot = FakeBot(deleted={1})
+        context = cast(CallbackContext, SimpleNamespace(bot=bot, args=["3650"]))
+        update = cast(Update, SimpleNamespace(message=telegram_message(50)))
+
+        await TopCommandHandler._handler(update, context)
+        first_run, edited = bot.replied_to, bot.edited
+        bot.replied_to = []
+        await TopCommandHandler._handler(update, context)
+        return first_run, edited, bot.replied_to
+
+    first_run, edited, second_run = run(scenario())
+    assert first_run == [1, 2, 3]
+    # the replies sent before message 1 was found deleted move up a rank
+    assert sorted(edited) == ["1. 2", "2. 1"]
+    assert second_run == [2, 3]
+
+
+def test_top_replies_are_posted_in_rank_order(run: Runner) -> None:
+    async def scenario() -> list[str]:
+        store = get_store()
+        for message_id in (1, 2, 3, 4):
+            await store.save_message(
+                MessageRecord(CHAT, message_id, 10, "user10", None, NOW)
+            )
+            for author_id in range(20, 25 - message_id):
+                await store.toggle_reactions(
+                    CHAT, message_id, author_id, f"user{author_id}", ["👍"], NOW
+                )
+
+        bot = FakeBot(deleted=set())
+        context = cast(CallbackContext, SimpleNamespace(bot=bot, args=["3650"]))
+        update = cast(Update, SimpleNamespace(message=telegram_message(50)))
+        await TopCommandHandler._handler(update, context)
+        return bot.posted
+
+    assert run(scenario()) == ["1. 4", "2. 3", "3. 2", "4. 1"]
+
+
+def test_dbstats_without_the_dbstat_table(
+    run: Runner, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # as reported by sqlite built without SQLITE_ENABLE_DBSTAT_VTAB
+    monkeypatch.setattr(queries, "OBJECT_SIZES", "SELECT * from no_dbstat")
+
+    stats = run(db.database_stats())
+
+    assert stats.objects is None
+    lines = DbStatsCommandHandler.format_storage(stats)
+    assert lines[0] == (
+        "Not available, sqlite is built without SQLITE_ENABLE_DBSTAT_VTAB."
+    )
+    assert "Page cache hit rates: not available from the sqlite3 module" in lines
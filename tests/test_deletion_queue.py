@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+from typing import cast
+
+from telegram import Bot
+
+from src.deletion_queue import DeletionQueue
+from src.storage.sqlite import SQLiteStore
+from tests.conftest import Runner
+
+CHAT = -1001
+
+
+class FakeBot:
+    """Records the saved deletions at every delete_message call."""
+
+    def __init__(self, store: SQLiteStore) -> None:
+        self.store = store
+        self.saved_at_attempt: list[list[int]] = []
+
+    async def delete_message(self, chat_id: int, message_id: int) -> bool:
+        saved = await self.store.load_deletions()
+        self.saved_at_attempt.append(sorted(d.message_id for d in saved))
+        return True
+
+
+def test_deletions_are_saved_before_the_first_attempt(run: Runner) -> None:
+    async def scenario() -> tuple[list[list[int]], list[int], int]:
+        store = SQLiteStore(buffer_size=100)
+        bot = FakeBot(store)
+        queue = DeletionQueue(store, retry_delay=1, max_attempts=3)
+        queue.enqueue(CHAT, 1)
+        queue.enqueue(CHAT, 2)
+
+        await queue.run(cast(Bot, bot))
+
+        # a restarted bot finds nothing left to delete
+        restarted = DeletionQueue(store, retry_delay=1, max_attempts=3)
+        await restarted.load()
+        saved = [d.message_id for d in await store.load_deletions()]
+        return bot.saved_at_attempt, saved, len(restarted)
+
+    saved_at_attempt, saved, restarted = run(scenario())
+    assert saved_at_attempt == [[1, 2], [1, 2]]
+    assert saved == []
+    assert restarted == 0
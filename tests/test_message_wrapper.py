@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import datetime
+
+from typing import Any
+
+import pytest
+
+from telegram import Chat, Message, User
+
+from src.message_wrapper import MessageKind, parse_message
+from src.settings import get_settings
+
+CHAT = -1001
+SILENCED_CHAT = -1002
+PARENT = 7
+SETTINGS: dict[str, Any] = {
+    "silenced_chats": {SILENCED_CHAT},
+    "disallowed_reactions": {"👎"},
+    "custom_text_reaction_allowed": True,
+    "anon_messages_allowed": True,
+}
+NO_CUSTOM = {**SETTINGS, "custom_text_reaction_allowed": False}
+NO_ANON = {**SETTINGS, "anon_messages_allowed": False}
+
+PLAIN = MessageKind.PLAIN
+REACTION = MessageKind.REACTION
+ANON = MessageKind.ANON
+SILENCED = MessageKind.SILENCED
+
+# (settings, chat id, replied to, text) -> (kind, reactions, anon text)
+CASES: list[
+    tuple[
+        dict[str, Any],
+        int,
+        int | None,
+        str,
+        tuple[MessageKind, tuple[str, ...], str | None],
+    ]
+] = [
+    # not a reply, never a reaction
+    (SETTINGS, CHAT, None, "hello", (PLAIN, (), None)),
+    (SETTINGS, CHAT, None, "👍", (PLAIN, (), None)),
+    (SETTINGS, CHAT, PARENT, "hello", (PLAIN, (), None)),
+    # a single emoji, character or textual reaction
+    (SETTINGS, CHAT, PARENT, "👍", (REACTION, ("👍",), None)),
+    (SETTINGS, CHAT, PARENT, " 👍 ", (REACTION, ("👍",), None)),
+    (SETTINGS, CHAT, PARENT, "a", (REACTION, ("a",), None)),
+    (SETTINGS, CHAT, PARENT, "+1", (REACTION, ("+1",), None)),
+    (SETTINGS, CHAT, PARENT, "XD", (REACTION, ("xD",), None)),
+    (SETTINGS, CHAT, PARENT, "<3", (REACTION, ("❤️",), None)),
+    (SETTINGS, CHAT, PARENT, "+2", (PLAIN, (), None)),
+    (SETTINGS, CHAT, PARENT, "👎", (PLAIN, (), None)),
+    # only emojis, up to REACTIONS_IN_SINGLE_MSG_LIMIT of them
+    (SETTINGS, CHAT, PARENT, "👍👍❤️", (REACTION, ("👍", "❤️"), None)),
+    (SETTINGS, CHAT, PARENT, "👍 ❤️", (REACTION, ("👍", "❤️"), None)),
+    (SETTINGS, CHAT, PARENT, "👍❤️😂🔥", (PLAIN, (), None)),
+    (SETTINGS, CHAT, PARENT, "👍👎", (PLAIN, (), None)),
+    (SETTINGS, CHAT, PARENT, "👍 nice", (PLAIN, (), None)),
+    # custom reactions
+    (SETTINGS, CHAT, PARENT, "!react nice one", (REACTION, ("nice one",), None)),
+    (SETTINGS, CHAT, PARENT, "!r 👍", (REACTION, ("👍",), None)),
+    (SETTINGS, CHAT, PARENT, "!r 👎", (PLAIN, (), None)),
+    # its button would show a ranking page
+    (SETTINGS, CHAT, PARENT, "!r __ranking:r:7:0", (PLAIN, (), None)),
+    (SETTINGS, CHAT, None, "!react nice one", (PLAIN, (), None)),
+    (NO_CUSTOM, CHAT, PARENT, "!react nice one", (PLAIN, (), None)),
+    # anonymous messages, replies or not
+    (SETTINGS, CHAT, None, "!anon secret", (ANON, (), "secret")),
+    (SETTINGS, CHAT, PARENT, "!a two\nlines", (ANON, (), "two\nlines")),
+    (SETTINGS, CHAT, None, "!anon ", (PLAIN, (), None)),
+    (NO_ANON, CHAT, None, "!anon secret", (PLAIN, (), None)),
+    # only saved in the silenced chats
+    (SETTINGS, SILENCED_CHAT, PARENT, "👍", (SILENCED, (), None)),
+    (SETTINGS, SILENCED_CHAT, None, "!anon secret", (SILENCED, (), None)),
+]
+
+
+def telegram_message(chat_id: int, parent: int | None, text: str) -> Message:
+    chat = Chat(chat_id, Chat.SUPERGROUP)
+    now = datetime.datetime.now()
+    author = User(10, "Alice", False, username="alice")
+    if parent is None:
+        return Message(50, now, chat, from_user=author, text=text)
+    return Message(
+        50,
+        now,
+        chat,
+        from_user=author,
+        text=text,
+        reply_to_message=Message(parent, now, chat),
+    )
+
+
+@pytest.mark.parametrize("settings, chat_id, parent, text, expected", CASES)
+def test_parse_message(
+    monkeypatch: pytest.MonkeyPatch,
+    settings: dict[str, Any],
+    chat_id: int,
+    parent: int | None,
+    text: str,
+    expected: tuple[MessageKind, tuple[str, ...], str | None],
+) -> None:
+    for name, value in settings.items():
+        monkeypatch.setattr(get_settings(), name, value)
+
+    parsed = parse_message(telegram_message(chat_id, parent, text))
+
+    assert (parsed.kind, parsed.reactions, parsed.anon_text) == expected
+    assert (
+        parsed.msg_id,
+        parsed.chat_id,
+        parsed.parent,
+        parsed.author_id,
+        parsed.author,
+    ) == (50, chat_id, parent, 10, "alice")
@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+from typing import cast
+
+from telegram import Bot
+
+from src.handlers.messages_and_reactions import toggle_expanded_reactions_description
+from src.reaction_state import get_reaction_states
+from tests.conftest import Runner
+
+CHAT = -1001
+
+
+def test_stale_show_reactions_button_is_ignored(run: Runner) -> None:
+    async def scenario() -> bool:
+        # no bot call is expected, any would fail on the bare object
+        bot = cast(Bot, object())
+        await toggle_expanded_reactions_description(
+            bot, "show_reactions", parent_id=1, reaction_post_id=2, chat_id=CHAT
+        )
+        state = await get_reaction_states().get(CHAT, 1)
+        return state.expanded
+
+    assert run(scenario()) is False
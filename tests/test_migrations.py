@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import sqlite3
+
+from pathlib import Path
+
+import pytest
+
+from src import constants, migrations
+
+NOW = 1_700_000_000 * 10**9
+DAY = constants.NS_IN_ONE_DAY
+TODAY = NOW // DAY
+
+# the rows as saved before 0007, keyed by a hash of (chat id, message id)
+# (id, original_id, author_id, author, chat_id, parent, is_bot_reaction,
+#  expanded, timestamp, render_hash)
+V6_MESSAGES = [
+    (101, 1, 10, "alice", -1, None, False, False, NOW, None),
+    (102, 2, 11, "bob", -1, 101, False, False, NOW, None),
+    (103, 3, 10, "alice_new", -1, None, False, False, NOW + DAY, None),
+    (104, 4, 999, "bot", -1, 101, True, True, NOW, 5),
+    # a reply to a message the bot never saw
+    (105, 5, 14, "erin", -1, 9999, False, False, NOW, None),
+    # the same message saved twice
+    (106, 6, 13, "dave", -1, None, False, False, NOW, None),
+    (107, 6, 13, "dave", -1, None, False, False, NOW, None),
+    (201, 1, 12, "carol", -2, None, False, False, NOW, None),
+    # the bot reaction message of the unsaved message
+    (108, 8, 999, "bot", -1, 9999, True, False, NOW, None),
+]
+# (id, parent, author_id, author, type, timestamp)
+V6_REACTIONS = [
+    (1, 101, 11, "bob", "👍", NOW),
+    (2, 101, 12, "carol", "👍", NOW),
+    (3, 101, 11, "bob", "❤️", NOW + DAY),
+    (4, 106, 10, "alice", "👍", NOW),
+    # the same reaction to the other copy of the message
+    (5, 107, 10, "alice", "👍", NOW + 2 * DAY),
+    (6, 107, 12, "carol", "😂", NOW),
+    # a reaction to a message the bot never saw
+    (7, 9999, 11, "bob", "👍", NOW),
+    (8, 201, 10, "alice", "👍", NOW),
+]
+# (parent, author_id, type, author, timestamp)
+V6_ARCHIVED_REACTIONS = [(102, 12, "🔥", "carol", NOW - 30 * DAY)]
+
+
+def migrate_to(conn: sqlite3.Connection, version: int | None = None) -> None:
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        if version is not None:
+            pending = [m for m in migrations.load_migrations() if m.version <= version]
+            monkeypatch.setattr(migrations, "load_migrations", lambda: pending)
+        migrations.apply_migrations(conn)
+
+
+@pytest.fixture
+def v6_conn(tmp_path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(tmp_path / "v6.db")
+    migrate_to(conn, 6)
+    with conn:
+        conn.executemany(
+            "INSERT INTO message (id, original_id, author_id, author, chat_id, "
+            "parent, is_bot_reaction, is_ranking, is_anon, expanded, timestamp, "
+            "render_hash) VALUES (?, ?, ?, ?, ?, ?, ?, FALSE, FALSE, ?, ?, ?)",
+            V6_MESSAGES,
+        )
+        conn.executemany(
+            "INSERT INTO reaction (id, parent, author_id, author, type, timestamp) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            V6_REACTIONS,
+        )
+        conn.executemany(
+            "INSERT INTO reaction_archive (parent, author_id, type, author, timestamp) "
+            "VALUES (?, ?, ?, ?, ?)",
+            V6_ARCHIVED_REACTIONS,
+        )
+    return conn
+
+
+def test_migrates_a_populated_v6_database(v6_conn: sqlite3.Connection) -> None:
+    migrate_to(v6_conn)
+
+    assert v6_conn.execute(
+        "SELECT chat_id, message_id, author_id, parent, is_bot_reaction, expanded, "
+        "render_hash, deleted from message order by chat_id, message_id"
+    ).fetchall() == [
+        (-2, 1, 12, None, 0, 0, None, 0),
+        (-1, 1, 10, None, 0, 0, None, 0),
+        (-1, 2, 11, 1, 0, 0, None, 0),
+        (-1, 3, 10, None, 0, 0, None, 0),
+        (-1, 4, 999, 1, 1, 1, 5, 0),
+        # the unsaved parent can't be resolved
+        (-1, 5, 14, None, 0, 0, None, 0),
+        # the copy saved first is kept
+        (-1, 6, 13, None, 0, 0, None, 0),
+    ]
+    # the reaction message of the unsaved message is deleted instead
+    assert v6_conn.execute("SELECT * from pending_deletion").fetchall() == [
+        (-1, 8, 0, 0)
+    ]
+    # the duplicate keeps the older reaction, the unsaved message loses its one
+    assert v6_conn.execute(
+        "SELECT chat_id, parent, author_id, type, timestamp from reaction "
+        "order by chat_id, parent, author_id, type"
+    ).fetchall() == [
+        (-2, 1, 10, "👍", NOW),
+        (-1, 1, 11, "❤️", NOW + DAY),
+        (-1, 1, 11, "👍", NOW),
+        (-1, 1, 12, "👍", NOW),
+        (-1, 6, 10, "👍", NOW),
+        (-1, 6, 12, "😂", NOW),
+    ]
+    assert v6_conn.execute(
+        "SELECT chat_id, parent, author_id, type, timestamp from reaction_archive"
+    ).fetchall() == [(-1, 2, 12, "🔥", NOW - 30 * DAY)]
+
+    # the latest name of every author
+    assert v6_conn.execute(
+        "SELECT id, name, last_seen from user order by id"
+    ).fetchall() == [
+        (10, "alice_new", NOW + DAY),
+        (11, "bob", NOW + DAY),
+        (12, "carol", NOW),
+        (13, "dave", NOW),
+        (14, "erin", NOW),
+        (999, "bot", NOW),
+    ]
+    # the archived reactions are counted too
+    assert v6_conn.execute(
+        "SELECT chat_id, day - ?, user_id, received, given from reaction_rollup "
+        "order by chat_id, day, user_id",
+        (TODAY,),
+    ).fetchall() == [
+        (-2, 0, 10, 0, 1),
+        (-2, 0, 12, 1, 0),
+        (-1, -30, 11, 1, 0),
+        (-1, -30, 12, 0, 1),
+        (-1, 0, 10, 2, 1),
+        (-1, 0, 11, 0, 1),
+        (-1, 0, 12, 0, 2),
+        (-1, 0, 13, 2, 0),
+        (-1, 1, 10, 1, 0),
+        (-1, 1, 11, 0, 1),
+    ]
+
+
+def test_migrated_database_matches_a_new_one(
+    v6_conn: sqlite3.Connection, tmp_path: Path
+) -> None:
+    migrate_to(v6_conn)
+    new_conn = sqlite3.connect(tmp_path / "new.db")
+    migrate_to(new_conn)
+
+    schema = (
+        "SELECT type, name, tbl_name from sqlite_master "
+        "where name not like 'sqlite_%' order by name"
+    )
+    assert v6_conn.execute(schema).fetchall() == new_conn.execute(schema).fetchall()
+
+
+def test_migrations_are_found_from_any_directory(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    versions = [m.version for m in migrations.load_migrations()]
+    assert versions == list(range(1, len(versions) + 1))
+    assert len(versions) >= 11
@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import time
+
+import pytest
+
+from src import constants
+from src.handlers import commands
+from src.handlers.commands import RankingPage, render_ranking_page
+from src.storage import MessageRecord, RankingCursor, RankingEntry, Store, get_store
+from src.storage.memory import MemoryStore
+from src.storage.sqlite import SQLiteStore
+from tests.conftest import Runner
+
+CHAT = -1001
+NOW = 1_700_000_000 * 10**9
+DAY = constants.NS_IN_ONE_DAY
+SINCE = NOW - 7 * DAY
+
+# message id = id of its author -> ids of the users reacting to it
+# received: 1: 3, 2: 2, 3: 2, 4: 2, 5: 1
+# given: 100: 5, 101: 4, 102: 1 (and 103: 1 to an unsaved message)
+REACTIONS = {
+    1: [100, 101, 102],
+    2: [100, 101],
+    3: [100, 101],
+    4: [100, 101],
+    5: [100],
+}
+
+
+def entry(user_id: int, cnt: int) -> RankingEntry:
+    return RankingEntry(user_id, f"user{user_id}", cnt)
+
+
+async def react(
+    store: Store, message_id: int, user_id: int, timestamp: int = NOW
+) -> None:
+    await store.toggle_reactions(
+        CHAT, message_id, user_id, f"user{user_id}", ["👍"], timestamp
+    )
+
+
+async def populate(store: Store) -> None:
+    for message_id, users in REACTIONS.items():
+        await store.save_message(
+            MessageRecord(CHAT, message_id, message_id, f"user{message_id}", None, NOW)
+        )
+        for user_id in users:
+            await react(store, message_id, user_id)
+    # never saved by the bot
+    await react(store, 99, 103)
+    # on the day before the start of the time span, which is left out
+    await react(store, 1, 104, SINCE - DAY)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request: pytest.FixtureRequest) -> Store:
+    if request.param == "memory":
+        return MemoryStore()
+    return SQLiteStore(buffer_size=100)
+
+
+async def all_pages(
+    store: Store, given: bool, limit: int
+) -> tuple[list[list[RankingEntry]], list[list[RankingEntry]]]:
+    """The pages following each other forwards, then backwards from the last."""
+    forward = [await store.ranking_page(CHAT, SINCE, given, limit)]
+    while True:
+        last = forward[-1][-1]
+        page = await store.ranking_page(
+            CHAT, SINCE, given, limit, after=RankingCursor(last.cnt, last.user_id)
+        )
+        if not page:
+            break
+        forward.append(page)
+
+    backward = [forward[-1]]
+    while True:
+        first = backward[-1][0]
+        page = await store.ranking_page(
+            CHAT, SINCE, given, limit, before=RankingCursor(first.cnt, first.user_id)
+        )
+        if not page:
+            break
+        backward.append(page)
+    return forward, backward
+
+
+def test_pages_across_tied_counts(run: Runner, store: Store) -> None:
+    async def scenario() -> tuple[list[list[RankingEntry]], list[list[RankingEntry]]]:
+        await populate(store)
+        return await all_pages(store, given=False, limit=2)
+
+    forward, backward = run(scenario())
+    assert forward == [
+        [entry(1, 3), entry(2, 2)],
+        [entry(3, 2), entry(4, 2)],
+        [entry(5, 1)],
+    ]
+    assert backward == [
+        [entry(5, 1)],
+        [entry(3, 2), entry(4, 2)],
+        [entry(1, 3), entry(2, 2)],
+    ]
+
+
+def test_given_counts_reactions_to_unsaved_messages(run: Runner, store: Store) -> None:
+    async def scenario() -> tuple[list[list[RankingEntry]], list[list[RankingEntry]]]:
+        await populate(store)
+        return await all_pages(store, given=True, limit=3)
+
+    forward, backward = run(scenario())
+    assert forward == [
+        [entry(100, 5), entry(101, 4), entry(102, 1)],
+        [entry(103, 1)],
+    ]
+    assert backward == [
+        [entry(103, 1)],
+        [entry(100, 5), entry(101, 4), entry(102, 1)],
+    ]
+
+
+def test_previous_page_after_the_counts_changed(run: Runner, store: Store) -> None:
+    async def scenario() -> list[RankingEntry]:
+        await populate(store)
+        # user5 catches up with user1 after the second page was shown
+        await react(store, 5, 101)
+        await react(store, 5, 102)
+        return await store.ranking_page(
+            CHAT, SINCE, False, 2, before=RankingCursor(2, 3)
+        )
+
+    assert run(scenario()) == [entry(5, 3), entry(2, 2)]
+
+
+def test_time_span_starts_at_midnight_of_its_first_day(
+    run: Runner, store: Store
+) -> None:
+    midnight = SINCE // DAY * DAY
+
+    async def scenario() -> tuple[list[RankingEntry], list[RankingEntry]]:
+        await store.save_message(MessageRecord(CHAT, 1, 1, "user1", None, NOW))
+        # the first and the last moment of the day of SINCE, then the day before
+        await react(store, 1, 100, midnight)
+        await react(store, 1, 101, midnight + DAY - 1)
+        await react(store, 1, 102, midnight - 1)
+        return (
+            await store.ranking_page(CHAT, SINCE, True, 10),
+            await store.ranking_page(CHAT, midnight, False, 10),
+        )
+
+    given, received = run(scenario())
+    assert given == [entry(100, 1), entry(101, 1)]
+    assert received == [entry(1, 2)]
+
+
+def test_ranking_pages_stay_numbered_from_the_top(
+    run: Runner, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(commands, "RANKING_PAGE_SIZE", 2)
+    now = time.time_ns()
+
+    async def render(page: RankingPage) -> tuple[str, list[RankingPage]]:
+        text, buttons = await render_ranking_page(CHAT, page)
+        pages = [
+            RankingPage.from_callback_data(str(button.callback_data))
+            for row in buttons
+            for button in row
+        ]
+        return text.split("\n", 1)[1], pages
+
+    async def scenario() -> list[tuple[str, list[RankingPage]]]:
+        store = get_store()
+        for message_id, users in REACTIONS.items():
+            await store.save_message(
+                MessageRecord(
+                    CHAT, message_id, message_id, f"user{message_id}", None, now
+                )
+            )
+            for user_id in users:
+                await react(store, message_id, user_id, now)
+
+        rendered = [await render(RankingPage(False, 7, 0))]
+        rendered.append(await render(rendered[-1][1][0]))
+        rendered.append(await render(rendered[-1][1][1]))
+
+        # users 2, 3 and 4 lose their reactions after the pages were shown
+        for message_id in (2, 3, 4):
+            for user_id in (100, 101):
+                await react(store, message_id, user_id, now)
+        commands.get_result_cache().invalidate(CHAT)
+
+        # back from the third page
+        rendered.append(await render(rendered[2][1][0]))
+        # back from the second one
+        rendered.append(await render(rendered[1][1][0]))
+        return rendered
+
+    first, second, third, back_to_second, back_to_first = run(scenario())
+    # the first page shows both lists
+    assert first == (
+        "1. user1: 3\n2. user2: 2\n\n"
+        "Reactions given in the last 7 days\n1. user100: 5\n2. user101: 4\n",
+        [
+            RankingPage(False, 7, 2, after=RankingCursor(2, 2)),
+            RankingPage(True, 7, 2, after=RankingCursor(4, 101)),
+        ],
+    )
+    assert second == (
+        "3. user3: 2\n4. user4: 2\n",
+        [
+            RankingPage(False, 7, 0),
+            RankingPage(False, 7, 4, after=RankingCursor(2, 4)),
+        ],
+    )
+    assert third == (
+        "5. user5: 1\n",
+        [RankingPage(False, 7, 2, before=RankingCursor(1, 5))],
+    )
+    # only user1 precedes user5 now, it is the top of the ranking
+    assert back_to_second[0] == "1. user1: 3\n"
+    assert back_to_first[0].startswith("1. user1: 3\n2. user5: 1\n\n")
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import asyncio
+
+from src.reaction_state import ReactionStateCache
+from src.storage.memory import MemoryStore
+from tests.conftest import Runner
+
+CHAT = -1001
+NOW = 1_700_000_000 * 10**9
+
+
+class GatedStore(MemoryStore):
+    """Holds the reaction writes to ``gated_parent`` until the gate opens.
+
+    The other reaction writes take a while, like on a busy database.
+    """
+
+    def __init__(self, gated_parent: int) -> None:
+        super().__init__()
+        self.gated_parent = gated_parent
+        self.gate = asyncio.Event()
+
+    async def toggle_reactions(
+        self,
+        chat_id: int,
+        parent_id: int,
+        author_id: int,
+        author: str,
+        types: list[str],
+        timestamp: int,
+    ) -> None:
+        if parent_id == self.gated_parent:
+            await self.gate.wait()
+        else:
+            await asyncio.sleep(0.01)
+        await super().toggle_reactions(
+            chat_id, parent_id, author_id, author, types, timestamp
+        )
+
+
+def test_reload_waits_only_for_its_own_writes(run: Runner) -> None:
+    async def scenario() -> tuple[list[str], int]:
+        store = GatedStore(gated_parent=2)
+        states = ReactionStateCache(store, capacity=1)
+        await states.toggle(CHAT, 1, 10, "user10", ["👍"], NOW)
+        # evicts message 1 while its write is in progress, queued behind it
+        # is a write which never ends on its own
+        await states.toggle(CHAT, 2, 10, "user10", ["👎"], NOW)
+
+        state = await asyncio.wait_for(states.get(CHAT, 1), timeout=1)
+        store.gate.set()
+        await states.close()
+        return state.authors("👍"), len(store._reactions[(CHAT, 2)])
+
+    assert run(scenario()) == (["user10"], 1)
@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+from src import constants, db
+from src.retention import archive_reactions
+from src.storage import MessageRecord, TopMessage
+from src.storage.sqlite import SQLiteStore
+from tests.conftest import Runner
+
+CHAT = -1001
+NOW = 1_700_000_000 * 10**9
+DAY = constants.NS_IN_ONE_DAY
+
+
+def test_top_counts_the_archived_reactions(run: Runner) -> None:
+    async def scenario() -> tuple[int, list[TopMessage]]:
+        store = SQLiteStore(buffer_size=100)
+        for message_id in (1, 2):
+            await store.save_message(
+                MessageRecord(CHAT, message_id, 10, "user10", None, NOW - 40 * DAY)
+            )
+        await store.toggle_reactions(CHAT, 1, 20, "user20", ["👍"], NOW - 30 * DAY)
+        await store.toggle_reactions(CHAT, 1, 21, "user21", ["👍"], NOW - 30 * DAY)
+        await store.toggle_reactions(CHAT, 2, 20, "user20", ["👍"], NOW - DAY)
+
+        archived = await archive_reactions(CHAT, NOW - 7 * DAY, batch_size=1)
+        assert await db.fetch_all(
+            "SELECT parent from reaction_archive group by parent"
+        ) == [(1,)]
+        return archived, await store.top_messages(CHAT, NOW - 90 * DAY, 10)
+
+    archived, top = run(scenario())
+    assert archived == 1
+    assert top == [TopMessage(1, 2), TopMessage(2, 1)]
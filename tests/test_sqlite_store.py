@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import sqlite3
+
+import pytest
+
+from src import constants, db
+from src.retention import archive_reactions
+from src.storage import MessageRecord
+from src.storage.sqlite import SQLiteStore
+from tests.conftest import Runner
+
+CHAT = -1001
+NOW = 1_700_000_000 * 10**9
+DAY = constants.NS_IN_ONE_DAY
+
+
+def message(message_id: int, author_id: int, author: str = "") -> MessageRecord:
+    return MessageRecord(
+        CHAT, message_id, author_id, author or f"user{author_id}", None, NOW
+    )
+
+
+def test_failed_toggle_keeps_the_buffered_parent(
+    run: Runner, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    async def scenario() -> list[tuple[int, ...]]:
+        store = SQLiteStore(buffer_size=100)
+        await store.save_message(message(1, 10))
+        run_in_transaction = db.run_in_transaction
+
+        async def busy(fn: object) -> None:
+            raise sqlite3.OperationalError("database is locked")
+
+        monkeypatch.setattr(db, "run_in_transaction", busy)
+        with pytest.raises(sqlite3.OperationalError):
+            await store.toggle_reactions(CHAT, 1, 20, "user20", ["👍"], NOW)
+        monkeypatch.setattr(db, "run_in_transaction", run_in_transaction)
+
+        # put back into the buffer
+        assert len(store.buffer) == 1
+        await store.flush()
+        return await db.fetch_all(
+            "SELECT message.message_id, user.name from message "
+            "inner join user on user.id = message.author_id"
+        )
+
+    assert run(scenario()) == [(1, "user10")]
+
+
+async def rollups() -> list[tuple[int, ...]]:
+    return await db.fetch_all(
+        "SELECT day - ?, user_id, received, given from reaction_rollup "
+        "order by day, user_id",
+        (NOW // constants.NS_IN_ONE_DAY,),
+    )
+
+
+def test_toggle_adds_and_removes_from_the_rollups(run: Runner) -> None:
+    async def scenario() -> list[list[tuple[int, ...]]]:
+        store = SQLiteStore(buffer_size=100)
+        await store.save_message(message(1, 10))
+        steps = []
+        await store.toggle_reactions(CHAT, 1, 20, "user20", ["👍", "❤️"], NOW)
+        steps.append(await rollups())
+        # removed the next day, taken off the day it was added in
+        await store.toggle_reactions(CHAT, 1, 20, "user20", ["👍"], NOW + DAY)
+        steps.append(await rollups())
+        await store.toggle_reactions(CHAT, 1, 20, "user20", ["❤️"], NOW + DAY)
+        steps.append(await rollups())
+        # a message the bot never saw only counts as given
+        await store.toggle_reactions(CHAT, 2, 20, "user20", ["👍"], NOW)
+        steps.append(await rollups())
+        return steps
+
+    assert run(scenario()) == [
+        [(0, 10, 2, 0), (0, 20, 0, 2)],
+        [(0, 10, 1, 0), (0, 20, 0, 1)],
+        [],
+        [(0, 20, 0, 1)],
+    ]
+
+
+def test_toggle_restores_the_archived_reactions(run: Runner) -> None:
+    async def scenario() -> tuple[list[tuple[int, ...]], list[tuple[int, ...]]]:
+        store = SQLiteStore(buffer_size=100)
+        await store.save_message(message(1, 10))
+        await store.toggle_reactions(CHAT, 1, 20, "user20", ["👍"], NOW)
+        await store.toggle_reactions(CHAT, 1, 21, "user21", ["👍"], NOW)
+        assert await archive_reactions(CHAT, NOW + DAY, batch_size=10) == 1
+
+        # the archived reaction of 20 is restored, then removed by the toggle
+        await store.toggle_reactions(CHAT, 1, 20, "user20", ["👍"], NOW + 2 * DAY)
+        await store.toggle_reactions(CHAT, 1, 22, "user22", ["👍"], NOW + 2 * DAY)
+        reactions = await db.fetch_all(
+            "SELECT author_id, timestamp - ? from reaction order by author_id", (NOW,)
+        )
+        assert await db.fetch_all("SELECT * from reaction_archive") == []
+        return reactions, await rollups()
+
+    reactions, rollup = run(scenario())
+    assert reactions == [(21, 0), (22, 2 * DAY)]
+    assert rollup == [(0, 10, 1, 0), (0, 21, 0, 1), (2, 10, 1, 0), (2, 22, 0, 1)]